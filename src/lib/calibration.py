@@ -0,0 +1,117 @@
+# calibration.py
+# Adaptive gyro zero-rate calibration with a bias cache in flash, shared by open.py and obstacle.py.
+# MicroPython code.
+# GyroCalibrator keeps the running mean and variance of the yaw rate (Welford's method) and stops as soon as the
+# car is still (standard deviation below still_dps) and the standard error of the mean is below tolerance_dps,
+# usually within a second instead of the fixed 1000 samples over 10 s. A sample far from the running mean means
+# the car was moved, and the estimate starts over. A converged bias is stored in gyro_bias.json together with the
+# die temperature and the RTC time. On a warm restart the cached bias is used when it is recent, was measured
+# within max_temp_delta of the current temperature and agrees with a short still check window.
+
+import json
+import math
+import time
+
+import pyb
+
+CACHE_FILE = "gyro_bias.json"
+
+
+class GyroCalibrator:
+    # Online zero-rate estimate for one gyro axis
+    def __init__(self, imu, axis, cache_path=CACHE_FILE, period_ms=3, min_samples=100, check_samples=50,
+                 still_dps=0.5, tolerance_dps=0.005, jump_dps=3.0, max_age_s=1800, max_temp_delta=3.0,
+                 timeout_ms=10000):
+        self.imu = imu
+        self.axis = axis  # Gyro axis (GX/GY/GZ) aligned with the vehicle yaw
+        self.cache_path = cache_path
+        self.period_ms = period_ms  # Delay between samples; above the gyro ODR period so samples are new
+        self.min_samples = min_samples  # Never converge on fewer samples
+        self.check_samples = check_samples  # Still window that confirms a cached bias
+        self.still_dps = still_dps  # Largest standard deviation of a car at rest
+        self.tolerance_dps = tolerance_dps  # Target standard error of the bias (0.005 dps = 0.9 deg in 3 min)
+        self.jump_dps = jump_dps  # Sample this far from the mean restarts the estimate
+        self.max_age_s = max_age_s  # Oldest usable cache entry
+        self.max_temp_delta = max_temp_delta  # Largest temperature change since the cached bias, degrees C
+        self.timeout_ms = timeout_ms  # Give up converging and use the mean so far
+        self.bias = 0.0  # Result in dps
+        self.std = 0.0  # Standard deviation of the samples behind the result, dps
+        self.source = None  # "converged", "cache" or "timeout"
+        self.temperature = 0.0  # Die temperature at calibration, degrees C
+        self.elapsed_ms = 0  # Time the calibration took
+        self.restarts = 0  # Estimates discarded because the car moved
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared deviations from the mean
+
+    def add(self, rate):
+        # Welford update with one yaw rate sample
+        if self.n >= 10 and abs(rate - self.mean) > self.jump_dps:
+            self.restarts += 1
+            self.reset()
+        self.n += 1
+        d = rate - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (rate - self.mean)
+
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def converged(self):
+        # Still car and a bias estimate within tolerance
+        if self.n < self.min_samples:
+            return False
+        var = self.variance()
+        return var <= self.still_dps * self.still_dps and var / self.n <= self.tolerance_dps * self.tolerance_dps
+
+    def load_cache(self):
+        # Cached bias usable at the current temperature and time, or None
+        try:
+            with open(self.cache_path) as f:
+                entry = json.load(f)
+            age = time.time() - entry["time"]
+            if 0 <= age <= self.max_age_s and abs(entry["temp"] - self.temperature) <= self.max_temp_delta:
+                return entry["bias"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def save_cache(self):
+        try:
+            with open(self.cache_path, "w") as f:
+                json.dump({"bias": self.bias, "std": self.std, "temp": self.temperature, "time": time.time()}, f)
+        except OSError:
+            pass  # Read-only filesystem: the next start calibrates fully
+
+    def run(self):
+        # Calibrate the car at rest; returns the bias in dps
+        start = pyb.millis()
+        self.temperature = self.imu.temperature()
+        cached = self.load_cache()
+        self.reset()
+        imu = self.imu
+        while pyb.elapsed_millis(start) < self.timeout_ms:
+            imu.read()
+            self.add(imu.gyro(self.axis))
+            if cached is not None and self.n >= self.check_samples:
+                # Warm start: a still window whose mean agrees with the cached bias confirms it
+                std = math.sqrt(self.variance())
+                if std <= self.still_dps and abs(self.mean - cached) <= 3 * std / math.sqrt(self.n) + self.tolerance_dps:
+                    return self._finish(start, cached, "cache")
+                cached = None  # Temperature or mounting changed more than the checks caught: full calibration
+            if self.converged():
+                bias = self._finish(start, self.mean, "converged")
+                self.save_cache()
+                return bias
+            pyb.delay(self.period_ms)
+        return self._finish(start, self.mean, "timeout")
+
+    def _finish(self, start, bias, source):
+        self.bias = bias
+        self.std = math.sqrt(self.variance())
+        self.source = source
+        self.elapsed_ms = pyb.elapsed_millis(start)
+        return bias
@@ -0,0 +1,142 @@
+# car.py
+# Sensors and actuators of the car, shared by open.py and obstacle.py.
+# MicroPython code.
+# Both challenge programs used to carry their own copy of the hardware setup and drivers: camera configuration,
+# IMU and heading integrator, front ToF driver, servo and motor PWM, slave link start-up, gyro calibration, start
+# button and status LED. Car sets all of it up once and keeps the last commands and reading that telemetry logs
+# (steer_cmd, speed_cmd, tof_front); only the servo pulse range differs between the programs. The sensor values
+# the control code reads (angle, encoder, side ToF) stay globals of the programs, where host replay loads them.
+# Like the rest of lib/, this module can be precompiled with mpy-cross or frozen into the firmware
+# (tools/build_mpy.py), so it is not parsed from source at boot and its bytecode does not take heap.
+# boot_report() prints the time since reset and the heap use once a program is ready, for before/after
+# comparisons of the deployment.
+
+import gc
+import pyb
+from machine import Pin, UART, SPI, I2C
+import sensor
+from link import SlaveLink
+from imu import IMU, GX
+from heading import HeadingIntegrator
+from calibration import GyroCalibrator
+from vl53l1x import VL53L1X
+from kernel import clamp_int, servo_slope, servo_pulse, motor_duty
+
+# Loop timing profiler stages of both programs, indices into PROFILE_STAGES
+PROFILE_STAGES = ("link", "gyro", "capture", "blobs", "tof", "actuate", "log", "control")
+P_LINK, P_GYRO, P_CAPTURE, P_BLOBS, P_TOF, P_ACTUATE, P_LOG, P_CONTROL = range(8)
+
+YAW_AXIS = GX  # Gyro axis aligned with the vehicle yaw
+TOF_ADDRESS = 0x29  # Default address for VL53L1X front ToF sensor
+
+
+class Car:
+    # Hardware of the car: set up once, driven through the methods below
+    def __init__(self, prof, servo_min, servo_center, servo_max):
+        self.prof = prof  # Profiler receiving the tof and actuate stage timings
+        self.trace = None  # InputTrace receiving the front ToF readings (set by the program)
+        # Camera: RGB565 QVGA, flipped and mirrored for the reverse mounting
+        sensor.reset()
+        sensor.set_pixformat(sensor.RGB565)
+        sensor.set_framesize(sensor.QVGA)
+        sensor.set_vflip(True)
+        sensor.set_hmirror(True)
+        sensor.skip_frames(time=500)  # Skip initial frames to stabilize the sensor
+        # IMU (LSM6DSOX): gyro and accel read together in one SPI burst, 1000 dps = 0.035 dps/LSB
+        self.spi = SPI(5, baudrate=1000000, polarity=1, phase=1)
+        self.imu = IMU(self.spi, Pin("PF6", Pin.OUT_PP, Pin.PULL_UP), gyro_odr=416, gyro_scale=1000,
+                       accel_odr=416, accel_scale=4)
+        self.heading = HeadingIntegrator(self.imu, YAW_AXIS, odr=416)  # Integrates every FIFO gyro sample
+        # Front ToF on I2C bus 2: continuous ranging, 20 ms timing budget every 25 ms (lib/vl53l1x.py)
+        self.i2c = I2C(2)
+        self.tof = VL53L1X(self.i2c, TOF_ADDRESS, mode="long", budget_ms=20, period_ms=25)
+        if not self.tof.start():
+            print("front tof: no answer at 0x%02x, distance reads -1" % TOF_ADDRESS)
+        self.tof_front = 0  # Last front ToF distance in mm, -1 not valid
+        # Steering servo: 50 Hz PWM on pin 2, pulse range of the program's servo
+        self.servo_center = servo_center
+        self.servo_left = servo_slope(servo_center - servo_min)  # Q8 pulse ticks per position left of centre
+        self.servo_right = servo_slope(servo_max - servo_center)  # Q8 pulse ticks per position right of centre
+        self.servo = pyb.Timer(4, freq=50).channel(3, pyb.Timer.PWM, pin=pyb.Pin(2))
+        self.servo.pulse_width(servo_center)
+        self.steer_cmd = 240  # Last commanded steering position
+        # Drive motor: 20 kHz PWM, forward on pin 3 and reverse on pin 6
+        motor_timer = pyb.Timer(1, freq=20000)
+        self.motor_forward = motor_timer.channel(2, pyb.Timer.PWM, pin=Pin(3))
+        self.motor_reverse = motor_timer.channel(3, pyb.Timer.PWM, pin=Pin(6))
+        self.speed_cmd = 0  # Last commanded motor speed
+        self.set_speed(0)
+        # Slave MCU link (left/right ToF, encoder): CRC-checked binary frame pushed every 10 ms
+        self.uart = UART(9, baudrate=115200, bits=8, parity=None, stop=1, rxbuf=512)
+        self.link = SlaveLink(self.uart, period_ms=10)
+        # Start button and RGB status LED
+        self.button = Pin('A0', Pin.IN, Pin.PULL_UP)
+        self.led = [pyb.Pin(p, pyb.Pin.OUT_PP) for p in ("PE3", "PC13", "PF4")]  # R, G, B pins
+
+    def read_distance(self):
+        # Front ToF distance in mm from the newest result, without waiting for a measurement; -1 when the range
+        # status is not valid or the last result is stale
+        t = self.prof.start()
+        d = self.tof_front = self.tof.read()
+        self.prof.stop(P_TOF, t)
+        if self.trace is not None:
+            self.trace.front(d)
+        return d
+
+    def set_steering(self, pos):
+        # Convert position (0-480) to pulse width, clamped to min/max
+        t = self.prof.start()
+        q = clamp_int(int(pos * 256), 0, 480 * 256)  # Position in 1/256 steps for the fixed-point mapping
+        self.steer_cmd = q >> 8
+        self.servo.pulse_width(servo_pulse(q, self.servo_center, self.servo_left, self.servo_right))
+        self.prof.stop(P_ACTUATE, t)
+
+    def set_speed(self, speed):
+        # Set motor speed (-100 to 100), using PWM percent
+        t = self.prof.start()
+        speed = clamp_int(int(speed), -100, 100)
+        self.speed_cmd = speed
+        duty = motor_duty(speed)
+        self.motor_forward.pulse_width_percent(duty >> 8)
+        self.motor_reverse.pulse_width_percent(duty & 0xFF)
+        self.prof.stop(P_ACTUATE, t)
+
+    def wait_slave(self, timeout_ms=10000):
+        # Wait for the slave's ready byte, then switch it to push mode
+        uart = self.uart
+        start = pyb.millis()
+        while pyb.elapsed_millis(start) < timeout_ms:
+            if uart.any() and uart.read(1) == b'\x01': break
+        uart.read(uart.any())  # Clear buffer
+        self.link.start()
+
+    def calibrate(self):
+        # Adaptive zero-rate calibration (lib/calibration.py): stops as soon as the bias estimate of the still car
+        # converges, and a warm restart reuses the cached bias of a recent run at a similar temperature after a
+        # short check; returns the bias in dps
+        calibrator = GyroCalibrator(self.imu, YAW_AXIS)
+        bias = calibrator.run()
+        print("gyro bias: %.4f dps (%s, %d samples, %d ms, %.1f C)" % (bias, calibrator.source, calibrator.n,
+                                                                       calibrator.elapsed_ms, calibrator.temperature))
+        return bias
+
+    def wait_button(self, release=True):
+        # Wait for button press (and release if specified)
+        button = self.button
+        while button.value(): pyb.delay(1)
+        if release:
+            while not button.value(): pyb.delay(1)
+
+    def set_led(self, color):
+        # Set LED color based on string code (e.g., 'R' red, 'G' green, 'M' magenta, 'off')
+        led = self.led
+        led[0].value(0 if color in 'ROMWY' else 1)  # Red on/low for certain colors
+        led[1].value(0 if color in 'GOCWY' and (color != 'O' or pyb.millis() % 1 < 1) else 1)  # Green, 'O' blinks
+        led[2].value(0 if color in 'BCMW' else 1)  # Blue
+
+
+def boot_report(name):
+    # Time since reset and heap use of a program that finished its setup
+    gc.collect()
+    print("boot: %s ready %d ms after reset, heap free=%d used=%d" % (name, pyb.millis(), gc.mem_free(),
+                                                                       gc.mem_alloc()))
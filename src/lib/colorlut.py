@@ -0,0 +1,179 @@
+# colorlut.py
+# RGB565 colour-class lookup table shared by open.py and obstacle.py.
+# MicroPython code (the table builder also runs under CPython in tools/build_lut.py).
+# Every find_blobs call converts the frame to LAB and thresholds it for one colour, so N colours per frame cost N
+# conversions. The LAB thresholds of a script are instead compiled once on the host into a 64K table indexed by
+# the raw RGB565 pixel: entry bit i is set when that pixel lies inside colour i's thresholds. Thresholds may
+# overlap (red and magenta do), so an entry is a class bitmask rather than a single class id. classify() walks
+# a sampled grid of the frame once in a viper kernel, with one table lookup per pixel, and yields per-class
+# pixel counts and centroid sums plus the mask of every class seen. ColorDetector uses that mask to skip the
+# find_blobs calls of colours absent from the frame.
+#
+# Table file layout: b"CLUT", version byte, class count, then per class a length byte, the ASCII key, a tuple
+# count and the threshold tuples as signed bytes, then the 65536 table bytes. The scripts load the table only
+# when the stored thresholds still match their th dictionary.
+
+from array import array
+
+import micropython
+
+MAGIC = b"CLUT"
+VERSION = 1
+MAX_CLASSES = 8
+
+
+def _linear(c):
+    # sRGB channel in 0..1 to linear light in 0..100
+    return (((c + 0.055) / 1.055) ** 2.4 if c > 0.04045 else c / 12.92) * 100.0
+
+
+def _f(t):
+    return t ** (1.0 / 3.0) if t > 0.008856 else 7.787 * t + 16.0 / 116.0
+
+
+def rgb565_to_lab(pixel):
+    # (L, A, B) of a native-order RGB565 value, with the sRGB D65 conversion find_blobs uses
+    r = (((pixel >> 11) & 0x1F) * 255 + 15) // 31  # 5/6-bit channels expanded to 8 bits with rounding
+    g = (((pixel >> 5) & 0x3F) * 255 + 31) // 63
+    b = ((pixel & 0x1F) * 255 + 15) // 31
+    r, g, b = _linear(r / 255.0), _linear(g / 255.0), _linear(b / 255.0)
+    fx = _f((r * 0.4124 + g * 0.3576 + b * 0.1805) / 95.047)
+    fy = _f((r * 0.2126 + g * 0.7152 + b * 0.0722) / 100.0)
+    fz = _f((r * 0.0193 + g * 0.1192 + b * 0.9505) / 108.883)
+    return int(round(116.0 * fy - 16.0)), int(round(500.0 * (fx - fy))), int(round(200.0 * (fy - fz)))
+
+
+def inside(lab, thresholds):
+    # True when lab lies in any (L_min, L_max, A_min, A_max, B_min, B_max) tuple, bounds inclusive
+    l, a, b = lab
+    for t in thresholds:
+        if (min(t[0], t[1]) <= l <= max(t[0], t[1]) and min(t[2], t[3]) <= a <= max(t[2], t[3])
+                and min(t[4], t[5]) <= b <= max(t[4], t[5])):
+            return True
+    return False
+
+
+def build(th, keys=None, byteswap=False):
+    # 64K class-bitmask table for the threshold dictionary th; byteswap for frames stored high byte first
+    keys = tuple(keys or th)
+    if len(keys) > MAX_CLASSES:
+        raise ValueError("at most %d colour classes" % MAX_CLASSES)
+    table = bytearray(65536)
+    for pixel in range(65536):
+        lab = rgb565_to_lab(pixel)
+        mask = 0
+        for bit, key in enumerate(keys):
+            if inside(lab, th[key]):
+                mask |= 1 << bit
+        table[((pixel & 0xFF) << 8) | (pixel >> 8) if byteswap else pixel] = mask
+    return ColorLUT(keys, table, dict((key, [tuple(t) for t in th[key]]) for key in keys))
+
+
+@micropython.viper
+def _scan(frame, table, grid, stats) -> int:
+    # Classify every grid-th pixel of an RGB565 frame; grid = (width, x0, y0, x1, y1, x_step, y_step),
+    # stats gets (count, sum x, sum y) per class bit; returns the bitmask of the classes seen
+    p = ptr16(frame)
+    t = ptr8(table)
+    g = ptr32(grid)
+    s = ptr32(stats)
+    width = g[0]
+    x0 = g[1]
+    x1 = g[3]
+    y1 = g[4]
+    x_step = g[5]
+    y_step = g[6]
+    seen = 0
+    y = g[2]
+    while y < y1:
+        i = y * width + x0
+        x = x0
+        while x < x1:
+            m = t[p[i]]
+            if m:
+                seen |= m
+                k = 0
+                while m:
+                    if m & 1:
+                        s[k] += 1
+                        s[k + 1] += x
+                        s[k + 2] += y
+                    m >>= 1
+                    k += 3
+            i += x_step
+            x += x_step
+        y += y_step
+    return seen
+
+
+class ColorLUT:
+    # Class-bitmask table plus the per-class results of the last classify() pass
+    def __init__(self, keys, table, th):
+        self.keys = tuple(keys)
+        self.table = table  # 65536 class bitmasks, indexed by the little-endian 16-bit pixel
+        self.th = th  # Colour key -> threshold tuples the table was compiled from
+        self.bits = {}  # Colour key -> class bitmask
+        for bit, key in enumerate(self.keys):
+            self.bits[key] = 1 << bit
+        self.stats = array('i', [0] * (3 * len(self.keys)))  # Per class: sampled pixels, sum of x, sum of y
+        self.grid = array('i', [0] * 7)  # Reused _scan grid argument
+        self.seen = 0  # Bitmask of the classes with at least one sampled pixel
+        self.samples = 0  # Pixels sampled by the last pass
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            head = f.read(6)
+            if head[:4] != MAGIC or head[4] != VERSION:
+                raise ValueError("not a version %d colour table" % VERSION)
+            keys = []
+            th = {}
+            for _ in range(head[5]):
+                key = f.read(f.read(1)[0]).decode()
+                values = array('b', f.read(6 * f.read(1)[0]))
+                keys.append(key)
+                th[key] = [tuple(values[i:i + 6]) for i in range(0, len(values), 6)]
+            table = bytearray(65536)
+            if f.readinto(table) != 65536:
+                raise ValueError("truncated colour table")
+        return cls(keys, table, th)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(MAGIC + bytes((VERSION, len(self.keys))))
+            for key in self.keys:
+                values = array('b', [v for t in self.th[key] for v in t])
+                f.write(bytes((len(key),)) + key.encode() + bytes((len(self.th[key]),)) + bytes(values))
+            f.write(self.table)
+
+    def matches(self, th):
+        # True when the table was compiled from exactly these thresholds
+        if self.keys != tuple(th):
+            return False
+        for key in self.keys:
+            if self.th[key] != [tuple(t) for t in th[key]]:
+                return False
+        return True
+
+    def classify(self, img, roi=None, x_step=4, y_step=2):
+        # One lookup per sampled pixel of an RGB565 frame; returns the bitmask of the classes seen
+        w = img.width()
+        x0, y0, rw, rh = roi or (0, 0, w, img.height())
+        grid = self.grid
+        grid[0], grid[1], grid[2], grid[3], grid[4], grid[5], grid[6] = w, x0, y0, x0 + rw, y0 + rh, x_step, y_step
+        stats = self.stats
+        for i in range(len(stats)):
+            stats[i] = 0
+        self.seen = seen = _scan(img.bytearray(), self.table, grid, stats)
+        self.samples = ((rw + x_step - 1) // x_step) * ((rh + y_step - 1) // y_step)
+        return seen
+
+    def count(self, key):
+        # Sampled pixels of colour key in the last pass
+        return self.stats[3 * self.keys.index(key)]
+
+    def centroid(self, key):
+        # Mean (x, y) of colour key's sampled pixels in the last pass, or None
+        i = 3 * self.keys.index(key)
+        n = self.stats[i]
+        return (self.stats[i + 1] / n, self.stats[i + 2] / n) if n else None
@@ -0,0 +1,92 @@
+# heading.py
+# FIFO-fed heading integrator for the LSM6DSOX, shared by open.py and obstacle.py.
+# MicroPython code.
+# The gyro batches every sample into the on-chip FIFO at the configured rate (416 Hz by default, 512 words
+# deep, so more than a second of samples survives a slow tick). update() drains the FIFO in burst reads and
+# integrates every yaw sample with the trapezoidal rule at the sensor's own sample period, so the heading no
+# longer depends on how long the camera or UART work took in a given control tick. The state machines read
+# the single current value from HeadingIntegrator.angle.
+
+from imu import ODR
+
+# FIFO registers
+FIFO_CTRL3 = 0x09  # Batch data rates: BDR_GY[7:4], BDR_XL[3:0]
+FIFO_CTRL4 = 0x0A  # FIFO_MODE[2:0]
+FIFO_STATUS1 = 0x3A  # DIFF_FIFO[7:0], followed by FIFO_STATUS2
+FIFO_OVR_IA = 0x40  # FIFO_STATUS2: FIFO overrun, the oldest samples were overwritten
+FIFO_FULL_IA = 0x20  # FIFO_STATUS2: FIFO full at the next sample
+FIFO_DATA_OUT_TAG = 0x78  # Tag byte followed by 6 data bytes, address rolls back to 0x78 after 0x7E
+FIFO_BYPASS = 0x0
+FIFO_CONTINUOUS = 0x6
+TAG_GYRO = 0x01  # TAG_SENSOR of an uncompressed gyroscope word
+WORD_SIZE = 7  # Bytes per FIFO word
+BATCH = 32  # FIFO words per SPI transaction
+
+
+class HeadingIntegrator:
+    # Integrates the yaw axis of every FIFO gyro sample into a heading in degrees
+    def __init__(self, imu, axis, odr=416):
+        self.imu = imu
+        self.axis = axis  # Gyro axis (GX/GY/GZ) aligned with the vehicle yaw
+        self.odr = odr  # FIFO batch rate in Hz
+        self.period = 1.0 / odr  # Sample period in s
+        self.bias = 0.0  # Zero-rate offset in dps, subtracted during integration
+        self.angle = 0.0  # Integrated heading in degrees
+        self.rate = 0.0  # Latest yaw rate in dps (bias removed)
+        self.samples = 0  # Gyro samples integrated since start()
+        self.overruns = 0  # Drains that found the FIFO in overrun (samples lost)
+        self.full = 0  # Drains that found the FIFO full (nothing lost yet)
+        self._prev = 0  # Previous raw yaw sample for the trapezoid
+        self._primed = False  # False until the first sample after start()
+        self._buf = bytearray(WORD_SIZE * BATCH)
+        self._views = [memoryview(self._buf)[:WORD_SIZE * n] for n in range(BATCH + 1)]  # Preallocated burst lengths
+        self._status = bytearray(2)
+
+    def start(self, angle=0.0):
+        # Flush the FIFO and restart integration from angle
+        self.imu.write_reg(FIFO_CTRL4, FIFO_BYPASS)
+        self.imu.write_reg(FIFO_CTRL3, ODR[self.odr] << 4)  # Batch gyro only
+        self.imu.write_reg(FIFO_CTRL4, FIFO_CONTINUOUS)
+        self.angle = angle
+        self.rate = 0.0
+        self.samples = 0
+        self._primed = False
+
+    def update(self):
+        # Drain every sample queued since the last call; returns the number of gyro samples integrated
+        imu = self.imu
+        imu.read_into(FIFO_STATUS1, self._status)
+        pending = self._status[0] | ((self._status[1] & 0x03) << 8)
+        if self._status[1] & FIFO_OVR_IA:
+            self.overruns += 1
+        elif self._status[1] & FIFO_FULL_IA:
+            self.full += 1
+        axis_lo = 1 + 2 * self.axis
+        prev = self._prev
+        primed = self._primed
+        twice_area = 0  # Sum of (prev + cur) over the drained samples, raw units
+        count = 0
+        while pending > 0:
+            n = pending if pending < BATCH else BATCH
+            imu.read_into(FIFO_DATA_OUT_TAG, self._views[n])
+            buf = self._buf
+            for w in range(n):
+                o = w * WORD_SIZE
+                if (buf[o] >> 3) != TAG_GYRO:
+                    continue
+                cur = buf[o + axis_lo] | (((buf[o + axis_lo + 1] ^ 0x80) - 0x80) << 8)
+                if primed:
+                    twice_area += prev + cur
+                    count += 1
+                else:
+                    primed = True
+                prev = cur
+            pending -= n
+        self._prev = prev
+        self._primed = primed
+        if count:
+            # Trapezoidal rule: sum((prev + cur) / 2) * period, scaled once per drain
+            self.angle += (twice_area * 0.5 * self.imu.gyro_sens - self.bias * count) * self.period
+            self.rate = prev * self.imu.gyro_sens - self.bias
+            self.samples += count
+        return count
@@ -0,0 +1,86 @@
+# imu.py
+# Burst-read LSM6DSOX driver shared by open.py and obstacle.py.
+# MicroPython code.
+# All three gyroscope axes and all three accelerometer axes (OUTX_L_G 0x22 .. OUTZ_H_A 0x2D) are read in a single
+# auto-increment SPI transaction into a reused buffer and decoded into a preallocated signed 16-bit array,
+# so a read costs one chip-select cycle and allocates nothing. Output data rate and full-scale range are
+# configurable and the matching sensitivity replaces the hard-coded scale factor.
+
+from array import array
+
+# Register map
+WHO_AM_I = 0x0F  # Reads 0x6C on LSM6DSOX
+CTRL1_XL = 0x10  # Accelerometer ODR and full scale
+CTRL2_G = 0x11  # Gyroscope ODR and full scale
+CTRL3_C = 0x12  # BDU and register auto-increment
+OUT_TEMP_L = 0x20  # Die temperature, 256 LSB/degree C, 0 = 25 degrees C
+OUTX_L_G = 0x22  # First output register, gyro X low byte
+READ = 0x80  # SPI read bit
+
+# ODR in Hz -> CTRLx ODR field
+ODR = {0: 0x0, 12.5: 0x1, 26: 0x2, 52: 0x3, 104: 0x4, 208: 0x5, 416: 0x6, 833: 0x7, 1666: 0x8, 3332: 0x9, 6667: 0xA}
+# Gyro full scale in dps -> (FS field, sensitivity in dps/LSB)
+GYRO_SCALE = {250: (0x0, 0.00875), 500: (0x1, 0.0175), 1000: (0x2, 0.035), 2000: (0x3, 0.070)}
+# Accel full scale in g -> (FS field, sensitivity in g/LSB)
+ACCEL_SCALE = {2: (0x0, 0.000061), 4: (0x2, 0.000122), 8: (0x3, 0.000244), 16: (0x1, 0.000488)}
+
+# Index of each axis in IMU.raw
+GX, GY, GZ, AX, AY, AZ = 0, 1, 2, 3, 4, 5
+
+
+class IMU:
+    # Configures the LSM6DSOX over SPI and reads gyro + accel in one burst
+    def __init__(self, spi, cs, gyro_odr=833, gyro_scale=1000, accel_odr=833, accel_scale=4):
+        self.spi = spi
+        self.cs = cs
+        self.buf = bytearray(12)  # Burst buffer: gyro XYZ then accel XYZ, little-endian
+        self.raw = array('h', [0] * 6)  # Decoded signed samples, indexed by GX..AZ
+        self._addr = bytearray(1)  # Reused register address buffer
+        self._reg = bytearray(2)  # Reused register write buffer
+        self._temp = bytearray(2)  # Reused temperature buffer
+        self.gyro_odr = gyro_odr
+        self.accel_odr = accel_odr
+        self.gyro_sens = GYRO_SCALE[gyro_scale][1]  # dps per LSB
+        self.accel_sens = ACCEL_SCALE[accel_scale][1]  # g per LSB
+        self.cs.high()
+        self.write_reg(CTRL3_C, 0x44)  # BDU=1 so low/high bytes match, IF_INC=1 for burst reads
+        self.write_reg(CTRL2_G, (ODR[gyro_odr] << 4) | (GYRO_SCALE[gyro_scale][0] << 2))
+        self.write_reg(CTRL1_XL, (ODR[accel_odr] << 4) | (ACCEL_SCALE[accel_scale][0] << 2))
+
+    def write_reg(self, reg, value):
+        self._reg[0] = reg
+        self._reg[1] = value
+        self.cs.low()
+        self.spi.write(self._reg)
+        self.cs.high()
+
+    def read_into(self, reg, buf):
+        # Auto-increment burst read starting at reg, filling buf
+        self._addr[0] = reg | READ
+        self.cs.low()
+        self.spi.write(self._addr)
+        self.spi.readinto(buf)
+        self.cs.high()
+
+    def read(self):
+        # One SPI transaction for all six axes, decoded in place
+        self.read_into(OUTX_L_G, self.buf)
+        b = self.buf
+        raw = self.raw
+        for i in range(6):
+            raw[i] = b[2 * i] | (((b[2 * i + 1] ^ 0x80) - 0x80) << 8)
+        return raw
+
+    def gyro(self, axis):
+        # Angular rate of gyro axis GX/GY/GZ from the last read, in degrees per second
+        return self.raw[axis] * self.gyro_sens
+
+    def accel(self, axis):
+        # Acceleration of axis AX/AY/AZ from the last read, in g
+        return self.raw[axis] * self.accel_sens
+
+    def temperature(self):
+        # Die temperature in degrees C
+        self.read_into(OUT_TEMP_L, self._temp)
+        t = self._temp
+        return 25.0 + (t[0] | (((t[1] ^ 0x80) - 0x80) << 8)) / 256.0
@@ -0,0 +1,52 @@
+# kernel.py
+# Compiled per-tick math shared by open.py and obstacle.py.
+# MicroPython code.
+# The angle wrap, the servo pulse mapping and the motor duty split run on every control tick, several times per
+# tick for the wraps. As interpreted bytecode, every operator is a dispatched opcode on boxed objects. The float
+# helpers are compiled with @micropython.native: they do the same float operations in the same order, so results
+# are bit-identical to the inline expressions they replace and host replay is unaffected. The integer helpers are
+# compiled with @micropython.viper on machine words. The servo mapping takes the steering position in 1/256 steps
+# and uses a Q8 slope instead of a float floor division; over the 1500-tick pulse range it differs from the float
+# mapping by at most one tick. The pose prediction and updates (lib/pose.py), which carry the odometry
+# trigonometry, and the PID step (lib/pid.py) are compiled with @micropython.native in place. tests/kernel_bench.py
+# times each helper against the interpreted original on the board.
+
+import micropython
+
+
+@micropython.native
+def wrap180(x):
+    # Angle x in degrees folded into [-180, 180): ((target - angle + 180) % 360) - 180 with x = target - angle
+    return ((x + 180) % 360) - 180
+
+
+@micropython.viper
+def clamp_int(x: int, lo: int, hi: int) -> int:
+    # x limited to lo..hi
+    if x < lo:
+        return lo
+    if x > hi:
+        return hi
+    return x
+
+
+def servo_slope(span):
+    # Q8 pulse ticks per steering position unit for a pulse span over 240 positions, for servo_pulse()
+    return ((span << 8) + 239) // 240  # Rounded up, so the end positions reach the end pulses
+
+
+@micropython.viper
+def servo_pulse(q: int, center: int, left: int, right: int) -> int:
+    # Servo pulse width of steering position q (0-480 in 1/256 steps, 240 * 256 = centre) with the Q8 slopes
+    # left and right of servo_slope()
+    if q < 61440:
+        return center - (((61440 - q) * left) >> 16)
+    return center + (((q - 61440) * right) >> 16)
+
+
+@micropython.viper
+def motor_duty(speed: int) -> int:
+    # Forward/reverse PWM percent of a clamped motor speed (-100..100), packed as forward << 8 | reverse
+    if speed > 0:
+        return (100 << 8) | (100 - speed)
+    return ((100 + speed) << 8) | 100
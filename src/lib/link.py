@@ -0,0 +1,199 @@
+# link.py
+# Binary streaming link to the sensor microcontroller (uart_slave.ino).
+# MicroPython code.
+# The slave pushes fixed-size frames at a configured period: sequence number, slave timestamp,
+# left/right ToF distances with the age of the older one, raw encoder count, encoder reset epoch, filtered
+# encoder velocity and the slave time of the last encoder edge, protected by CRC-16/CCITT. The slave ranges both
+# ToF sensors continuously and fills the frame from its cache, so a frame never waits on a measurement. The
+# velocity is estimated on the slave from edge timestamps, so it resolves slow speeds that differencing the count
+# at the master's tick rate cannot.
+# poll() drains whatever bytes arrived, resynchronises on the sync word and decodes complete frames
+# into preallocated buffers, so the control loop never waits on a request/response round trip
+# and never allocates while parsing.
+# The tick uses a split-phase pattern: request() early in the tick, camera and gyro work, then collect()
+# takes the newest completed sample. With period_ms=0 the slave is polled with a one-shot frame request
+# instead of streaming. age_ms() reports how stale the sample is and timeouts counts unanswered requests.
+# After reset_encoder() frames of the old encoder epoch are dropped (stale counts them). If the epoch has not
+# changed after reset_ms, the 'z' byte is sent once more; if it still has not changed after another reset_ms, the
+# reset counts as failed (reset_failures) and frames are accepted again, so a lost 'z' cannot stall the link.
+
+import pyb
+from array import array
+
+FRAME_SIZE = 26  # Bytes per frame, must match uart_slave.ino
+SYNC_0 = 0xA5  # First sync byte
+SYNC_1 = 0x5A  # Second sync byte
+PULSES_PER_MILLIMETER = 3.024  # Encoder pulses per mm travel, must match uart_slave.ino
+
+# CRC-16/CCITT (poly 0x1021, init 0xFFFF) lookup table, built once at import
+_CRC_TABLE = array('H', [0] * 256)
+for _i in range(256):
+    _crc = _i << 8
+    for _bit in range(8):
+        _crc = ((_crc << 1) ^ 0x1021) if _crc & 0x8000 else (_crc << 1)
+    _CRC_TABLE[_i] = _crc & 0xFFFF
+
+
+class SlaveLink:
+    # Receives streamed frames from the slave and keeps the latest decoded sample
+    def __init__(self, uart, period_ms=10, timeout_ms=50, reset_ms=100):
+        self.uart = uart
+        self.period_ms = period_ms  # Stream period requested from the slave, 0 polls with request()
+        self.timeout_ms = timeout_ms  # A request unanswered for this long counts as a timeout
+        self.reset_ms = reset_ms  # Wait for the new encoder epoch before re-sending 'z' or giving up
+        self._req_ms = 0  # pyb.millis() of the outstanding request
+        self._pending = False  # True while a request waits for a frame
+        self._rx = bytearray(64)  # Staging buffer for uart.readinto
+        self._frame = bytearray(FRAME_SIZE)  # Frame being assembled
+        self._pos = 0  # Bytes of the current frame received so far
+        self._cmd = bytearray(2)  # Reused command buffer
+        self._stale_epoch = -1  # Epoch that must be dropped after an encoder reset (-1 none)
+        self._reset_ms = 0  # pyb.millis() of the last 'z' sent
+        self._resent = False  # 'z' already sent a second time for the current reset
+        # Latest decoded sample
+        self.seq = 0  # Slave frame sequence number
+        self.slave_ms = 0  # Slave millis() when the frame was sampled, low 30 bits
+        self.tof_left = 0  # Left ToF distance in mm
+        self.tof_right = 0  # Right ToF distance in mm
+        self.tof_age = 0  # Age in ms of the older ToF result when the frame was sampled (255: 255 or more)
+        self.count = 0  # Raw encoder count since the last reset
+        self.epoch = 0  # Encoder reset epoch reported by the slave
+        self.pulse_rate = 0  # Filtered encoder velocity in pulses/s
+        self.edge_us = 0  # Slave micros() of the last encoder edge, low 30 bits
+        self.rx_ms = 0  # Local pyb.millis() when the latest frame was accepted
+        # Link statistics
+        self.frames = 0  # Frames accepted
+        self.crc_errors = 0  # Frames dropped for a bad CRC
+        self.lost = 0  # Frames missing from the sequence
+        self.timeouts = 0  # Requests that got no frame within timeout_ms
+        self.stale = 0  # Frames dropped because they were sampled before the last encoder reset
+        self.reset_failures = 0  # Encoder resets the slave never confirmed with a new epoch
+
+    def command(self, command):
+        # Forward a one-byte ASCII command to the slave
+        self.uart.write(command)
+
+    def start(self):
+        # Ask the slave to push frames every period_ms
+        self._cmd[0] = ord('s')
+        self._cmd[1] = self.period_ms
+        self.uart.write(self._cmd)
+
+    def stop(self):
+        # Return the slave to request/response mode
+        self._cmd[0] = ord('s')
+        self._cmd[1] = 0
+        self.uart.write(self._cmd)
+
+    def reset_encoder(self):
+        # Zero the slave encoder; frames still in flight from the old epoch are ignored
+        self.uart.write(b'z')
+        self._stale_epoch = self.epoch
+        self._reset_ms = pyb.millis()
+        self._resent = False
+        self.count = 0
+
+    def request(self):
+        # First phase: ask for a sample (one-shot frame when not streaming) and start the timeout window
+        if self._pending:
+            if pyb.elapsed_millis(self._req_ms) < self.timeout_ms:
+                return  # Previous request still in flight
+            self.timeouts += 1
+        if self.period_ms == 0:
+            self.uart.write(b'f')
+        self._req_ms = pyb.millis()
+        self._pending = True
+
+    def collect(self):
+        # Second phase: decode everything that arrived; True if a new sample completed since request()
+        fresh = self.poll()
+        if fresh:
+            self._pending = False
+        elif self._pending and pyb.elapsed_millis(self._req_ms) >= self.timeout_ms:
+            self.timeouts += 1
+            self._pending = False
+        return fresh
+
+    def age_ms(self):
+        # Milliseconds since the latest accepted frame (-1 before the first frame)
+        return pyb.elapsed_millis(self.rx_ms) if self.frames else -1
+
+    def distance(self):
+        # Encoder travel distance in mm
+        return self.count / PULSES_PER_MILLIMETER
+
+    def velocity(self):
+        # Encoder speed in mm/s
+        return self.pulse_rate / PULSES_PER_MILLIMETER
+
+    def poll(self):
+        # Drain received bytes and decode every complete frame; True if a new sample was accepted
+        fresh = False
+        uart = self.uart
+        rx = self._rx
+        frame = self._frame
+        while uart.any():
+            n = uart.readinto(rx)
+            if not n:
+                break
+            pos = self._pos
+            for i in range(n):
+                b = rx[i]
+                if pos == 0:
+                    if b == SYNC_0:
+                        pos = 1
+                elif pos == 1:
+                    if b == SYNC_1:
+                        pos = 2
+                    elif b != SYNC_0:
+                        pos = 0
+                else:
+                    frame[pos] = b
+                    pos += 1
+                    if pos == FRAME_SIZE:
+                        pos = 0
+                        if self._decode():
+                            fresh = True
+            self._pos = pos
+        return fresh
+
+    def _decode(self):
+        # Verify CRC and copy the assembled frame into the sample fields
+        f = self._frame
+        crc = 0xFFFF
+        for i in range(2, FRAME_SIZE - 2):
+            crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[((crc >> 8) ^ f[i]) & 0xFF]
+        if crc != (f[FRAME_SIZE - 2] | (f[FRAME_SIZE - 1] << 8)):
+            self.crc_errors += 1
+            return False
+        seq = f[2] | (f[3] << 8)
+        if self.frames:
+            self.lost += (seq - self.seq - 1) & 0xFFFF
+        self.seq = seq  # Dropped stale frames still advance the sequence, they are not lost
+        epoch = f[16]
+        if epoch == self._stale_epoch:
+            if pyb.elapsed_millis(self._reset_ms) < self.reset_ms:
+                self.stale += 1
+                return False  # Sampled before the last encoder reset
+            if not self._resent:
+                self.uart.write(b'z')  # The slave did not see the reset: ask once more
+                self._reset_ms = pyb.millis()
+                self._resent = True
+                self.stale += 1
+                return False
+            self.reset_failures += 1  # Still the old epoch: take the frames again, the count was not zeroed
+        self._stale_epoch = -1
+        # Slave times keep their low 30 bits: wider values would be heap-allocated big ints (differences of two
+        # times wrap with & 0x3FFFFFFF)
+        self.slave_ms = f[4] | (f[5] << 8) | (f[6] << 16) | ((f[7] & 0x3F) << 24)
+        # Sign-extend through the top byte so values stay small ints (no heap allocation)
+        self.tof_left = f[8] | (((f[9] ^ 0x80) - 0x80) << 8)
+        self.tof_right = f[10] | (((f[11] ^ 0x80) - 0x80) << 8)
+        self.count = f[12] | (f[13] << 8) | (f[14] << 16) | (((f[15] ^ 0x80) - 0x80) << 24)
+        self.epoch = epoch
+        self.tof_age = f[17]
+        self.pulse_rate = f[18] | (((f[19] ^ 0x80) - 0x80) << 8)
+        self.edge_us = f[20] | (f[21] << 8) | (f[22] << 16) | ((f[23] & 0x3F) << 24)
+        self.rx_ms = pyb.millis()
+        self.frames += 1
+        return True
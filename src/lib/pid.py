@@ -0,0 +1,75 @@
+# pid.py
+# Steering PID controller on the measured control period, shared by open.py and obstacle.py.
+# MicroPython code.
+# The inline PID update added error * ki to the integral and (error - last_error) * kd as the derivative on every
+# tick, so its effective gains changed with the loop rate. PID scales both terms by the measured tick period dt:
+# the integral grows by error * ki * dt / T and the derivative is the error rate times kd * T, where T is the tick
+# period of the loop the gains were tuned in. That loop period differed between the sections of the old scripts
+# (one to four camera snapshots per tick, or none), so every gain table carries its own T as a fourth element:
+# (kp, ki, kd, T in ms). At dt = T the integral step equals the old one. The error rate is low-pass filtered with a time
+# constant of T / 2 before kd is applied, which is about the averaging the old difference over one T gave: camera
+# errors change only on the ticks that consume a new frame, and the raw difference over a tick shorter than T
+# turns every frame into a spike. Anti-windup: besides the +-100 integral clamp, the integral stops growing while
+# the output (with the base steering) is saturated in the direction of the error. Gains come from the state tables
+# of the scripts; use() switches them bumplessly: the difference of the proportional and derivative terms at the
+# switch is held as a transfer term that fades with time constant blend, so a state change does not step the
+# steering by itself and the new gains still take over within a few ticks (moved into the integral, it took tens
+# of seconds to unwind at the small ki of the tables). step() is compiled with @micropython.native like the rest
+# of the per-tick math (lib/kernel.py).
+
+import micropython
+
+
+class PID:
+    # PID on a scalar error, gains (kp, ki, kd, T) per tick of a loop with period T ms
+    def __init__(self, gains, limit=240, i_limit=100, max_dt=0.05, blend=0.1):
+        self.gains = gains  # Current (kp, ki, kd, T)
+        self.period = gains[3] / 1000.0  # Tuned tick period T of the current gains in s
+        self.limit = limit  # Output saturation, +- steering positions from centre
+        self.i_limit = i_limit  # Integral term clamp
+        self.max_dt = max_dt  # Longest period a single step integrates, in s (a stalled tick is not a jump)
+        self.blend = blend  # Time constant in s over which a gain switch fades into the new gains
+        self.transfer = 0.0  # Output difference left by the last gain switch, fading with blend
+        self.integral = 0.0  # Integral term, in output units
+        self.rate = 0.0  # Filtered error rate per s
+        self.last_error = 0.0
+        self.saturated = 0  # Steps with the integral held by the anti-windup
+
+    def reset(self):
+        # Clear the integral, the gain switch transfer, the derivative filter and the last error
+        self.integral = 0.0
+        self.transfer = 0.0
+        self.rate = 0.0
+        self.last_error = 0.0
+
+    def use(self, gains):
+        # Switch to gains (a tuple of a state table) without a step in the output
+        old = self.gains
+        if gains is old:
+            return
+        self.gains = gains
+        old_period, self.period = self.period, gains[3] / 1000.0
+        d = (old[2] * old_period - gains[2] * self.period) * self.rate
+        self.transfer += (old[0] - gains[0]) * self.last_error + d
+
+    @micropython.native
+    def step(self, error, dt, base=0):
+        # One PID step over dt seconds; returns base + the PID output
+        kp, ki, kd, _ = self.gains
+        period = self.period
+        if dt > self.max_dt:
+            dt = self.max_dt
+        if dt > 0:
+            raw = (error - self.last_error) / dt
+            self.rate += (raw - self.rate) * dt / (0.5 * period + dt)
+            self.transfer -= self.transfer * dt / (self.blend + dt)
+        self.last_error = error
+        p = error * kp
+        d = self.rate * kd * period
+        i = max(-self.i_limit, min(self.i_limit, self.integral + error * ki * dt / period))
+        out = base + p + i + d + self.transfer
+        if (out > self.limit and error > 0) or (out < -self.limit and error < 0):
+            self.saturated += 1  # Saturated and the error would push further: hold the integral
+        else:
+            self.integral = i
+        return base + p + self.integral + d + self.transfer
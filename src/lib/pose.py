@@ -0,0 +1,262 @@
+# pose.py
+# Pose estimator fusing gyro heading, encoder travel, side ToF walls and corner-line fixes.
+# MicroPython code.
+# Dead reckoning (odometry_x += delta_enc * cos(angle)) only accumulates error: wheel slip, encoder scale and gyro
+# drift all move the position the parking states rely on. PoseEstimator is an extended Kalman filter on the planar
+# pose (x, y, theta) with its 3 x 3 covariance. predict() integrates the encoder travel along the gyro heading of
+# the step and grows the covariance with the distance driven and the angle turned. Two scalar measurements
+# correct it:
+# - Side walls. The field walls are axis-aligned, so a side ToF distance taken while the beam is within max_skew
+#   degrees of a wall normal measures the distance to a line n . p = c, with n one of the four axis directions.
+#   The walls are not known in advance: consistent readings over wall_span mm of travel register the line (at
+#   most MAX_WALLS) together with the pose variance along its normal, and later readings of a registered line,
+#   on the same straight, the next lap or after the U-turn, update the pose. Readings that fit no line within
+#   the innovation gate (a pillar, a corner opening) are rejected.
+# - Corner lines. The first detection of the corner line ending each straight (keyed by the travel axis)
+#   records the position along that axis; detections on later laps fix the along-track position to it.
+# The frame is that of the old odometry: start pose at the origin, x along the start heading and y to its right
+# (the gyro angle is positive clockwise). The estimator keeps its own encoder reference, so an encoder reset
+# (reset_encoder) does not move the pose. mark() and forward() measure travel from a reference pose.
+# The covariance is a fixed flat array updated in place; the filter allocates nothing after construction. The
+# per-tick methods are compiled with @micropython.native (see lib/kernel.py).
+
+import math
+from array import array
+
+import micropython
+
+MAX_WALLS = 16  # Registered wall lines
+NO_AXIS = 255  # Candidate slot not in use
+_HALF_PI = math.pi / 2
+_AXES = ((1.0, 0.0), (0.0, 1.0), (-1.0, 0.0), (0.0, -1.0))  # Unit vectors at 0, 90, 180 and 270 degrees
+
+
+class PoseEstimator:
+    # Extended Kalman filter on (x, y, theta) with self-registered wall lines and corner-line fixes
+    def __init__(self, q_dist=1.0, q_slip=0.05, q_turn=1e-4, q_yaw=3e-8, r_tof=400.0, r_corner=22500.0,
+                 gate=9.0, max_range=1200, max_skew=20, wall_span=200, wall_tol=40, wall_sep=300, tof_offset=0):
+        self.q_dist = q_dist  # Along-track variance per mm driven, mm^2/mm
+        self.q_slip = q_slip  # Cross-track variance per mm driven, mm^2/mm
+        self.q_turn = q_turn  # Heading variance per radian turned, rad^2/rad
+        self.q_yaw = q_yaw  # Heading variance per mm driven (gyro drift), rad^2/mm
+        self.r_tof = r_tof  # Side ToF variance, mm^2
+        self.r_corner = r_corner  # Along-track variance of a corner-line detection, mm^2
+        self.gate = gate  # Normalised innovation squared above which a reading is rejected
+        self.max_range = max_range  # Longer side readings are ignored, mm
+        self.max_skew = math.radians(max_skew)  # Largest beam angle to a wall normal
+        self.wall_span = wall_span  # Travel a new wall must be seen over before it is registered, mm
+        self.wall_tol = wall_tol  # Spread of the readings that register one wall, mm
+        self.wall_sep = wall_sep  # No new wall closer than this to a registered parallel one, mm
+        self.tof_offset = tof_offset  # Distance from the car reference point to each side sensor, mm
+        self.P = array('f', [0.0] * 9)  # Row-major covariance of (x, y, theta)
+        self.wall_axis = bytearray(MAX_WALLS)  # Index into _AXES of each wall's normal (car towards wall)
+        self.wall_c = array('f', [0.0] * MAX_WALLS)  # Line offset n . p of each wall, mm
+        self.wall_var = array('f', [0.0] * MAX_WALLS)  # Pose variance along the normal when registered, mm^2
+        self.corner_known = bytearray(4)  # Corner line of the straight along each axis recorded
+        self.corner_s = array('f', [0.0] * 4)  # Along-track position of each recorded corner line, mm
+        self.corner_var = array('f', [0.0] * 4)  # Pose variance along the track when recorded, mm^2
+        self._cand_axis = bytearray((NO_AXIS, NO_AXIS))  # Left/right wall candidate: normal axis
+        self._cand_c = array('f', [0.0, 0.0])  # Mean line offset of the candidate readings
+        self._cand_s = array('f', [0.0, 0.0])  # Position along the wall of the first reading
+        self._cand_n = array('H', [0, 0])  # Readings so far
+        self.start()
+
+    def start(self, angle=0.0, encoder=0.0):
+        # Restart at the origin with the gyro angle and encoder distance of this moment as references
+        self.x = 0.0  # Position in mm
+        self.y = 0.0
+        self.theta = 0.0  # Heading in radians, clockwise from the start heading
+        self.last_angle = angle  # Gyro angle at the last predict(), degrees
+        self.last_enc = encoder  # Encoder distance at the last predict(), mm
+        self.mark_x = self.mark_y = self.mark_theta = 0.0
+        P = self.P
+        for i in range(9):
+            P[i] = 0.0
+        self.walls = 0  # Registered walls
+        for i in range(4):
+            self.corner_known[i] = 0
+        self._cand_axis[0] = self._cand_axis[1] = NO_AXIS
+        self.travel = 0.0  # Distance driven, mm
+        self.wall_fixes = 0  # Accepted side wall readings
+        self.corner_fixes = 0  # Accepted corner-line fixes
+        self.rejected = 0  # Readings outside the gate
+
+    def reset_encoder(self):
+        # The encoder distance restarts from 0
+        self.last_enc = 0.0
+
+    @micropython.native
+    def predict(self, encoder, angle):
+        # Advance by the encoder travel and gyro heading change since the last call
+        ds = encoder - self.last_enc
+        self.last_enc = encoder
+        dt = math.radians(angle - self.last_angle)
+        self.last_angle = angle
+        mid = self.theta + dt * 0.5
+        c = math.cos(mid)
+        s = math.sin(mid)
+        self.x += ds * c
+        self.y += ds * s
+        self.theta += dt
+        d = abs(ds)
+        self.travel += d
+        # P = F P F^T with F the identity except dx/dtheta = a and dy/dtheta = b
+        a = -ds * s
+        b = ds * c
+        P = self.P
+        p02 = P[2]
+        p12 = P[5]
+        p22 = P[8]
+        P[0] += 2.0 * a * p02 + a * a * p22
+        P[4] += 2.0 * b * p12 + b * b * p22
+        P[1] += a * p12 + b * p02 + a * b * p22
+        P[2] = p02 + a * p22
+        P[5] = p12 + b * p22
+        # Process noise: travel along and across the heading, heading per radian turned and per mm driven
+        qa = self.q_dist * d
+        qc = self.q_slip * d
+        P[0] += qa * c * c + qc * s * s
+        P[4] += qa * s * s + qc * c * c
+        P[1] += (qa - qc) * c * s
+        P[8] += self.q_turn * abs(dt) + self.q_yaw * d
+        P[3] = P[1]
+        P[6] = P[2]
+        P[7] = P[5]
+
+    @micropython.native
+    def _nis(self, h0, h1, h2, nu, r):
+        # Normalised innovation squared of a scalar measurement with Jacobian (h0, h1, h2)
+        P = self.P
+        s = (h0 * (P[0] * h0 + P[1] * h1 + P[2] * h2) + h1 * (P[3] * h0 + P[4] * h1 + P[5] * h2)
+             + h2 * (P[6] * h0 + P[7] * h1 + P[8] * h2) + r)
+        return nu * nu / s
+
+    @micropython.native
+    def _update(self, h0, h1, h2, nu, r):
+        # Scalar Kalman update with Jacobian (h0, h1, h2), innovation nu and variance r
+        P = self.P
+        ph0 = P[0] * h0 + P[1] * h1 + P[2] * h2
+        ph1 = P[3] * h0 + P[4] * h1 + P[5] * h2
+        ph2 = P[6] * h0 + P[7] * h1 + P[8] * h2
+        s = 1.0 / (h0 * ph0 + h1 * ph1 + h2 * ph2 + r)
+        k = nu * s
+        self.x += ph0 * k
+        self.y += ph1 * k
+        self.theta += ph2 * k
+        P[0] -= ph0 * ph0 * s
+        P[1] -= ph0 * ph1 * s
+        P[2] -= ph0 * ph2 * s
+        P[4] -= ph1 * ph1 * s
+        P[5] -= ph1 * ph2 * s
+        P[8] -= ph2 * ph2 * s
+        P[3] = P[1]
+        P[6] = P[2]
+        P[7] = P[5]
+
+    def sides(self, left, right):
+        # Wall fixes from the left/right ToF distances in mm
+        self._side(0, left, -_HALF_PI)
+        self._side(1, right, _HALF_PI)
+
+    @micropython.native
+    def _side(self, i, r, beam):
+        if r <= 0 or r > self.max_range:
+            self._cand_axis[i] = NO_AXIS
+            return
+        phi = self.theta + beam
+        k = int(math.floor(phi / _HALF_PI + 0.5))
+        skew = phi - k * _HALF_PI
+        if abs(skew) > self.max_skew:
+            self._cand_axis[i] = NO_AXIS  # Beam too oblique to the walls (turning)
+            return
+        axis = k & 3
+        nx, ny = _AXES[axis]
+        cs = math.cos(skew)
+        sn = math.sin(skew)
+        d = r + self.tof_offset
+        npos = nx * self.x + ny * self.y
+        c_meas = npos + d * cs  # Offset of the wall line this reading implies
+        best = -1
+        best_nis = self.gate
+        near = False  # A registered parallel wall too close for a new one
+        for j in range(self.walls):
+            if self.wall_axis[j] != axis:
+                continue
+            c = self.wall_c[j]
+            if abs(c - c_meas) < self.wall_sep:
+                near = True
+            nis = self._nis(-nx / cs, -ny / cs, (c - npos) * sn / (cs * cs), d - (c - npos) / cs,
+                            self.r_tof + self.wall_var[j] / (cs * cs))
+            if nis < best_nis:
+                best = j
+                best_nis = nis
+        if best >= 0:
+            c = self.wall_c[best]
+            self._update(-nx / cs, -ny / cs, (c - npos) * sn / (cs * cs), d - (c - npos) / cs,
+                         self.r_tof + self.wall_var[best] / (cs * cs))
+            self.wall_fixes += 1
+            self._cand_axis[i] = NO_AXIS
+            return
+        if near:
+            self.rejected += 1
+            self._cand_axis[i] = NO_AXIS
+            return
+        # A wall not seen before: register it once consistent readings cover wall_span mm along it
+        s = nx * self.y - ny * self.x
+        if self._cand_axis[i] == axis and abs(c_meas - self._cand_c[i]) < self.wall_tol:
+            n = self._cand_n[i] + 1
+            self._cand_n[i] = n
+            self._cand_c[i] += (c_meas - self._cand_c[i]) / n
+            if abs(s - self._cand_s[i]) >= self.wall_span and self.walls < MAX_WALLS:
+                j = self.walls
+                P = self.P
+                self.wall_axis[j] = axis
+                self.wall_c[j] = self._cand_c[i]
+                self.wall_var[j] = nx * nx * P[0] + 2.0 * nx * ny * P[1] + ny * ny * P[4]
+                self.walls = j + 1
+                self._cand_axis[i] = NO_AXIS
+        else:
+            self._cand_axis[i] = axis
+            self._cand_c[i] = c_meas
+            self._cand_s[i] = s
+            self._cand_n[i] = 1
+
+    def corner(self):
+        # Corner line detected ahead: record the along-track position on the first lap, fix it on later ones
+        k = int(math.floor(self.theta / _HALF_PI + 0.5)) & 3
+        tx, ty = _AXES[k]
+        s = tx * self.x + ty * self.y
+        P = self.P
+        if not self.corner_known[k]:
+            self.corner_known[k] = 1
+            self.corner_s[k] = s
+            self.corner_var[k] = tx * tx * P[0] + 2.0 * tx * ty * P[1] + ty * ty * P[4]
+            return False
+        r = self.r_corner + self.corner_var[k]
+        nu = self.corner_s[k] - s
+        if self._nis(tx, ty, 0.0, nu, r) > self.gate:
+            self.rejected += 1
+            return False
+        self._update(tx, ty, 0.0, nu, r)
+        self.corner_fixes += 1
+        return True
+
+    def mark(self):
+        # Reference pose for forward()
+        self.mark_x = self.x
+        self.mark_y = self.y
+        self.mark_theta = self.theta
+
+    def forward(self):
+        # Travel since mark() along the heading held at mark(), mm
+        return ((self.x - self.mark_x) * math.cos(self.mark_theta)
+                + (self.y - self.mark_y) * math.sin(self.mark_theta))
+
+    def heading(self):
+        # Estimated heading in degrees, clockwise from the start heading
+        return math.degrees(self.theta)
+
+    def sd(self):
+        # Standard deviations of x and y in mm and of the heading in degrees
+        P = self.P
+        return math.sqrt(max(0.0, P[0])), math.sqrt(max(0.0, P[4])), math.degrees(math.sqrt(max(0.0, P[8])))
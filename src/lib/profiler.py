@@ -0,0 +1,67 @@
+# profiler.py
+# Per-stage loop timing profiler with an on-device ring buffer.
+# MicroPython code.
+# Each instrumented stage (link, gyro, capture, blob search, ToF, actuation, control tick) records its start
+# time and duration in microseconds together with the current state into fixed-size arrays allocated once at
+# startup, so recording costs two pyb.micros() calls and four array stores. The newest `capacity` samples are
+# kept and written to flash at the end of the run for tools/profile_report.py to analyse on the host.
+
+import pyb
+import json
+from array import array
+
+US_MASK = 0x3FFFFFFF  # pyb.micros() is a 30-bit counter, start times are stored modulo 2**30
+
+
+class Profiler:
+    # Fixed-size ring buffer of (stage, state, start_us, duration_us) samples
+    def __init__(self, stages, capacity=4096, enabled=True):
+        self.stages = stages  # Stage names, the index is the stage id passed to stop()
+        self.capacity = capacity
+        self.enabled = enabled
+        self.states = []  # State names in first-seen order, the index is the stored state id
+        self._state_ids = {}  # State name -> id
+        self.state_id = 0  # State id attached to new samples
+        self.stage = bytearray(capacity)
+        self.state = bytearray(capacity)
+        self.start_us = array('I', [0] * capacity)
+        self.duration_us = array('I', [0] * capacity)
+        self.count = 0  # Samples recorded since reset (the ring keeps the newest `capacity`)
+        self.set_state("init")
+
+    def set_state(self, name):
+        # Attach subsequent samples to the named state
+        state_id = self._state_ids.get(name)
+        if state_id is None:
+            state_id = len(self.states)
+            self.states.append(name)
+            self._state_ids[name] = state_id
+        self.state_id = state_id
+
+    def start(self):
+        # Timestamp to pass back to stop()
+        return pyb.micros()
+
+    def stop(self, stage_id, start):
+        # Record one sample for stage_id that began at start
+        if not self.enabled:
+            return
+        i = self.count % self.capacity
+        self.stage[i] = stage_id
+        self.state[i] = self.state_id
+        self.start_us[i] = start & US_MASK
+        self.duration_us[i] = pyb.elapsed_micros(start)
+        self.count += 1
+
+    def dump(self, path="profile.bin"):
+        # Write a JSON header line followed by the raw sample arrays in chronological order
+        n = min(self.count, self.capacity)
+        first = self.count % self.capacity if self.count > self.capacity else 0
+        header = {"stages": list(self.stages), "states": self.states, "count": n, "total": self.count}
+        with open(path, "wb") as f:
+            f.write(json.dumps(header).encode())
+            f.write(b"\n")
+            for buf in (self.stage, self.state, self.start_us, self.duration_us):
+                mv = memoryview(buf)
+                f.write(mv[first:n])
+                f.write(mv[:first])
@@ -0,0 +1,76 @@
+# speed.py
+# Wheel speed ramp and optional closed-loop speed trim on the slave encoder speed, shared by open.py and obstacle.py.
+# MicroPython code.
+# set_speed() alone writes an open-loop duty, and the old ramp of a fixed duty step per control tick made the
+# acceleration depend on the loop rate. SpeedController keeps the speed targets of the scripts in motor duty
+# percent, as they were tuned on the car, and ramps a reference toward them at a fixed rate in percent per second
+# over the measured tick period. Without a motor fit the reference is written as the duty (open loop), so the
+# speed a duty gives still falls as the battery drains. With a fit, a PI trim on the encoder speed holds the wheel
+# at the speed the fit gives for the reference duty. The fit is (gain, deadband): on a fresh battery the wheel
+# turns at gain * (|duty| - deadband) mm/s above the deadband duty and not at all below it. It has to be fitted once
+# from car telemetry on a fresh battery (duty against encoder speed on straights) and passed in; it is not learned
+# in a run, because a run's battery is not a fresh one. The measured speed is the slave's encoder velocity
+# (edge-timed and filtered in uart_slave.ino, the wheel_speed global of the scripts), which is part of the replay
+# trace, so host replay reproduces the commands. The integral is clamped, holds while the duty is saturated in the
+# direction of the error, holds while the wheel turns at less than half the expected speed (a blocked car is not a
+# drained battery) and restarts when the reference changes direction. A zero reference writes zero duty.
+
+import micropython
+
+ACCEL = 200.0  # Default reference ramp in duty percent per s
+
+
+class SpeedController:
+    # Duty ramp, plus PI trim on the encoder speed when a motor fit is given, writing the motor duty through set_speed
+    def __init__(self, set_speed, fit=None, kp=0.3, ki=1.5, accel=ACCEL, i_limit=20.0):
+        self.set_speed = set_speed  # Motor duty output, -100..100 (Car.set_speed)
+        self.fit = fit  # (mm/s per duty percent, deadband duty percent) on a fresh battery, None for open loop
+        self.kp = kp  # Duty percent per duty percent of speed error
+        self.ki = ki  # Duty percent per duty percent of speed error and second
+        self.accel = accel  # Reference ramp in percent per s when update() gets none
+        self.i_limit = i_limit  # Integral clamp in duty percent
+        self.ref = 0.0  # Ramped reference in duty percent (set it to start a ramp from another duty)
+        self.velocity = 0.0  # Measured speed in mm/s
+        self.integral = 0.0  # PI integral term in duty percent
+        self.saturated = 0  # Updates with the integral held by the anti-windup
+        self.stalled = 0  # Updates with the integral held because the wheel was far below the expected speed
+        self._last = 0.0  # Reference of the previous update (ref may be set in between)
+
+    def measure(self, velocity):
+        # Measured wheel speed in mm/s for the next update()
+        self.velocity = velocity
+
+    @micropython.native
+    def update(self, target, dt, accel=-1.0):
+        # Ramp the reference toward target (duty percent) over dt seconds at accel (default self.accel) and drive
+        # the motor
+        if accel < 0:
+            accel = self.accel
+        step = accel * dt
+        ref = self.ref + max(-step, min(step, target - self.ref))
+        if (ref > 0) != (self._last > 0) or ref == 0:
+            self.integral = 0.0  # New direction of travel: the trim of the old one does not apply
+        self.ref = self._last = ref
+        if ref == 0:
+            self.set_speed(0)
+            return
+        if self.fit is None:
+            self.set_speed(ref)  # Open loop: the duty targets as tuned
+            return
+        gain, deadband = self.fit
+        mag = abs(ref)
+        if mag <= deadband:
+            self.set_speed(ref)  # The fit gives no speed to hold below the deadband
+            return
+        expected = gain * (mag - deadband)  # Speed of the reference duty on a fresh battery
+        # Speed error in duty percent of a fresh battery, signed like the reference
+        error = (expected if ref > 0 else -expected) / gain - self.velocity / gain
+        i = max(-self.i_limit, min(self.i_limit, self.integral + self.ki * error * dt))
+        duty = ref + self.kp * error + i
+        if (duty > 100 and error > 0) or (duty < -100 and error < 0):
+            self.saturated += 1  # Full duty and still too slow: hold the integral
+        elif abs(self.velocity) < 0.5 * expected:
+            self.stalled += 1  # Wheel blocked or not yet up to speed: hold the integral
+        else:
+            self.integral = i
+        self.set_speed(ref + self.kp * error + self.integral)
@@ -0,0 +1,66 @@
+# statemachine.py
+# Table-driven state machine engine for the navigation scripts.
+# MicroPython code.
+# States are integer ids into a fixed name table. Each state is registered once with a handler, a parameter
+# tuple built at startup (gains, speed targets) and optional enter/exit hooks. step() calls the handler of the
+# current state through a list index, so a control tick costs one lookup and one call instead of a chain of
+# string comparisons, and the hooks run only when go() actually changes the state. Entries and ticks are
+# counted per state for the end-of-run report.
+
+END = True  # Handler return value that ends the current section loop
+
+
+class StateMachine:
+    # Dispatch table indexed by state id
+    def __init__(self, names, initial=0):
+        n = len(names)
+        self.names = names  # State names, the index is the state id
+        self.handlers = [None] * n  # handler(params) -> None or END
+        self.params = [None] * n
+        self.enter = [None] * n  # enter() hooks
+        self.exit = [None] * n  # exit() hooks
+        self.entries = [0] * n  # Times each state was entered
+        self.ticks = [0] * n  # Handler passes per state
+        self.transitions = 0
+        self.state = initial  # Current state id
+        self.name = names[initial]  # Current state name, for the profiler and telemetry
+        self.param = None  # Parameters of the current state
+        self.entries[initial] = 1
+
+    def add(self, state, handler, params=None, enter=None, exit=None):
+        # Register a state; a state without a handler keeps the outputs of the previous tick
+        self.handlers[state] = handler
+        self.params[state] = params
+        self.enter[state] = enter
+        self.exit[state] = exit
+        if state == self.state:
+            self.param = params
+
+    def go(self, state):
+        # Switch to state, running the exit hook of the old state and the enter hook of the new one
+        if state == self.state:
+            return
+        hook = self.exit[self.state]
+        if hook is not None:
+            hook()
+        self.state = state
+        self.name = self.names[state]
+        self.param = self.params[state]
+        self.transitions += 1
+        self.entries[state] += 1
+        hook = self.enter[state]
+        if hook is not None:
+            hook()
+
+    def step(self):
+        # Run the current state's handler once; returns END when the handler finished its section
+        state = self.state
+        self.ticks[state] += 1
+        handler = self.handlers[state]
+        if handler is not None:
+            return handler(self.params[state])
+
+    def summary(self):
+        # "name entries/ticks" for every visited state
+        return " ".join("%s %d/%d" % (self.names[i], self.entries[i], self.ticks[i])
+                        for i in range(len(self.names)) if self.entries[i])
@@ -0,0 +1,56 @@
+# tasks.py
+# uasyncio helpers for running sensing, vision, control and LED work at independent rates.
+# MicroPython code.
+# Each stage of a navigation script runs as its own task. Ticker keeps a task on a fixed period measured
+# from its previous deadline, so one long pass does not shift every later pass. Background tasks are
+# started through spawn(): an exception inside one of them is stored and re-raised from the next
+# Ticker.wait() in any task, so the control loop stops the car instead of driving on stale data.
+
+import pyb
+import uasyncio as asyncio
+
+
+class TaskFailure:
+    error = None  # First exception raised by a spawned task
+
+
+class Ticker:
+    # Fixed-period wait for a task loop
+    def __init__(self, period_ms):
+        self.period_ms = period_ms
+        self.deadline = pyb.millis()  # Time the current pass was due
+        self.overruns = 0  # Passes that finished after the next deadline
+
+    async def wait(self):
+        # Sleep until the next deadline; re-raise a failure from another task
+        if TaskFailure.error is not None:
+            raise TaskFailure.error
+        self.deadline += self.period_ms
+        delay = self.deadline - pyb.millis()
+        if delay < 0:
+            self.overruns += 1
+            self.deadline = pyb.millis()  # Skip missed passes instead of bursting to catch up
+            delay = 0
+        await asyncio.sleep_ms(delay)
+
+
+async def _guard(coro):
+    try:
+        await coro
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        TaskFailure.error = e
+
+
+def spawn(coro):
+    # Start a background task whose failure is reported through Ticker.wait()
+    return asyncio.create_task(_guard(coro))
+
+
+async def periodic(period_ms, fn):
+    # Call fn() every period_ms until cancelled
+    ticker = Ticker(period_ms)
+    while True:
+        fn()
+        await ticker.wait()
@@ -0,0 +1,144 @@
+# telemetry.py
+# Compact binary run recorder shared by open.py and obstacle.py.
+# MicroPython code.
+# Every control tick is packed with struct.pack_into into a fixed 32-byte record inside one block buffer
+# allocated at startup, so recording allocates nothing and costs a single pack_into call. Blocks are written
+# to the SD card (or flash when no card is mounted) at state transitions once enough records are queued,
+# whenever the block fills up, and at the end of the run. The file starts with a JSON header line describing
+# the record layout and the state names; tools/telemetry_decode.py loads it into NumPy structured arrays.
+# InputTrace uses the same block writer to store what every control tick reads (time, heading, encoder distance
+# and speed, ToF distances and every colour's detection slot), which tools/replay.py feeds back into the state machines.
+
+import pyb
+import json
+import struct
+
+# Record layout, little-endian, 32 bytes
+RECORD_FORMAT = "<IBbhffffhhhh"
+RECORD_FIELDS = ("t_ms", "state", "speed", "cam_error", "angle", "odometry_x", "odometry_y", "encoder",
+                 "tof_left", "tof_right", "tof_front", "steer")
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+UNKNOWN_STATE = 255  # State id stored for names missing from the state table
+
+# Input trace layout: fixed head followed by (cx, cy, pixels) for each colour key, pixels 0 when not detected
+TRACE_FORMAT = "<IBBHhhhfff"
+TRACE_FIELDS = ("t_ms", "state", "front_reads", "seq", "tof_left", "tof_right", "tof_front", "angle", "encoder",
+                "wheel_speed")
+DETECTION_FORMAT = "<hhH"
+DETECTION_SIZE = struct.calcsize(DETECTION_FORMAT)
+
+
+class Recorder:
+    # Fixed block buffer of tick records, flushed to a file in large writes
+    def __init__(self, states, capacity=256, min_flush=64, fmt=RECORD_FORMAT, fields=RECORD_FIELDS):
+        self.fmt = fmt  # struct format of one record, starting with t_ms and the state id
+        self.fields = fields
+        self.size = struct.calcsize(fmt)  # Bytes per record
+        self.states = tuple(states)  # State names, the index is the stored state id
+        self._state_ids = {name: i for i, name in enumerate(self.states)}
+        self.capacity = capacity  # Records per block
+        self.min_flush = min_flush  # Records needed before a state transition triggers a write
+        self.buf = bytearray(self.size * capacity)
+        self._view = memoryview(self.buf)
+        self.count = 0  # Records in the current block
+        self.total = 0  # Records since open()
+        self.blocks = 0  # Blocks written
+        self.write_errors = 0  # Failed writes (recording continues in RAM, the block is dropped)
+        self.state_id = UNKNOWN_STATE
+        self.start_ms = 0  # pyb.millis() when the file was opened
+        self.file = None
+
+    def open(self, path="telemetry.bin", start_ms=None):
+        # Create the log file and write the header line; raises OSError when the filesystem is unavailable.
+        # start_ms is the run's time origin stored in the header (default: now)
+        self.file = open(path, "wb")
+        self.start_ms = pyb.millis() if start_ms is None else start_ms
+        header = {"format": self.fmt, "fields": list(self.fields), "states": list(self.states),
+                  "record_size": self.size, "start_ms": self.start_ms}
+        self.file.write(json.dumps(header).encode())
+        self.file.write(b"\n")
+        self.count = 0
+        self.total = 0
+
+    def set_state(self, name):
+        # Attach subsequent records to the named state, writing the queued block on a transition
+        state_id = self._state_ids.get(name, UNKNOWN_STATE)
+        if state_id != self.state_id:
+            self.state_id = state_id
+            if self.count >= self.min_flush:
+                self.flush()
+
+    def record(self, t_ms, speed, cam_error, angle, odometry_x, odometry_y, encoder, tof_left, tof_right,
+               tof_front, steer):
+        # Pack one tick into the block, writing the block out when it is full
+        struct.pack_into(self.fmt, self.buf, self.count * self.size, t_ms, self.state_id, speed,
+                         cam_error, angle, odometry_x, odometry_y, encoder, tof_left, tof_right, tof_front, steer)
+        self._next()
+
+    def _next(self):
+        # Advance to the next record slot, writing the block out when it is full
+        self.count += 1
+        self.total += 1
+        if self.count >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        # Write the queued records in one call and start a new block
+        if self.count and self.file is not None:
+            try:
+                self.file.write(self._view[:self.count * self.size])
+                self.file.flush()
+                self.blocks += 1
+            except OSError:
+                self.write_errors += 1
+        self.count = 0
+
+    def close(self):
+        # Write the last partial block and close the file
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class InputTrace(Recorder):
+    # Per-tick record of every value the state machines read, for deterministic replay on the host
+    def __init__(self, states, keys, capacity=128, min_flush=32):
+        fields = list(TRACE_FIELDS)
+        for key in keys:
+            fields.extend((key + "_cx", key + "_cy", key + "_pixels"))
+        Recorder.__init__(self, states, capacity, min_flush, fmt=TRACE_FORMAT + DETECTION_FORMAT[1:] * len(keys),
+                          fields=tuple(fields))
+        self.keys = tuple(keys)  # Colour keys in record order
+        self._head = struct.calcsize(TRACE_FORMAT)
+        self._offset = 0  # Byte offset of the record of the current tick
+        self._pending = False  # True while the current tick's record is still open for front()
+
+    def tick(self, t_ms, state, angle, encoder, wheel_speed, tof_left, tof_right, detector):
+        # Record the inputs at the start of a control tick; front() adds the front ToF reads of the tick
+        if self._pending:
+            self._next()  # Commit the previous tick now that its front ToF reads are in
+        self.set_state(state)
+        off = self.count * self.size
+        self._offset = off
+        struct.pack_into(TRACE_FORMAT, self.buf, off, t_ms, self.state_id, 0, detector.seq & 0xFFFF, tof_left,
+                         tof_right, 0, angle, encoder, wheel_speed)
+        off += self._head
+        for key in self.keys:
+            slot = detector.slots[key]
+            struct.pack_into(DETECTION_FORMAT, self.buf, off, slot.cx, slot.cy, slot.pixels if slot.det else 0)
+            off += DETECTION_SIZE
+        self._pending = True
+
+    def front(self, distance):
+        # Store a front ToF distance read during the current tick (the last read of the tick is kept)
+        if self._pending:
+            if self.buf[self._offset + 5] < 255:
+                self.buf[self._offset + 5] += 1
+            struct.pack_into("<h", self.buf, self._offset + 12, distance)
+
+    def close(self):
+        if self._pending:
+            self._pending = False
+            self._next()  # Commit the last tick
+        Recorder.close(self)
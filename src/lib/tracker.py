@@ -0,0 +1,113 @@
+# tracker.py
+# Predictive search regions for the obstacle pillars.
+# MicroPython code.
+# A pillar moves only a few pixels between consecutive frames, so searching the whole window for it every frame
+# wastes most of the find_blobs time. PillarTracker keeps one track per pillar colour with its position and
+# velocity in reference (QVGA) pixels. It predicts where the pillar will be in the next frame from that velocity
+# plus the image shift caused by the car's own rotation (heading change times pixels per degree), and narrows
+# the colour's search region in the ColorDetector to a box around the prediction. A track that misses a frame
+# coasts on its prediction with a wider box; after max_misses missed frames it is dropped and the colour is
+# searched in its whole band (ColorDetector.set_region) again. The tracks only aim the search: obstacle.py's sections still act on each
+# frame's detections with the frame counts they were tuned with.
+# update() runs in the control task on every new frame, from the published detections and the heading only,
+# so host replay (tools/replay.py) reproduces the tracks exactly.
+
+import math
+
+
+class Track:
+    # One pillar colour: position and velocity
+    def __init__(self, key):
+        self.key = key
+        self.reset()
+
+    def reset(self):
+        self.hits = 0  # Frames with a detection since the track started (0 = no track)
+        self.misses = 0  # Frames since the last detection
+        self.cx = 0.0  # Centroid in reference pixels, measured on hits and predicted while coasting
+        self.cy = 0.0
+        self.vx = 0.0  # Velocity in reference pixels per frame, ego rotation removed
+        self.vy = 0.0
+        self.size = 0.0  # Square root of the pixel count of the last detection
+
+
+class PillarTracker:
+    # Tracks of the pillar colours of a ColorDetector and their predicted search regions
+    def __init__(self, detector, keys, px_per_deg, beta=0.3, max_misses=3, margin=16, size_factor=1.5):
+        self.detector = detector
+        self.tracks = [Track(key) for key in keys]
+        self.px_per_deg = px_per_deg  # Image x shift per degree of heading change (negative: turning right moves
+        #                               the scene left)
+        self.beta = beta  # Velocity gain on the prediction residual
+        self.max_misses = max_misses  # Missed frames before falling back to the full search region
+        self.margin = margin  # Search box margin in reference pixels, grows with every missed frame
+        self.size_factor = size_factor  # Search box half-size per square-rooted pixel count
+        self.seq = -1  # Detector frame of the last update
+        self.angle = 0.0  # Heading at the last update
+        self.shift = 0.0  # Ego-motion shift per frame at the last update
+        self.roi_searches = 0  # Track-frames searched in a predicted box
+        self.full_searches = 0  # Track-frames searched in the whole band
+
+    def __getitem__(self, key):
+        for track in self.tracks:
+            if track.key == key:
+                return track
+
+    def update(self, angle):
+        # Fold the newest published frame into the tracks and aim the next search regions; angle in degrees
+        det = self.detector
+        n = det.seq - self.seq if self.seq >= 0 else 1  # Frames since the last update
+        if n < 1:
+            return
+        self.seq = det.seq
+        turn = ((angle - self.angle + 180) % 360) - 180
+        self.angle = angle
+        shift = turn * self.px_per_deg  # Image shift from the car's rotation since the last update
+        self.shift = shift / n
+        for track in self.tracks:
+            slot = det.slots[track.key]
+            if track.hits:
+                px = track.cx + track.vx * n + shift
+                py = track.cy + track.vy * n
+            if slot.det:
+                if track.hits:
+                    track.vx += self.beta * (slot.cx - px) / n
+                    track.vy += self.beta * (slot.cy - py) / n
+                track.cx = slot.cx
+                track.cy = slot.cy
+                track.size = math.sqrt(slot.pixels)
+                track.hits += 1
+                track.misses = 0
+            elif track.hits:
+                track.misses += 1  # Frames the control task skipped are no evidence either way
+                if track.misses > self.max_misses:
+                    track.reset()
+                else:
+                    track.cx = px  # Coast on the prediction
+                    track.cy = py
+        self.aim()
+
+    def aim(self):
+        # Search box around each track's next-frame prediction, inside the colour's band; the whole band for
+        # colours without a track
+        det = self.detector
+        for track in self.tracks:
+            fx, fy, fw, fh = det.regions[track.key]
+            if not track.hits:
+                det.set_roi(track.key)
+                self.full_searches += 1
+                continue
+            half = self.size_factor * track.size + self.margin * (1 + track.misses)
+            x = track.cx + track.vx + self.shift
+            y = track.cy + track.vy
+            x0 = max(fx, int(x - half - abs(track.vx)))
+            y0 = max(fy, int(y - half - abs(track.vy)))
+            x1 = min(fx + fw, int(x + half + abs(track.vx)) + 1)
+            y1 = min(fy + fh, int(y + half + abs(track.vy)) + 1)
+            if x1 - x0 < 8 or y1 - y0 < 8:
+                track.reset()  # Prediction left the frame
+                det.set_roi(track.key)
+                self.full_searches += 1
+                continue
+            det.set_roi(track.key, (x0, y0, x1 - x0, y1 - y0))
+            self.roi_searches += 1
@@ -0,0 +1,210 @@
+# vision.py
+# Single-snapshot multi-colour detection shared by open.py and obstacle.py.
+# MicroPython code.
+# One control tick captures exactly one frame. Every colour class requested for that tick is searched
+# in the same frame with find_blobs, and the largest blob of each class is stored in a reusable result
+# slot (detection flag, centroid error, centroid, pixel count). Steering decisions therefore never mix
+# colours seen at different moments, and the per-tick camera cost drops from one snapshot per colour to one.
+# Results are double-buffered: begin()/step() let a vision task search one colour at a time and yield in
+# between, while readers keep seeing the last complete frame until the new one is published.
+# Each frame is taken with a CaptureProfile: the colours of one vision job plus the frame size and pixel
+# format it needs. Each colour has a region (set_region), the band of the window it can appear in, and a search
+# region inside it that set_roi may narrow for a frame. The sensor window is cut to the bounding box of the
+# search regions of the job's colours, so a job only captures and scans the rows and columns it looks at. Search regions and results stay in reference
+# (QVGA) coordinates whatever the profile, and the sensor is only reprogrammed when the setup changes.
+# With a ColorLUT (colorlut.py) a frame is first classified in one sampled table-lookup pass, and colours with no
+# sampled pixel in the frame skip their find_blobs call. Only colours whose find_blobs seed stride is at least as
+# coarse as the lookup grid are gated: a blob that holds a full stride cell of matching pixels always covers a grid
+# pixel there, while a finer seed scan can find blobs (narrow or speckled ones) that fall between grid pixels.
+
+import sensor
+
+REFERENCE_WIDTH = 320  # Coordinates, regions and pixel counts are expressed at QVGA scale
+FRAME_WIDTHS = {sensor.QQQVGA: 80, sensor.QQVGA: 160, sensor.QVGA: 320}  # 4:3 sizes with the QVGA field of view
+
+
+class CaptureProfile:
+    # Sensor setup for one vision job: colour keys searched in each frame, frame size and pixel format
+    def __init__(self, name, keys, framesize=sensor.QVGA, pixformat=sensor.RGB565):
+        self.name = name
+        self.keys = keys
+        self.framesize = framesize
+        self.pixformat = pixformat
+        self.scale = REFERENCE_WIDTH // FRAME_WIDTHS[framesize]  # Reference pixels per captured pixel
+
+
+class Detection:
+    # Result slot for one colour class, reused on every frame to avoid per-tick allocation
+    def __init__(self, key):
+        self.key = key  # Key into the threshold dictionary
+        self.det = False  # True when a blob passed the thresholds in the last frame
+        self.error = 0  # Centroid x deviation from camera center
+        self.cx = 0  # Centroid x of the largest blob
+        self.cy = 0  # Centroid y of the largest blob
+        self.pixels = 0  # Pixel count of the largest blob
+
+    def clear(self):
+        self.det = False
+        self.error = 0
+        self.cx = 0
+        self.cy = 0
+        self.pixels = 0
+
+
+class ColorDetector:
+    # Captures one frame per call and fills a Detection slot for each colour key of the profile
+    def __init__(self, th, width, height, center, pixels_threshold=200, area_threshold=200,
+                 framesize=sensor.QVGA, pixformat=sensor.RGB565, lut=None, lut_step=(4, 2)):
+        # framesize/pixformat: the sensor setup the script made before the first frame
+        # lut: optional ColorLUT compiled from th; lut_step: its sampling grid in captured pixels, which gates only
+        # the colours whose seed stride is at least as coarse (set_stride)
+        self.th = th  # LAB threshold dictionary from the calling script
+        self.center = center  # Camera center used for the error term
+        self.pixels_threshold = pixels_threshold  # In reference pixels
+        self.area_threshold = area_threshold
+        self.full_roi = (0, 0, width, height)
+        self.regions = {}  # Colour key -> band (x, y, w, h) the colour is searched in, in reference coordinates
+        self.rois = {}  # Colour key -> search region of the next frame, inside the colour's band
+        self.strides = {}  # Colour key -> (x_stride, y_stride) of the find_blobs seed scan
+        self.slots = {}  # Colour key -> Detection of the last published frame
+        self._work = {}  # Colour key -> Detection being filled for the next frame
+        for key in th:
+            self.regions[key] = self.full_roi
+            self.rois[key] = self.full_roi
+            self.strides[key] = (2, 1)  # find_blobs defaults
+            self.slots[key] = Detection(key)
+            self._work[key] = Detection(key)
+        self.img = None  # Last captured frame
+        self.seq = 0  # Number of published frames
+        self.frame_time = 0  # Caller timestamp of the published frame
+        self.profile = None  # Profile the sensor is set up for
+        self.framesize = framesize
+        self.pixformat = pixformat
+        self.window = None  # Sensor window (x, y, w, h) in captured pixels
+        self.switches = 0  # Sensor window changes
+        self.reconfigs = 0  # Frame size / pixel format changes
+        self.lut = lut
+        self.lut_step = lut_step
+        self.skipped = 0  # find_blobs calls saved by the lookup table pass
+        self._gated = ()  # Keys of the current profile gated by the lookup table pass
+        self._dirty = True  # Search regions changed since the window was set
+        self._origin = (0, 0)  # Window origin in reference coordinates
+        self._frame_rois = {}  # Colour key -> search region inside the captured window
+        self._pixels = pixels_threshold  # Thresholds scaled to captured pixels
+        self._area = area_threshold
+        self._scale = 1
+        self._keys = ()  # Keys requested for the frame in progress
+        self._next = 0  # Index of the next key to search
+        self._time = 0  # Caller timestamp of the frame in progress
+
+    def __getitem__(self, key):
+        return self.slots[key]
+
+    def set_region(self, key, roi=None):
+        # Set the band one colour is searched in (None: the full reference window) and search all of it
+        self.regions[key] = roi if roi is not None else self.full_roi
+        self.set_roi(key)
+
+    def set_roi(self, key, roi=None):
+        # Change the search region of one colour (None restores the colour's band)
+        roi = roi if roi is not None else self.regions[key]
+        if roi != self.rois[key]:
+            self.rois[key] = roi
+            self._dirty = True  # Takes effect at the next frame
+
+    def set_stride(self, key, x_stride=2, y_stride=1):
+        # Coarser seed scan for colours that only form large blobs (find_blobs still fills them pixel-exact)
+        self.strides[key] = (x_stride, y_stride)
+        self._dirty = True  # Gated colours are recomputed at the next frame
+
+    def setup(self, profile):
+        # Program the sensor for profile; only settings that differ from the current frame are touched
+        if profile.pixformat != self.pixformat:
+            sensor.set_pixformat(profile.pixformat)
+            self.pixformat = profile.pixformat
+            self.reconfigs += 1
+        if profile.framesize != self.framesize:
+            sensor.set_framesize(profile.framesize)  # Also drops the window
+            self.framesize = profile.framesize
+            self.reconfigs += 1
+            self.window = None
+        s = profile.scale
+        x0 = y0 = 1 << 16
+        x1 = y1 = 0
+        for key in profile.keys:
+            x, y, w, h = self.rois[key]
+            x0, y0 = min(x0, x), min(y0, y)
+            x1, y1 = max(x1, x + w), max(y1, y + h)
+        x0, y0 = x0 // s * s, y0 // s * s  # Align the origin to captured pixels
+        window = (x0 // s, y0 // s, (x1 - x0 + s - 1) // s, (y1 - y0 + s - 1) // s)
+        if window != self.window:
+            sensor.set_windowing(window)
+            self.window = window
+            self.switches += 1
+        self._origin = (x0, y0)
+        for key in profile.keys:
+            x, y, w, h = self.rois[key]
+            self._frame_rois[key] = ((x - x0) // s, (y - y0) // s, max(1, w // s), max(1, h // s))
+        self._pixels = max(1, self.pixels_threshold // (s * s))
+        self._area = max(1, self.area_threshold // (s * s))
+        self._scale = s
+        lut, step = self.lut, self.lut_step
+        self._gated = () if lut is None else tuple(
+            key for key in profile.keys
+            if key in lut.bits and self.strides[key][0] >= step[0] and self.strides[key][1] >= step[1])
+        self.profile = profile
+        self._dirty = False
+
+    def begin(self, profile, now=0):
+        # Take one snapshot with profile; its colours are searched by step()
+        if profile is not self.profile or self._dirty:
+            self.setup(profile)
+        self.img = sensor.snapshot()
+        if self._gated and self.pixformat == sensor.RGB565:
+            self.lut.classify(self.img, None, self.lut_step[0], self.lut_step[1])
+        self._keys = profile.keys
+        self._next = 0
+        self._time = now
+        for slot in self._work.values():
+            slot.clear()  # Colours not in the profile stay cleared so stale detections never leak
+
+    def step(self):
+        # Search the next colour of the current frame; publishes the frame and returns False when done
+        if self._next < len(self._keys):
+            key = self._keys[self._next]
+            self._next += 1
+            self._search(key, self._work[key])
+            if self._next < len(self._keys):
+                return True
+        self.slots, self._work = self._work, self.slots
+        self.frame_time = self._time
+        self.seq += 1
+        return False
+
+    def detect(self, profile, now=0):
+        # Capture and search every colour of profile on that single frame
+        self.begin(profile, now)
+        while self.step():
+            pass
+        return self
+
+    def _search(self, key, slot):
+        lut = self.lut
+        if key in self._gated and self.pixformat == sensor.RGB565 and not lut.seen & lut.bits[key]:
+            self.skipped += 1  # No sampled pixel of this colour anywhere in the window
+            return
+        x_stride, y_stride = self.strides[key]
+        blobs = self.img.find_blobs(self.th[key], roi=self._frame_rois[key], pixels_threshold=self._pixels,
+                                    area_threshold=self._area, merge=True, x_stride=x_stride, y_stride=y_stride)
+        if blobs:
+            # Take the largest blob for reliability
+            largest_blob = blobs[0]
+            for blob in blobs:
+                if blob.pixels() > largest_blob.pixels():
+                    largest_blob = blob
+            s = self._scale
+            slot.det = True
+            slot.cx = largest_blob.cx() * s + self._origin[0]  # Back to reference coordinates
+            slot.cy = largest_blob.cy() * s + self._origin[1]
+            slot.pixels = largest_blob.pixels() * s * s
+            slot.error = slot.cx - self.center  # Error from center
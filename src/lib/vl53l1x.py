@@ -0,0 +1,157 @@
+# vl53l1x.py
+# Continuous-ranging VL53L1X driver for the front ToF sensor, shared by open.py and obstacle.py.
+# MicroPython code.
+# The scripts used to read two bytes from register 0x1E of an unconfigured sensor: no distance mode, no timing
+# budget, no check that a new result was there and no range status, so a read could return an old or invalid
+# measurement. VL53L1X writes ST's default configuration (ultra lite driver), runs one calibration pass, sets the
+# distance mode, timing budget and inter-measurement period and leaves the sensor ranging continuously. read()
+# never waits: it checks the data-ready flag (one register read), fetches status and distance in one burst when a
+# result is ready and clears the interrupt, otherwise it returns the cached result. A result whose range status is
+# not valid, and a cached result older than stale_ms, read as -1, so a threshold test on the distance must accept
+# only distances >= 0.
+
+import pyb
+
+# Register map (16-bit indices)
+VHV_CONFIG_TIMEOUT = 0x0008  # VHV calibration loop bound
+VHV_CONFIG_INIT = 0x000B  # VHV start from the previous calibration
+CONFIG_START = 0x002D  # First register of DEFAULT_CONFIG
+GPIO_HV_MUX_CTRL = 0x0030  # Bit 4: interrupt polarity
+GPIO_TIO_HV_STATUS = 0x0031  # Bit 0: interrupt (data ready) line level
+RANGE_CONFIG_TIMEOUT_A = 0x005E
+RANGE_CONFIG_TIMEOUT_B = 0x0061
+INTERMEASUREMENT_PERIOD = 0x006C
+INTERRUPT_CLEAR = 0x0086
+MODE_START = 0x0087  # 0x40 continuous ranging, 0x00 stop
+RESULT_RANGE_STATUS = 0x0089  # First register of the result block, distance at offset 13
+RESULT_SIZE = 17
+OSC_CALIBRATE_VAL = 0x00DE
+FIRMWARE_SYSTEM_STATUS = 0x00E5  # 1 once booted
+
+# Default configuration of registers 0x2D..0x87 (ST ultra lite driver, long distance mode, interrupt active high)
+DEFAULT_CONFIG = bytes((
+    0x00, 0x00, 0x00, 0x01, 0x02, 0x00, 0x02, 0x08, 0x00, 0x08, 0x10, 0x01, 0x01, 0x00, 0x00, 0x00,
+    0x00, 0xff, 0x00, 0x0F, 0x00, 0x00, 0x00, 0x00, 0x00, 0x20, 0x0b, 0x00, 0x00, 0x02, 0x0a, 0x21,
+    0x00, 0x00, 0x05, 0x00, 0x00, 0x00, 0x00, 0xc8, 0x00, 0x00, 0x38, 0xff, 0x01, 0x00, 0x08, 0x00,
+    0x00, 0x01, 0xcc, 0x0f, 0x01, 0xf1, 0x0d, 0x01, 0x68, 0x00, 0x80, 0x08, 0xb8, 0x00, 0x00, 0x00,
+    0x00, 0x0f, 0x89, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01, 0x0f, 0x0d, 0x0e, 0x0e, 0x00,
+    0x00, 0x02, 0xc7, 0xff, 0x9B, 0x00, 0x00, 0x00, 0x01, 0x00, 0x00))
+
+# Distance mode -> (register, value, bytes) writes; long ranges to 4 m, short to 1.3 m with more ambient immunity
+DISTANCE_MODE = {
+    "short": ((0x004B, 0x14, 1), (0x0060, 0x07, 1), (0x0063, 0x05, 1), (0x0069, 0x38, 1), (0x0078, 0x0705, 2),
+              (0x007A, 0x0606, 2)),
+    "long": ((0x004B, 0x0A, 1), (0x0060, 0x0F, 1), (0x0063, 0x0D, 1), (0x0069, 0xB8, 1), (0x0078, 0x0F0D, 2),
+             (0x007A, 0x0E0E, 2)),
+}
+# Timing budget in ms -> (TIMEOUT_A, TIMEOUT_B) per distance mode
+TIMING_BUDGET = {
+    "short": {15: (0x001D, 0x0027), 20: (0x0051, 0x006E), 33: (0x00D6, 0x006E), 50: (0x01AE, 0x01E8),
+              100: (0x02E1, 0x0388), 200: (0x03E1, 0x0496), 500: (0x0591, 0x05C1)},
+    "long": {20: (0x001E, 0x0022), 33: (0x0060, 0x006E), 50: (0x00AD, 0x00C6), 100: (0x01CC, 0x01EA),
+             200: (0x02D9, 0x02F8), 500: (0x048F, 0x04A4)},
+}
+# Raw RESULT_RANGE_STATUS -> range status: 0 valid, 1 sigma fail, 2 signal fail, 4 out of bounds, 7 wrap-around,
+# 255 other
+RANGE_STATUS = bytes((255, 255, 255, 5, 2, 4, 1, 7, 3, 0, 255, 255, 9, 13, 255, 255, 255, 255, 10, 6, 255, 255,
+                      11, 12))
+VALID = 0
+
+
+class VL53L1X:
+    # VL53L1X in continuous ranging: configured once, read() returns the newest result without waiting
+    def __init__(self, i2c, address=0x29, mode="long", budget_ms=20, period_ms=25, stale_ms=100):
+        self.i2c = i2c
+        self.address = address
+        self.mode = mode  # Distance mode, key of DISTANCE_MODE
+        self.budget_ms = budget_ms  # Timing budget, key of TIMING_BUDGET[mode]
+        self.period_ms = max(period_ms, budget_ms + 4)  # Inter-measurement period, longer than the budget
+        self.stale_ms = stale_ms  # Older results read as -1
+        self._result = bytearray(RESULT_SIZE)  # Reused result block buffer
+        self._byte = bytearray(1)  # Reused single register buffer
+        self._word = bytearray(2)  # Reused word buffer
+        self._long = bytearray(4)  # Reused 32-bit buffer
+        self._active = 1  # Interrupt line level that flags data ready
+        self.running = False  # Ranging started
+        self.distance = -1  # Latest distance in mm, -1 when not valid
+        self.status = 255  # Range status of the latest result (RANGE_STATUS codes)
+        self.time_ms = 0  # pyb.millis() when the latest result was fetched
+        self.results = 0  # Results fetched
+        self.invalid = 0  # Results with a range status other than valid
+        self.stale = 0  # Reads answered -1 because the cached result was too old
+
+    def write_reg(self, reg, value, size=1):
+        # Write a big-endian value of size bytes
+        buf = self._byte if size == 1 else self._word if size == 2 else self._long
+        for i in range(size):
+            buf[i] = (value >> (8 * (size - 1 - i))) & 0xFF
+        self.i2c.writeto_mem(self.address, reg, buf, addrsize=16)
+
+    def read_reg(self, reg, size=1):
+        # Read a big-endian value of size bytes
+        buf = self._byte if size == 1 else self._word
+        self.i2c.readfrom_mem_into(self.address, reg, buf, addrsize=16)
+        return buf[0] if size == 1 else (buf[0] << 8) | buf[1]
+
+    def start(self, timeout_ms=500):
+        # Boot check, configuration and calibration pass, then continuous ranging; False when the sensor does not
+        # answer or boot within timeout_ms
+        t = pyb.millis()
+        try:
+            while self.read_reg(FIRMWARE_SYSTEM_STATUS) != 1:
+                if pyb.elapsed_millis(t) > timeout_ms:
+                    return False
+                pyb.delay(1)
+            self.i2c.writeto_mem(self.address, CONFIG_START, DEFAULT_CONFIG, addrsize=16)
+            self._active = 0 if self.read_reg(GPIO_HV_MUX_CTRL) & 0x10 else 1
+            self.write_reg(MODE_START, 0x40)  # One ranging pass runs the VHV calibration
+            while not self.data_ready():
+                if pyb.elapsed_millis(t) > timeout_ms:
+                    return False
+                pyb.delay(1)
+            self.write_reg(INTERRUPT_CLEAR, 0x01)
+            self.write_reg(MODE_START, 0x00)
+            self.write_reg(VHV_CONFIG_TIMEOUT, 0x09)  # Later passes reuse the calibration
+            self.write_reg(VHV_CONFIG_INIT, 0x00)
+            for reg, value, size in DISTANCE_MODE[self.mode]:
+                self.write_reg(reg, value, size)
+            timeout_a, timeout_b = TIMING_BUDGET[self.mode][self.budget_ms]
+            self.write_reg(RANGE_CONFIG_TIMEOUT_A, timeout_a, 2)
+            self.write_reg(RANGE_CONFIG_TIMEOUT_B, timeout_b, 2)
+            clock_pll = self.read_reg(OSC_CALIBRATE_VAL, 2) & 0x3FF
+            self.write_reg(INTERMEASUREMENT_PERIOD, int(clock_pll * self.period_ms * 1.075), 4)
+            self.write_reg(INTERRUPT_CLEAR, 0x01)
+            self.write_reg(MODE_START, 0x40)
+        except OSError:
+            return False
+        self.running = True
+        self.time_ms = pyb.millis()
+        return True
+
+    def data_ready(self):
+        # True when a new result waits in the result registers
+        return (self.read_reg(GPIO_TIO_HV_STATUS) & 0x01) == self._active
+
+    def poll(self):
+        # Fetch a ready result into the cache; True when there was one
+        if not self.running or not self.data_ready():
+            return False
+        r = self._result
+        self.i2c.readfrom_mem_into(self.address, RESULT_RANGE_STATUS, r, addrsize=16)
+        self.write_reg(INTERRUPT_CLEAR, 0x01)  # Arms the next result
+        raw = r[0] & 0x1F
+        self.status = RANGE_STATUS[raw] if raw < len(RANGE_STATUS) else 255
+        self.distance = (r[13] << 8) | r[14] if self.status == VALID else -1
+        if self.status != VALID:
+            self.invalid += 1
+        self.time_ms = pyb.millis()
+        self.results += 1
+        return True
+
+    def read(self):
+        # Newest distance in mm: a result that became ready, else the cached one; -1 when not valid or stale
+        self.poll()
+        if pyb.elapsed_millis(self.time_ms) > self.stale_ms:
+            self.stale += 1
+            return -1
+        return self.distance
@@ -9,128 +9,85 @@
 # detects magenta for parking, and performs maneuvers using PID for steering.
 
 import pyb
-from machine import Pin, UART, SPI, I2C
-import math
-import sensor
-
-# Initialize camera sensor
-sensor.reset()  # Reset camera settings
-sensor.set_pixformat(sensor.RGB565)  # Set pixel format to RGB565 for color detection
-sensor.set_framesize(sensor.QVGA)  # Set frame size to QVGA (320x240)
-sensor.set_vflip(True)  # Vertically flip the image for reverse mounting
-sensor.set_hmirror(True)  # Horizontally mirror the image for reverse mounting
-sensor.skip_frames(time=500)  # Skip initial frames to stabilize the sensor
-
-# Gyroscope setup (LSM6DSOX) for reading X-axis angular rate
-spi = SPI(5, baudrate=1000000, polarity=1, phase=1)  # Initialize SPI bus 5
-cs_pin = Pin("PF6", Pin.OUT_PP, Pin.PULL_UP)  # Chip select pin for gyro
-
-def read_gyro():
-    # Read low and high bytes from OUTX_L_G and OUTX_H_G registers
-    cs_pin.low()
-    spi.write(bytearray([0x28 | 0x80]))  # Address for OUTX_L_G with read bit
-    low = spi.read(1)[0]
-    spi.write(bytearray([0x29 | 0x80]))  # Address for OUTX_H_G with read bit
-    high = spi.read(1)[0]
-    cs_pin.high()
-    raw = (high << 8) | low  # Combine high and low bytes
-    if raw >= 32768:
-        raw -= 65536  # Convert to signed 16-bit value
-    return raw * 0.035  # Scale raw value to degrees per second (adjust scale factor based on sensitivity setting)
-
-# Front ToF sensor setup for obstacle distance
-i2c = I2C(2)  # Initialize I2C bus 2
-tof_address = 0x29  # Default address for VL53L1X front ToF sensor
-
-def read_distance():
-    # Read 2 bytes from register 0x1E (distance result)
-    result = i2c.readfrom_mem(tof_address, 0x1E, 2)
-    return (result[0] << 8) | result[1]  # Combine to get distance in mm
-
-# Servo setup for steering
+import uasyncio as asyncio
+from vision import ColorDetector, CaptureProfile
+from colorlut import ColorLUT
+from tracker import PillarTracker
+from pose import PoseEstimator
+from kernel import wrap180
+from pid import PID
+from speed import SpeedController
+from car import Car, boot_report, PROFILE_STAGES, P_LINK, P_GYRO, P_CAPTURE, P_BLOBS, P_LOG, P_CONTROL
+from tasks import Ticker, spawn, periodic
+from profiler import Profiler
+from telemetry import Recorder, InputTrace
+from statemachine import StateMachine, END
+
+# Loop timing profiler: microsecond samples per stage in a fixed ring buffer, dumped to flash at the end of the run
+prof = Profiler(PROFILE_STAGES, capacity=4096)
+
+# Telemetry: one 32-byte record per control tick, written to the SD card in blocks at state transitions.
+# The state table doubles as the state machine's name table: the index is the state id
+TELEMETRY_STATES = ('determine_direction', 'park1', 'park2', 'park3', 'no_color', 'no_color1', 'follow_color',
+                    'lost_color', 'pass_color', 'enter_park', 'u_turn1', 'u_turn2', 'u_turn3', 'end_park1',
+                    'end_park2', 'end_park3', 'end_park4', 'end_park5', 'end_park6', 'end_park7')
+(S_DETERMINE_DIRECTION, S_PARK1, S_PARK2, S_PARK3, S_NO_COLOR, S_NO_COLOR1, S_FOLLOW_COLOR, S_LOST_COLOR,
+ S_PASS_COLOR, S_ENTER_PARK, S_U_TURN1, S_U_TURN2, S_U_TURN3, S_END_PARK1, S_END_PARK2, S_END_PARK3,
+ S_END_PARK4, S_END_PARK5, S_END_PARK6, S_END_PARK7) = range(20)  # State ids, indices into TELEMETRY_STATES
+rec = Recorder(TELEMETRY_STATES, capacity=256)
+
+# Car hardware (lib/car.py): camera, IMU and heading integrator, front ToF, steering servo, drive motor, slave
+# link, start button and status LED; the servo pulse range is this car's
 SERVO_MIN = 1775  # Minimum pulse width for servo
 SERVO_CENTER = 2575  # Center pulse width
 SERVO_MAX = 3275  # Maximum pulse width
-servo_timer = pyb.Timer(4, freq=50)  # Timer for 50Hz PWM
-servo = servo_timer.channel(3, pyb.Timer.PWM, pin=pyb.Pin(2))  # PWM on used pin 2
-servo.pulse_width(SERVO_CENTER)  # Initialize to center
-
-def set_steering(pos):
-    # Convert position (0-480) to pulse width, clamped to min/max
-    pos = max(0, min(480, pos))
-    if pos < 240:
-        pulse = SERVO_CENTER - (240 - pos) * (SERVO_CENTER - SERVO_MIN) // 240
-    else:
-        pulse = SERVO_CENTER + (pos - 240) * (SERVO_MAX - SERVO_CENTER) // 240
-    servo.pulse_width(int(pulse))
-
-# Motor setup for drive
-motor_timer = pyb.Timer(1, freq=20000)  # High freq for smooth PWM
-motor_forward = motor_timer.channel(2, pyb.Timer.PWM, pin=Pin(3))  # Forward PWM on pin 3
-motor_reverse = motor_timer.channel(3, pyb.Timer.PWM, pin=Pin(6))  # Reverse PWM on pin 6
-
-def set_speed(speed):
-    # Set motor speed (-100 to 100), using PWM percent
-    speed = max(-100, min(100, int(speed)))
-    if speed > 0:
-        motor_forward.pulse_width_percent(100)
-        motor_reverse.pulse_width_percent(100 - speed)
-    elif speed == 0:
-        motor_forward.pulse_width_percent(100)
-        motor_reverse.pulse_width_percent(100)
-    else:
-        motor_forward.pulse_width_percent(100 + speed)
-        motor_reverse.pulse_width_percent(100)
-
-set_speed(0)  # Start stopped
-
-# UART for communication with slave MCU (sensors: left/right ToF, encoder)
-uart = UART(9, baudrate=115200, bits=8, parity=None, stop=1)
+car = Car(prof, SERVO_MIN, SERVO_CENTER, SERVO_MAX)
+heading, link = car.heading, car.link
+read_distance, set_steering, set_speed = car.read_distance, car.set_steering, car.set_speed
+wait_button, set_led = car.wait_button, car.set_led
 
 tof_left = 0  # Left ToF distance
 tof_right = 0  # Right ToF distance
 encoder = 0.0  # Encoder value (distance in mm)
-uart_buffer = b''  # Buffer for UART data
-
-def fetch_data(command, timeout=50):
-    # Send command to slave and parse response
-    global tof_left, tof_right, encoder, uart_buffer
-    uart.write(command)
-    if command in (b'z', b'p'): return True  # No response needed
-    start_time = pyb.millis()
-    while pyb.elapsed_millis(start_time) < timeout:
-        if uart.any():
-            uart_buffer += uart.read(uart.any())
-            if b'\n' in uart_buffer:
-                line, uart_buffer = uart_buffer.split(b'\n', 1)
-                if command == b'r' and line.count(b',') == 2:
-                    parts = line.split(b',')
-                    tof_left = int(parts[0])
-                    tof_right = int(parts[1])
-                    encoder = float(parts[2])
-                    return True
-    return False  # Timeout
-
-# Button for start
-button_pin = Pin('A0', Pin.IN, Pin.PULL_UP)
-def wait_button(release=True):
-    # Wait for button press (and release if specified)
-    while button_pin.value(): pyb.delay(1)
-    if release:
-        while not button_pin.value(): pyb.delay(1)
-
-# RGB LED for status
-led_pins = [pyb.Pin(p, pyb.Pin.OUT_PP) for p in ("PE3", "PC13", "PF4")]  # R, G, B pins
-def set_led(color):
-    # Set LED color based on string code (e.g., 'R' red, 'G' green, 'M' magenta, 'off')
-    led_pins[0].value(0 if color in 'ROMWY' else 1)  # Red on/low for certain colors
-    led_pins[1].value(0 if color in 'GOCWY' and (color != 'O' or pyb.millis() % 1 < 1) else 1)  # Green, with blink for 'O'
-    led_pins[2].value(0 if color in 'BCMW' else 1)  # Blue
+wheel_speed = 0.0  # Encoder speed in mm/s, edge-timed and filtered on the slave
+
+sensor_age = -1  # Age in ms of the sample behind the sensor globals
+
+def request_data():
+    # First phase of the split fetch: issue the request early so UART latency overlaps camera and gyro work
+    link.request()
+
+def collect_data():
+    # Second phase: copy the newest completed sample into the sensor globals (never waits)
+    global tof_left, tof_right, encoder, wheel_speed, sensor_age
+    fresh = link.collect()
+    tof_left = link.tof_left
+    tof_right = link.tof_right
+    encoder = link.distance()
+    wheel_speed = link.velocity()
+    sensor_age = link.age_ms()
+    return fresh
+
+def fetch_data(command):
+    # 'r' requests and collects in one go, 'z' resets the encoder,
+    # anything else is forwarded to the slave as a one-byte command
+    global encoder
+    if command == b'r':
+        request_data()
+        return collect_data()
+    if command == b'z':
+        link.reset_encoder()
+        encoder = 0.0
+        pose.reset_encoder()  # The pose keeps its own encoder reference across resets
+    else:
+        link.command(command)
+    return True
 
 # Camera parameters
 CAM_WIDTH = 316  # Effective width after windowing if applied
 CAM_HEIGHT = 115  # Effective height
 CAM_CENTER = CAM_WIDTH // 2  # Center for error calculation
+CAM_HFOV = 80  # Horizontal field of view in degrees
 TARGET_DIST = 150  # Target distance to obstacles in mm
 
 # Color thresholds in LAB for find_blobs (L_min, L_max, A_min, A_max, B_min, B_max)
@@ -142,17 +99,36 @@ th = {
     "M": [(40, 80, 60, 90, -20, 30)]  # Magenta for parking
 }
 
-def detect_region(color_key, roi=(0, 0, CAM_WIDTH, CAM_HEIGHT)):
-    # Use find_blobs to detect regions of the specified color threshold
-    # Returns error (deviation from center) and detection flag
-    img = sensor.snapshot()  # Capture image
-    blobs = img.find_blobs(th[color_key], roi=roi, pixels_threshold=200, area_threshold=200, merge=True)  # Find blobs with params
-    if blobs:
-        # Take the largest blob for reliability
-        largest_blob = max(blobs, key=lambda b: b.pixels())
-        center_x = largest_blob.cx()  # Centroid x
-        return center_x - CAM_CENTER, True  # Error from center
-    return 0, False  # No detection
+# Colour class table from tools/build_lut.py: colours with no pixel in a frame skip their find_blobs call
+try:
+    lut = ColorLUT.load("obstacle.lut")
+    if not lut.matches(th): lut = None  # Thresholds were tuned after the table was built
+except (OSError, ValueError):
+    lut = None
+# Single-snapshot detector: one frame per tick, every requested colour searched in that frame
+detector = ColorDetector(th, CAM_WIDTH, CAM_HEIGHT, CAM_CENTER, pixels_threshold=200, area_threshold=200, lut=lut)
+# Input trace: what every control tick reads (heading, encoder, ToF, detections), replayed by tools/replay.py
+trace = InputTrace(TELEMETRY_STATES, tuple(th), capacity=128)
+car.trace = trace  # Front ToF readings are traced too
+# Capture profiles: each vision job captures only the bounding box of its colours' search regions, and the corner
+# lines are large enough for a coarse find_blobs seed scan
+CORNER_PROFILE = CaptureProfile("corner", ("OB", "R", "G", "M"))  # Colours searched when a corner may be counted
+PILLAR_PROFILE = CaptureProfile("pillar", ("R", "G", "M"))  # Colours searched during corner cooldown
+PARK_PROFILE = CaptureProfile("park", ("M",))  # Colours searched while parking
+# Search bands in the 316 x 115 window, read off example_all_detection.jpg (this window on the car): the far wall
+# fills rows 0-14, pillars and parking walls at the far wall reach from the window top to rows 17-23, and a corner
+# line in mid-field lies in rows 49-71. Standing objects are searched from the top down to row 64, which holds
+# the far ones whole and the upper part of near ones; the corner lines are searched on the floor below the far
+# wall. The pillar job therefore captures the upper 64 rows only
+PILLAR_BAND = (0, 0, CAM_WIDTH, 64)
+LINE_BAND = (0, 12, CAM_WIDTH, CAM_HEIGHT - 12)
+for key in ("R", "G", "M"):
+    detector.set_region(key, PILLAR_BAND)
+detector.set_region("OB", LINE_BAND)
+detector.set_stride("OB", 4, 2)
+# Pillar tracks: red and green are searched in a box around their predicted position; a turn to the right moves
+# the pillars left in the image by CAM_WIDTH / CAM_HFOV pixels per degree
+tracker = PillarTracker(detector, ("R", "G"), -CAM_WIDTH / CAM_HFOV)
 
 # Navigation parameters
 outer_dist = 30  # Pixel offset for outer obstacles
@@ -162,384 +138,585 @@ max_turn_tol = 80  # Max tolerance for passing obstacles
 corner_count = 0  # Track corners navigated
 direction = 0  # 1 for CW, -1 for CCW
 corner_cd = 2000  # Min time ms between corner detections
-last_corner_time = pyb.millis()  # Last corner detection time
+last_corner_time = 0  # Last corner detection time (set at the start)
 min_ps, max_ps = 15, 30  # Partial speeds
 min_fs, max_fs = 35, 45  # Full speeds
 min_ms, min_ws = 15, 20  # Maneuver/wall speeds
-current_speed = min_ps  # Current motor speed
+# Speed ramps in duty percent per s: the old per-tick steps (1 in the start manoeuvre, 2 elsewhere) over the
+# section's tuned tick period (GYRO_T, CAMERA_T and PARK_T below)
+START_ACCEL = 55  # Sections 1 park1/park2
+GYRO_ACCEL = 110  # park3 and section 2.5
+CAMERA_ACCEL = 37  # Section 2
+PARK_ACCEL = 110  # Section 3
+drive = SpeedController(set_speed)  # Speed ramp on duty targets, open loop until a motor fit is passed
 target_speed = max_ps  # Target speed for ramp
-state = 'determine_direction'  # State machine start
 target_heading = 0  # Desired heading
+heading_diff = 0  # Target heading minus current heading
 last_heading = 0  # Last target
 lost_heading = 0  # Heading when lost color
 cam_error = 0  # Camera position error
 heading_error = 0  # Heading error
+detected = False  # A colour was seen in the last consumed frame
 last_color = None  # Last detected color (0 red, 1 green)
 no_color_count = 0  # Counter for no color detection
 
-# PID parameters
-kp, ki, kd = 2, 0.001, 0.1  # Gains
-pid_integral = 0  # Integral term
-last_error = 0  # Last error for derivative
+# PID parameters: the gains were tuned with one blocking loop per section, whose tick period is the fourth element
+# of every gain tuple. The periods are the mean tick of the tuned script in the host simulator with the tuned slave's
+# text request and delay(15) loop modelled (tools/run_sim.py --slave baseline); to be confirmed on the car
+GYRO_T = 18  # Sections 1 and 2.5: slave request only, paced by the slave loop
+CAMERA_T = 54  # Section 2: three or four QVGA snapshots per tick
+PARK_T = 18  # Section 3: one snapshot per tick, within the slave loop
+pid = PID((2, 0.001, 0.1, GYRO_T))  # Steering PID on the measured tick period, (kp, ki, kd, T) of the last handler
+error = 0  # Steering error fed to the PID
 
 angle = 0.0  # Current angle from gyro integration
-odometry_x = 0.0  # Odometry X position
-odometry_y = 0.0  # Odometry Y position
-last_enc = 0.0  # Last encoder value
+odometry_x = 0.0  # Estimated X position in mm (along the start heading)
+odometry_y = 0.0  # Estimated Y position in mm (right of the start heading)
+# Pose estimator (EKF): encoder and gyro prediction, corrected by the side walls and the corner lines
+pose = PoseEstimator()
 
-# Wait for slave ready
-start = pyb.millis()
-while pyb.elapsed_millis(start) < 10000:
-    if uart.any() and uart.read(1) == b'\x01': break
-uart.read(uart.any())  # Clear buffer
+boot_report("obstacle.py")  # Setup done: time since reset and heap use
+
+car.wait_slave()  # Wait for slave ready, then switch it to push mode
 
 fetch_data(b'r')  # Initial fetch
 
 # ---------- IMU CALIBRATION ------------
-# Perform 10-second gyroscope calibration to determine zero offset
-# This collects gyro samples to calculate average drift and improve heading accuracy
-calibration_samples = 1000
-calibration_sum = 0.0
-calibration_count = 0
-calibration_start = pyb.millis()
-
-while calibration_count < calibration_samples and pyb.elapsed_millis(calibration_start) < 10000:
-    gyro_sample = read_gyro()
-    calibration_sum += gyro_sample
-    calibration_count += 1
-    pyb.delay(10)  # 10ms between samples
-
-if calibration_count > 0:
-    gyro_zero_offset = calibration_sum / calibration_count
-else:
-    gyro_zero_offset = 0.0
+# Adaptive zero-rate calibration (Car.calibrate, lib/calibration.py): stops as soon as the bias estimate of the
+# still car converges, and a warm restart reuses the cached bias of a recent run at a similar temperature
+gyro_zero_offset = car.calibrate()
 
 set_led("B")  # Blue LED for waiting
 wait_button()  # Wait for start button
 set_led("off")  # Off after start
 
 fetch_data(b'z')  # Reset slave
+heading.bias = gyro_zero_offset  # Subtract the calibrated zero offset during integration
+heading.start()  # Flush the FIFO and begin integrating from 0 degrees
+pose.start()  # Pose origin at the start position
 start = pyb.millis()
+last_corner_time = start - corner_cd  # A corner counts from the start, whatever calibration and the button took
+try:
+    rec.open("telemetry.bin")  # Lands on the SD card when one is mounted; host decoder: tools/telemetry_decode.py
+    trace.open("trace.bin", start)  # Replay aligns its clock to start
+except OSError:
+    pass  # No writable filesystem: the run goes on without a log
 last_time = pyb.millis()
 error_flag = 0
 
-try:
+# Task periods: each stage runs at its own rate and shares state through the globals above
+SENSOR_PERIOD_MS = 5  # Slave link and gyro FIFO
+CONTROL_PERIOD_MS = 10  # State machine, steering and motor commands
+dt = CONTROL_PERIOD_MS / 1000.0  # Measured period of the current control tick in s (PID)
+LED_PERIOD_MS = 50  # Status LED
+vision_profile = None  # Capture profile of the vision task's next frame (set by control, None pauses capture)
+led_color = "off"  # Colour shown by the LED task
+
+def sensor_step():
+    # Sensor task: take the newest slave sample, request the next one and integrate the gyro FIFO
+    global angle
+    t = prof.start()
+    collect_data()
+    request_data()
+    prof.stop(P_LINK, t)
+    t = prof.start()
+    heading.update()
+    angle = heading.angle
+    prof.stop(P_GYRO, t)
+
+async def vision_task():
+    # Vision task: free-running single-snapshot detection, yielding between colours so control keeps its rate
+    while True:
+        if vision_profile is not None:
+            t = prof.start()
+            detector.begin(vision_profile, pyb.millis())
+            prof.stop(P_CAPTURE, t)
+            while True:
+                t = prof.start()
+                searching = detector.step()
+                prof.stop(P_BLOBS, t)
+                if not searching:
+                    break
+                await asyncio.sleep_ms(0)
+            await asyncio.sleep_ms(0)
+        else:
+            await asyncio.sleep_ms(CONTROL_PERIOD_MS)
+
+def odometry_step():
+    # Pose estimate and wheel speed of this tick: predict from the encoder and gyro, then correct with the side walls
+    global odometry_x, odometry_y
+    pose.predict(encoder, angle)
+    pose.sides(tof_left, tof_right)
+    drive.measure(wheel_speed)
+    odometry_x = pose.x
+    odometry_y = pose.y
+
+def trace_tick(now):
+    # Record the inputs of the control tick starting at now (host replay: tools/replay.py wakes the tick at now)
+    t = prof.start()
+    trace.tick(now, sm.name, angle, encoder, wheel_speed, tof_left, tof_right, detector)
+    prof.stop(P_LOG, t)
+
+def log_tick():
+    # Append the state, pose, sensors and commands of this control tick to the telemetry block
+    t = prof.start()
+    rec.set_state(sm.name)
+    rec.record(pyb.millis(), car.speed_cmd, cam_error, angle, odometry_x, odometry_y, encoder,
+               tof_left, tof_right, car.tof_front, car.steer_cmd)
+    prof.stop(P_LOG, t)
+
+def led_step():
+    # LED task: show the status colour chosen by control
+    set_led(led_color)
+
+def pid_steer(base=0):
+    # PID step on the global error over the measured tick period, with the gains of the last handler that ran;
+    # base is added in front
+    return pid.step(error, dt, base)
+
+# ---------- STATE HANDLERS ------------
+# Each handler runs once per control tick while its state is current, with the parameter tuple registered for
+# the state below (p[0] is always the (kp, ki, kd, T) gains, switched by pid.use). Transition-only work lives in the
+# enter hooks.
+
+# Section 1: direction determination and initial maneuver
+def determine_direction(p):
+    # Compare left and right ToF to set direction (smaller left: CW, else CCW)
+    global direction
+    if tof_left > 0 and tof_right > 0:
+        direction = 1 if tof_left < tof_right else -1
+        set_steering(0 if direction == 1 else 480)
+    elif direction == 0 and pyb.elapsed_millis(start) > 2000:
+        direction = -1
+        set_steering(480)
+    if direction != 0:
+        sm.go(S_PARK1)
+
+def enter_park1():
+    # Reverse out of the start position
+    global target_speed
+    drive.ref = -min_ps
+    target_speed = -max_ps
+
+def park1(p):
+    # Small initial turn (24 degrees) to align
+    global heading_error, target_speed
+    heading_error = wrap180(((direction * 24) % 360) - angle)
+    if drive.ref == target_speed: target_speed = -min_ps
+    set_steering(0 if direction == 1 else 480)
+    drive.update(target_speed, dt, START_ACCEL)
+    if abs(heading_error) < turn_tol:
+        sm.go(S_PARK2)
+
+def enter_park2():
+    global target_speed
+    drive.ref = min_ps
+    target_speed = max_ps
+
+def park2(p):
+    # Continue to 90 degrees turn
+    global heading_error
+    heading_error = wrap180(((direction * 90) % 360) - angle)
+    set_steering(480 if direction == 1 else 0)
+    drive.update(target_speed, dt, START_ACCEL if abs(heading_error) < 30 else 0)  # Hold the speed until then
+    if abs(heading_error) < 15:
+        sm.go(S_PARK3)
+
+def enter_park3():
+    fetch_data(b'z')  # Encoder distance of the straight-out run starts here
+
+def park3(p):
+    # Fine-tune the 90 degree turn with PID
+    global heading_error, error, no_color_count, target_speed
+    heading_error = wrap180(((direction * 90) % 360) - angle)
+    pid.use(p[0])
+    error = heading_error
+    if encoder >= 50:
+        no_color_count = 0  # Reset for main loop
+        sm.go(S_NO_COLOR1 if direction == 1 else S_NO_COLOR)
+        target_speed = max_fs
+        return END
+    steer = pid_steer()
+    drive.update(target_speed, dt, GYRO_ACCEL)
+    set_steering(240 + steer)
+
+# Section 2: main navigation, params (gains, target speed)
+def no_color(p):
+    # Basic navigation with obstacle scanning
+    global error
+    pid.use(p[0])
+    error = heading_diff * 1.2
+    if detected and abs(cam_error) < 45: sm.go(S_FOLLOW_COLOR)
+
+def follow_color(p):
+    # Object following with balanced control
+    global error
+    pid.use(p[0])
+    error = cam_error * 0.25 + heading_diff * 0.15
+    if not detected:
+        if no_color_count > 2: sm.go(S_LOST_COLOR)
+
+def lost_color(p):
+    # Search pattern with memory of last position
+    global error
+    pid.use(p[0])
+    search_offset = 15 * (1 if last_color == 0 else -1)
+    error = heading_diff + search_offset
+    if detected: sm.go(S_FOLLOW_COLOR)
+    elif no_color_count > 6: sm.go(S_PASS_COLOR)
+
+def pass_color(p):
+    # Large maneuver with progressive adjustment
+    global error
+    pid.use(p[0])
+    avoidance_angle = 35 * (-1 if last_color == 0 else 1)
+    error = heading_diff + avoidance_angle
+    if abs(heading_diff) < 12: sm.go(S_NO_COLOR)
+
+# Section 2.5: 180 degree U-turn on the absolute gyro angle, params (gains, base steering, target speed)
+def enter_u_turn1():
+    global target_speed, vision_profile
+    fetch_data(b'z')
+    target_speed = max_fs
+    vision_profile = None  # No camera work during the U-turn
+
+def u_turn_step(p):
+    # Shared U-turn tick: strong base steering toward 180 degrees plus PID on the heading error
+    global error, target_speed
+    pid.use(p[0])
+    error = heading_error
+    target_speed = p[2]
+    steer = pid_steer(p[1] if heading_error > 0 else -p[1])
+    drive.update(target_speed, dt, GYRO_ACCEL)
+    set_steering(240 + steer)
+
+def u_turn1(p):
+    # Initial turn entry with aggressive steering to establish rotation toward 180 degrees
+    u_turn_step(p)
+    if abs(heading_error) < 120:  # 60 degrees of progress
+        sm.go(S_U_TURN2)
+
+def enter_u_turn2():
+    pid.integral = 0.0  # Reset I for main turn phase
+
+def u_turn2(p):
+    # Main turning phase with reduced base steering as the target approaches
+    u_turn_step(p)
+    if abs(heading_error) < 45:
+        sm.go(S_U_TURN3)
+
+def enter_u_turn3():
+    global target_speed
+    target_speed = min_ps  # Reduce speed for precise alignment
+
+def u_turn3(p):
+    # Final alignment with pure PID to exactly 180 degrees, then reverse the travel direction
+    global direction, target_heading, target_speed
+    u_turn_step(p)
+    if abs(heading_error) < turn_tol:
+        direction = -direction
+        target_heading = 180  # Facing 180 degrees
+        fetch_data(b'z')  # Reset slave encoders
+        sm.go(S_END_PARK1)
+        target_speed = max_fs
+        return END
+
+# Section 3: parking, params (gains, steering sign of the shared PID step, 0 = handler steers itself)
+def end_park1(p):
+    # Approach and follow magenta wall
+    global error
+    pid.use(p[0])
+    error = heading_diff + cam_error * 0.4
+    if abs(heading_error) < turn_tol and encoder > 50 and not detector["M"].det:
+        sm.go(S_END_PARK2)
+
+def enter_end_park2():
+    fetch_data(b'p')  # Pause slave if needed
+    pose.mark()
+
+def end_park2(p):
+    # Continue forward using the pose estimate after passing magenta
+    global error
+    pid.use(p[0])
+    error = heading_diff
+    if pose.forward() > 450:  # 450 mm past the end of the magenta wall
+        sm.go(S_END_PARK3)
+
+def enter_end_park3():
+    global target_heading
+    target_heading = (direction * 90 * 2) % 360
+
+def end_park3(p):
+    # Turn into the spot based on angle
+    global error
+    pid.use(p[0])
+    error = heading_diff
+    if abs(heading_diff) < 10:
+        sm.go(S_END_PARK4)
+
+def enter_end_park4():
+    fetch_data(b'p')
+    pose.mark()
+
+def end_park4(p):
+    # Adjust forward position with the pose estimate; p[2] holds the CCW gains
+    global error
+    pid.use(p[0] if direction == 1 else p[2])
+    error = heading_diff
+    if pose.forward() > (62.5 if direction == 1 else 170):
+        sm.go(S_END_PARK5)
+
+def end_park5(p):
+    # Reverse turn for parallel alignment
+    global heading_error
+    heading_error = wrap180(target_heading - (direction * 73) - angle)
+    set_steering(0 if direction == 1 else 480)
+    drive.update(target_speed, dt, PARK_ACCEL)
+    if abs(heading_error) < 30:
+        sm.go(S_END_PARK6)
+
+def enter_end_park6():
+    global target_speed
+    drive.ref = -min_ps
+    target_speed = -min_ps
+
+def end_park6(p):
+    # Final reverse using angle
+    global heading_error, error
+    heading_error = wrap180(target_heading - (direction * 73) - angle)
+    pid.use(p[0])
+    error = heading_error
+    if abs(heading_error) < turn_tol:
+        sm.go(S_END_PARK7)
+
+def end_park7(p):
+    # Straighten and stop
+    global heading_error
+    heading_error = heading_diff
+    set_steering(0 if direction == 1 else 480)
+    drive.update(target_speed, dt, PARK_ACCEL)
+    if abs(heading_error) < 7:
+        set_speed(0)
+        set_steering(240)
+        return END
+
+# State table: gains and speed targets are built once here instead of on every tick
+sm = StateMachine(TELEMETRY_STATES, S_DETERMINE_DIRECTION)
+sm.add(S_DETERMINE_DIRECTION, determine_direction)
+sm.add(S_PARK1, park1, enter=enter_park1)
+sm.add(S_PARK2, park2, enter=enter_park2)
+sm.add(S_PARK3, park3, ((2, 0.001, 0.5, GYRO_T),), enter=enter_park3)
+sm.add(S_NO_COLOR, no_color, ((1.2, 0.003, 0.35, CAMERA_T), max_fs))
+sm.add(S_NO_COLOR1, no_color, ((1.2, 0.003, 0.35, CAMERA_T), max_fs))
+sm.add(S_FOLLOW_COLOR, follow_color, ((1.1, 0.002, 0.6, CAMERA_T), max_fs))
+sm.add(S_LOST_COLOR, lost_color, ((1.3, 0.002, 0.4, CAMERA_T), min_fs))
+sm.add(S_PASS_COLOR, pass_color, ((1.4, 0.001, 1.2, CAMERA_T), min_fs))
+sm.add(S_ENTER_PARK, None, (None, max_fs))  # Keeps steering on the previous state's error and gains
+sm.add(S_U_TURN1, u_turn1, ((2.5, 0.001, 1.5, GYRO_T), 120, min_fs), enter=enter_u_turn1)
+sm.add(S_U_TURN2, u_turn2, ((2.0, 0.001, 1.2, GYRO_T), 80, min_fs), enter=enter_u_turn2)
+sm.add(S_U_TURN3, u_turn3, ((3.0, 0.001, 2.0, GYRO_T), 0, min_ps), enter=enter_u_turn3)
+sm.add(S_END_PARK1, end_park1, ((3, 0.001, 3, PARK_T), 1))
+sm.add(S_END_PARK2, end_park2, ((1, 0.001, 0.5, PARK_T), 1), enter=enter_end_park2)
+sm.add(S_END_PARK3, end_park3, ((3, 0.001, 3, PARK_T), 1), enter=enter_end_park3)
+sm.add(S_END_PARK4, end_park4, ((2.5, 0.001, 3, PARK_T), 1, (3.5, 0.001, 4, PARK_T)), enter=enter_end_park4)
+sm.add(S_END_PARK5, end_park5, (None, 0))
+sm.add(S_END_PARK6, end_park6, ((2, 0.001, 2, PARK_T), -1), enter=enter_end_park6)
+sm.add(S_END_PARK7, end_park7, (None, 0))
+
+async def control_task():
+    # Control task: the navigation sections, run every CONTROL_PERIOD_MS on the freshest shared state
+    global corner_count, last_corner_time, target_speed, target_heading, heading_diff
+    global heading_error, cam_error, last_color, no_color_count, detected
+    global last_time, dt, vision_profile, led_color
+    ticker = Ticker(CONTROL_PERIOD_MS)
     # Section 1: Direction Determination and Initial Maneuver
     # This loop determines the driving direction (CW or CCW) based on side ToF distances.
     # It performs an initial parking-like maneuver to align the vehicle.
     # States: 'determine_direction' -> 'park1' -> 'park2' -> 'park3'
     # Uses ToF to decide direction, then adjusts steering and speed to turn 90 degrees.
     while True:
-        fetch_data(b'r')
+        await ticker.wait()
         now = pyb.millis()
+        trace_tick(now)
+        prof.set_state(sm.name)
+        t_tick = prof.start()
         dt = (now - last_time) / 1000.0
         last_time = now
-        gyro = read_gyro()
-        angle += gyro * dt
-        delta_enc = encoder - last_enc
-        last_enc = encoder
-        odometry_x += delta_enc * math.cos(math.radians(angle))
-        odometry_y += delta_enc * math.sin(math.radians(angle))
-        if state == 'determine_direction':
-            # Compare left and right ToF to set direction (smaller left: CW, else CCW)
-            if tof_left > 0 and tof_right > 0:
-                direction = 1 if tof_left < tof_right else -1
-                set_steering(0 if direction == 1 else 480)
-            elif direction == 0 and pyb.elapsed_millis(start) > 2000:
-                direction = -1
-                set_steering(480)
-            if direction != 0:
-                pyb.delay(5)
-                current_speed = -min_ps
-                target_speed = -max_ps
-                state = 'park1'
-        elif state == 'park1':
-            # Small initial turn (24 degrees) to align
-            heading_error = ((((direction * 24) % 360) - angle + 180) % 360) - 180
-            if abs(target_speed - current_speed) == 0: target_speed = -min_ps
-            current_speed += min(1, max(-1, target_speed - current_speed))
-            set_steering(0 if direction == 1 else 480)
-            set_speed(current_speed)
-            if abs(heading_error) < turn_tol:
-                current_speed = min_ps
-                target_speed = max_ps
-                state = 'park2'
-        elif state == 'park2':
-            # Continue to 90 degrees turn
-            heading_error = ((((direction * 90) % 360) - angle + 180) % 360) - 180
-            if abs(heading_error) < 30: current_speed += min(1, max(-1, target_speed - current_speed))
-            set_steering(480 if direction == 1 else 0)
-            set_speed(current_speed)
-            if abs(heading_error) < 15:
-                fetch_data(b'z')
-                state = 'park3'
-        elif state == 'park3':
-            # Fine-tune the 90 degree turn with PID
-            heading_error = ((((direction * 90) % 360) - angle + 180) % 360) - 180
-            kp, ki, kd = 2, 0.001, 0.5
-            error = heading_error
-            if encoder >= 50:
-                no_color_count = 0  # Reset for main loop
-                state = 'no_color1' if direction == 1 else 'no_color'
-                target_speed = max_fs
-                break
-            pid_integral = max(-100, min(100, pid_integral + error * ki))
-            steer = error * kp + pid_integral + (error - last_error) * kd
-            last_error = error
-            current_speed += min(2, max(-2, target_speed - current_speed))
-            set_speed(current_speed)
-            set_steering(240 + steer)
+        odometry_step()
+        if sm.step():
+            log_tick()
+            break
+        log_tick()
+        prof.stop(P_CONTROL, t_tick)
     # Section 2: Main Navigation Loop
     # Navigates the course, detecting and avoiding obstacles.
     # Uses camera to detect colors, adjusts path based on color and direction.
     # Tracks corners using orange/blue detection with cooldown.
     # States: 'no_color', 'follow_color', 'lost_color', 'pass_color'
     # Transitions to U-turn when 13 corners reached.
+    # Vision results are consumed once per published frame; control ticks in between reuse them.
+    vision_seq = detector.seq
+    detected = False
+    vision_profile = CORNER_PROFILE
     while True:
-        fetch_data(b'r')
+        await ticker.wait()
         now = pyb.millis()
+        trace_tick(now)
+        prof.set_state(sm.name)
+        t_tick = prof.start()
         dt = (now - last_time) / 1000.0
         last_time = now
-        gyro = read_gyro()
-        angle += gyro * dt
-        delta_enc = encoder - last_enc
-        last_enc = encoder
-        odometry_x += delta_enc * math.cos(math.radians(angle))
-        odometry_y += delta_enc * math.sin(math.radians(angle))
-        heading_diff = ((target_heading - angle + 180) % 360) - 180
-        if pyb.elapsed_millis(last_corner_time) > corner_cd:
-            ob_error, ob_det = detect_region("OB")
-            if ob_det:
-                corner_count += 1
-                last_corner_time = pyb.millis()
-                pid_integral = 0
-                if corner_count < 13: target_heading = (direction * 90 * corner_count) % 360
-                heading_diff = ((target_heading - angle + 180) % 360) - 180
-        red_error, red_det = detect_region("R")
-        green_error, green_det = detect_region("G")
-        magenta_error, mag_det = detect_region("M")
-        detected = False
-        if red_det or green_det or mag_det:
-            detected = True
-            no_color_count = 0
-            if red_det:
-                offset = outer_dist if direction == -1 else inner_dist
-                cam_error = red_error - (CAM_CENTER - offset)  # Keep red on left (offset -30 px)
-                last_color = 0
-            elif green_det:
-                offset = inner_dist if direction == -1 else outer_dist
-                cam_error = green_error - (CAM_CENTER + offset)  # Keep green on right (offset +30 px)
-                last_color = 1
-            elif mag_det:
-                offset = inner_dist if direction == -1 else -inner_dist  # CCW: right, CW: left
-                cam_error = magenta_error - (CAM_CENTER + offset)
-            state = 'follow_color'
-            if mag_det and read_distance() < 100: state = 'enter_park'
-        else: no_color_count += 1
+        odometry_step()
+        heading_diff = wrap180(target_heading - angle)
+        # Corner markers are only searched once the cooldown has elapsed
+        corner_ready = pyb.elapsed_millis(last_corner_time) > corner_cd
+        vision_profile = CORNER_PROFILE if corner_ready else PILLAR_PROFILE
+        if detector.seq != vision_seq:
+            vision_seq = detector.seq
+            frame = detector
+            if corner_ready:
+                ob_det = frame["OB"].det
+                if ob_det:
+                    corner_count += 1
+                    last_corner_time = pyb.millis()
+                    pid.integral = 0.0
+                    pose.corner()  # Along-track fix against the same corner line on earlier laps
+                    if corner_count < 13: target_heading = (direction * 90 * corner_count) % 360
+                    heading_diff = wrap180(target_heading - angle)
+            # The tracks only aim the next frame's red/green search boxes; the sections below act on this frame's
+            # detections with the frame counts they were tuned with on the car
+            tracker.update(angle)
+            red_error, red_det = frame["R"].error, frame["R"].det
+            green_error, green_det = frame["G"].error, frame["G"].det
+            magenta_error, mag_det = frame["M"].error, frame["M"].det
+            detected = False
+            if red_det or green_det or mag_det:
+                detected = True
+                no_color_count = 0
+                if red_det:
+                    offset = outer_dist if direction == -1 else inner_dist
+                    cam_error = red_error - (CAM_CENTER - offset)  # Keep red on left (offset -30 px)
+                    last_color = 0
+                elif green_det:
+                    offset = inner_dist if direction == -1 else outer_dist
+                    cam_error = green_error - (CAM_CENTER + offset)  # Keep green on right (offset +30 px)
+                    last_color = 1
+                elif mag_det:
+                    offset = inner_dist if direction == -1 else -inner_dist  # CCW: right, CW: left
+                    cam_error = magenta_error - (CAM_CENTER + offset)
+                sm.go(S_FOLLOW_COLOR)
+                if mag_det and 0 <= read_distance() < 100: sm.go(S_ENTER_PARK)
+            else: no_color_count += 1
         if corner_count >= 13:
-            fetch_data(b'z')
-            state = 'u_turn1'  # Start U-turn maneuver after 3 full laps
-            target_speed = max_fs
+            sm.go(S_U_TURN1)  # Start U-turn maneuver after 3 full laps
+            log_tick()
             break
-        if state in ('no_color', 'no_color1'):
-            # Basic navigation with obstacle scanning
-            kp, ki, kd = 1.2, 0.003, 0.35
-            error = heading_diff * 1.2
-            if detected and abs(cam_error) < 45: state = 'follow_color'
-        elif state == 'follow_color':
-            # Object following with balanced control
-            kp, ki, kd = 1.1, 0.002, 0.6
-            error = cam_error * 0.25 + heading_diff * 0.15
-            if not detected: 
-                if no_color_count > 2: state = 'lost_color'
-        elif state == 'lost_color':
-            # Search pattern with memory of last position
-            kp, ki, kd = 1.3, 0.002, 0.4
-            search_offset = 15 * (1 if last_color == 0 else -1)
-            error = heading_diff + search_offset
-            if detected: state = 'follow_color'
-            elif no_color_count > 6: state = 'pass_color'
-        elif state == 'pass_color':
-            # Large maneuver with progressive adjustment
-            kp, ki, kd = 1.4, 0.001, 1.2
-            avoidance_angle = 35 * (-1 if last_color == 0 else 1)
-            error = heading_diff + avoidance_angle
-            if abs(heading_diff) < 12: state = 'no_color'
-        target_speed = min_fs if state in ('lost_color', 'pass_color') else max_fs
-        set_led("R" if last_color == 0 else "G" if detected else "off")
-        pid_integral = max(-100, min(100, pid_integral + error * ki))
-        steer = error * kp + pid_integral + (error - last_error) * kd
-        last_error = error
-        current_speed += min(2, max(-2, target_speed - current_speed))
-        set_speed(current_speed)
+        sm.step()
+        target_speed = sm.param[1]
+        led_color = "R" if last_color == 0 else "G" if detected else "off"
+        steer = pid_steer()
+        drive.update(target_speed, dt, CAMERA_ACCEL)
         set_steering(240 + steer)
+        log_tick()
+        prof.stop(P_CONTROL, t_tick)
     # Section 2.5: 180° U-Turn Maneuver
     # This loop performs a 180-degree turn to reverse direction after completing the rectangular course.
     # It uses absolute gyro angle targeting 180° regardless of starting orientation.
     # States: 'u_turn1' -> 'u_turn2' -> 'u_turn3'
     # Uses aggressive steering initially, then PID for precise alignment to 180°.
     while True:
-        fetch_data(b'r')
+        await ticker.wait()
         now = pyb.millis()
+        trace_tick(now)
+        prof.set_state(sm.name)
+        t_tick = prof.start()
         dt = (now - last_time) / 1000.0
         last_time = now
-        gyro = read_gyro()
-        angle += gyro * dt
+        odometry_step()
         # Calculate heading error to absolute 180° target
-        heading_error = (((180 - angle + 180) % 360) - 180)
-        if state == 'u_turn1':
-            # Initial turn entry with aggressive steering to establish rotation toward 180°
-            kp, ki, kd = 2.5, 0.001, 1.5
-            error = heading_error
-            target_speed = min_fs  # Controlled speed for maneuver
-            # Apply strong steering in the shortest direction to 180°
-            base_steer = 120 if heading_error > 0 else -120  # Steer toward 180°
-            pid_integral = max(-100, min(100, pid_integral + error * ki))
-            steer = base_steer + error * kp + pid_integral + (error - last_error) * kd
-            last_error = error
-            current_speed += min(2, max(-2, target_speed - current_speed))
-            set_speed(current_speed)
-            set_steering(240 + steer)
-            # Transition when 60° progress achieved
-            if abs(heading_error) < 120:
-                state = 'u_turn2'
-                pid_integral = 0  # Reset I for main turn phase
-        elif state == 'u_turn2':
-            # Main turning phase with maintained steering toward 180°
-            kp, ki, kd = 2.0, 0.001, 1.2
-            error = heading_error
-            target_speed = min_fs
-            # Maintain steering with reduced aggression as we approach target
-            base_steer = 80 if heading_error > 0 else -80
-            pid_integral = max(-100, min(100, pid_integral + error * ki))
-            steer = base_steer + error * kp + pid_integral + (error - last_error) * kd
-            last_error = error
-            current_speed += min(2, max(-2, target_speed - current_speed))
-            set_speed(current_speed)
-            set_steering(240 + steer)
-            # Transition when close to target (within 45 degrees)
-            if abs(heading_error) < 45:
-                state = 'u_turn3'
-                target_speed = min_ps  # Reduce speed for precise alignment
-        elif state == 'u_turn3':
-            # Final alignment with precise control to exact 180°
-            kp, ki, kd = 3.0, 0.001, 2.0
-            error = heading_error
-            target_speed = min_ps
-            # Pure PID control for fine alignment
-            pid_integral = max(-100, min(100, pid_integral + error * ki))
-            steer = error * kp + pid_integral + (error - last_error) * kd
-            last_error = error
-            current_speed += min(2, max(-2, target_speed - current_speed))
-            set_speed(current_speed)
-            set_steering(240 + steer)
-            # Complete U-turn when precisely aligned to 180°
-            if abs(heading_error) < turn_tol:
-                # Reverse travel direction after U-turn
-                direction = -direction
-                # Update target heading for new direction
-                target_heading = 180  # Facing 180°
-                
-                fetch_data(b'z')  # Reset slave encoders
-                
-                # Transition to parking approach
-                state = 'end_park1'
-                target_speed = max_fs
-                break
+        heading_error = wrap180(180 - angle)
+        if sm.step():
+            log_tick()
+            break
         # Fail-safe - break if U-turn takes too long (5 seconds)
         if pyb.elapsed_millis(now) > 5000:
-            state = 'end_park1'
+            sm.go(S_END_PARK1)
+            log_tick()
             break
+        log_tick()
+        prof.stop(P_CONTROL, t_tick)
     # Section 3: Parking Maneuver
     # Enters parking spot upon magenta detection.
     # Follows magenta wall with camera offset based on direction.
     # Uses angle and odometry for positioning after passing magenta.
     # States: 'end_park1' to 'end_park7' for sequenced maneuver.
     # Relies on camera for following, switches to odometry/angle after.
+    detector.set_region("M")  # The parking walls come close and fill the lower rows: search the whole window
+    vision_profile = PARK_PROFILE
     while True:
-        fetch_data(b'r')
+        await ticker.wait()
         now = pyb.millis()
+        trace_tick(now)
+        prof.set_state(sm.name)
+        t_tick = prof.start()
         dt = (now - last_time) / 1000.0
         last_time = now
-        gyro = read_gyro()
-        angle += gyro * dt
-        delta_enc = encoder - last_enc
-        last_enc = encoder
-        odometry_x += delta_enc * math.cos(math.radians(angle))
-        odometry_y += delta_enc * math.sin(math.radians(angle))
-        heading_diff = ((target_heading - angle + 180) % 360) - 180
-        magenta_error, mag_det = detect_region("M")
+        heading_diff = wrap180(target_heading - angle)
+        odometry_step()
+        magenta_error, mag_det = detector["M"].error, detector["M"].det
         if mag_det:
             offset = 30 if direction == -1 else -30  # CCW: right, CW: left
             cam_error = magenta_error - (CAM_CENTER + offset)
         else:
             cam_error = 0
-        if state == 'end_park1':
-            # Approach and follow magenta wall
-            kp, ki, kd = 3, 0.001, 3
-            error = heading_diff + cam_error * 0.4
-            if abs(heading_error) < turn_tol and encoder > 50 and not mag_det:
-                fetch_data(b'p')  # Pause slave if needed
-                state = 'end_park2'
-        elif state == 'end_park2':
-            # Continue forward using odometry after passing magenta
-            kp, ki, kd = 1, 0.001, 0.5
-            error = heading_diff
-            if odometry_x > 450:  # Use odometry to reach position
-                target_heading = (direction * 90 * 2) % 360
-                state = 'end_park3'
-        elif state == 'end_park3':
-            # Turn into the spot based on angle
-            kp, ki, kd = 3, 0.001, 3
-            error = heading_diff
-            if abs(heading_diff) < 10:
-                fetch_data(b'p')
-                state = 'end_park4'
-        elif state == 'end_park4':
-            # Adjust forward position with odometry
-            kp, ki, kd = 2.5 if direction == 1 else 3.5, 0.001, 3 if direction == 1 else 4
-            error = heading_diff
-            if odometry_y > (62.5 if direction == 1 else 170):
-                state = 'end_park5'
-        elif state == 'end_park5':
-            # Reverse turn for parallel alignment
-            heading_error = ((target_heading - (direction * 73) - angle + 180) % 360) - 180
-            current_speed += min(2, max(-2, target_speed - current_speed))
-            set_steering(0 if direction == 1 else 480)
-            set_speed(current_speed)
-            if abs(heading_error) < 30:
-                current_speed = -min_ps
-                target_speed = -min_ps
-                state = 'end_park6'
-        elif state == 'end_park6':
-            # Final reverse using angle
-            heading_error = ((target_heading - (direction * 73) - angle + 180) % 360) - 180
-            kp, ki, kd = 2, 0.001, 2
-            error = heading_error
-            if abs(heading_error) < turn_tol:
-                state = 'end_park7'
-        elif state == 'end_park7':
-            # Straighten and stop
-            heading_error = heading_diff
-            current_speed += min(2, max(-2, target_speed - current_speed))
-            set_steering(0 if direction == 1 else 480)
-            set_speed(current_speed)
-            if abs(heading_error) < 7:
-                set_speed(0)
-                set_steering(240)
-                break
-        if state not in ('end_park7', 'end_park5'):
-            pid_integral = max(-100, min(100, pid_integral + error * ki))
-            steer = error * kp + pid_integral + (error - last_error) * kd
-            last_error = error
-            current_speed += min(2, max(-2, target_speed - current_speed))
-            set_speed(current_speed)
-            set_steering(240 + steer * (-1 if state == 'end_park6' else 1))
+        if sm.step():
+            log_tick()
+            break
+        sign = sm.param[1]
+        if sign:
+            steer = pid_steer()
+            drive.update(target_speed, dt, PARK_ACCEL)
+            set_steering(240 + steer * sign)
+        log_tick()
+        prof.stop(P_CONTROL, t_tick)
+
+async def main():
+    # Sensing, vision and LED run as background tasks; the run ends when the control task returns
+    spawn(periodic(SENSOR_PERIOD_MS, sensor_step))
+    spawn(vision_task())
+    spawn(periodic(LED_PERIOD_MS, led_step))
+    await control_task()
+
+try:
+    asyncio.run(main())
 except:
     error_flag = 1
     set_led("M")
 finally:
     set_speed(0)
     set_steering(240)
+    print("link: frames=%d lost=%d crc_errors=%d timeouts=%d stale=%d reset_failures=%d" % (
+        link.frames, link.lost, link.crc_errors, link.timeouts, link.stale, link.reset_failures))
+    print("camera: frames=%d window_switches=%d reconfigs=%d lut_skipped=%d" % (
+        detector.seq, detector.switches, detector.reconfigs, detector.skipped))
+    print("tracker: roi_searches=%d full_searches=%d" % (tracker.roi_searches, tracker.full_searches))
+    sx, sy, sh = pose.sd()
+    print("pose: x=%.0f y=%.0f heading=%.1f sd=%.0f/%.0f/%.1f walls=%d wall_fixes=%d corner_fixes=%d rejected=%d" % (
+        pose.x, pose.y, pose.heading(), sx, sy, sh, pose.walls, pose.wall_fixes, pose.corner_fixes, pose.rejected))
+    print("pid: saturated=%d" % pid.saturated)
+    print("front tof: results=%d invalid=%d stale=%d" % (car.tof.results, car.tof.invalid, car.tof.stale))
+    print("drive: speed=%.0f mm/s fit=%s integral=%.1f saturated=%d stalled=%d" % (drive.velocity, drive.fit,
+          drive.integral, drive.saturated, drive.stalled))
+    print("states: transitions=%d %s" % (sm.transitions, sm.summary()))
+    print("telemetry: records=%d blocks=%d write_errors=%d" % (rec.total, rec.blocks, rec.write_errors))
+    try:
+        rec.close()  # Last partial telemetry block
+        trace.close()
+    except OSError:
+        pass
+    try:
+        prof.dump("profile.bin")  # Host analysis: tools/profile_report.py
+    except OSError:
+        pass
     pyb.delay(50 if not error_flag else 2000)
-    pyb.standby()
\ No newline at end of file
+    pyb.standby()
@@ -9,123 +9,72 @@
 # The vehicle optimizes speed for straight sections and slows down for cornering maneuvers.
 
 import pyb
-from machine import Pin, UART, SPI, I2C
-import math
 import sensor
+import uasyncio as asyncio
+from vision import ColorDetector, CaptureProfile
+from colorlut import ColorLUT
+from pose import PoseEstimator
+from kernel import wrap180
+from pid import PID
+from speed import SpeedController
+from car import Car, boot_report, PROFILE_STAGES, P_LINK, P_GYRO, P_CAPTURE, P_BLOBS, P_LOG, P_CONTROL
+from tasks import Ticker, spawn, periodic
+from profiler import Profiler
+from telemetry import Recorder, InputTrace
 
-# Initialize camera sensor
-sensor.reset()  # Reset camera settings
-sensor.set_pixformat(sensor.RGB565)  # Set pixel format to RGB565 for color detection
-sensor.set_framesize(sensor.QVGA)  # Set frame size to QVGA (320x240)
-sensor.set_vflip(True)  # Vertically flip the image for reverse mounting
-sensor.set_hmirror(True)  # Horizontally mirror the image for reverse mounting
-sensor.skip_frames(time=500)  # Skip initial frames to stabilize the sensor
+# Loop timing profiler: microsecond samples per stage in a fixed ring buffer, dumped to flash at the end of the run
+prof = Profiler(PROFILE_STAGES, capacity=4096)
 
-# Gyroscope setup (LSM6DSOX) for reading X-axis angular rate
-spi = SPI(5, baudrate=1000000, polarity=1, phase=1)  # Initialize SPI bus 5
-cs_pin = Pin("PF6", Pin.OUT_PP, Pin.PULL_UP)  # Chip select pin for gyro
+# Telemetry: one 32-byte record per control tick, written to the SD card in blocks at state transitions
+TELEMETRY_STATES = ('initial_forward', 'follow_wall', 'turn_corner')
+rec = Recorder(TELEMETRY_STATES, capacity=256)
 
-def read_gyro():
-    # Read low and high bytes from OUTX_L_G and OUTX_H_G registers
-    cs_pin.low()
-    spi.write(bytearray([0x28 | 0x80]))  # Address for OUTX_L_G with read bit
-    low = spi.read(1)[0]
-    spi.write(bytearray([0x29 | 0x80]))  # Address for OUTX_H_G with read bit
-    high = spi.read(1)[0]
-    cs_pin.high()
-    raw = (high << 8) | low  # Combine high and low bytes
-    if raw >= 32768:
-        raw -= 65536  # Convert to signed 16-bit value
-    return raw * 0.035  # Scale raw value to degrees per second (adjust scale factor based on sensitivity setting)
-
-# Front ToF sensor setup for initial distance measurement
-i2c = I2C(2)  # Initialize I2C bus 2
-tof_address = 0x29  # Default address for VL53L1X front ToF sensor
-
-def read_distance():
-    # Read 2 bytes from register 0x1E (distance result)
-    result = i2c.readfrom_mem(tof_address, 0x1E, 2)
-    return (result[0] << 8) | result[1]  # Combine to get distance in mm
-
-# Servo setup for steering
+# Car hardware (lib/car.py): camera, IMU and heading integrator, front ToF, steering servo, drive motor, slave
+# link, start button and status LED; the servo pulse range is this car's
 SERVO_MIN = 1525  # Minimum pulse width for servo
 SERVO_CENTER = 2200  # Center pulse width
 SERVO_MAX = 2900  # Maximum pulse width
-servo_timer = pyb.Timer(4, freq=50)  # Timer for 50Hz PWM
-servo = servo_timer.channel(3, pyb.Timer.PWM, pin=pyb.Pin(2))  # PWM on used pin 2
-servo.pulse_width(SERVO_CENTER)  # Initialize to center
-
-def set_steering(pos):
-    # Convert position (0-480) to pulse width, clamped to min/max
-    pos = max(0, min(480, pos))
-    if pos < 240:
-        pulse = SERVO_CENTER - (240 - pos) * (SERVO_CENTER - SERVO_MIN) // 240
-    else:
-        pulse = SERVO_CENTER + (pos - 240) * (SERVO_MAX - SERVO_CENTER) // 240
-    servo.pulse_width(int(pulse))
-
-# Motor setup for drive
-motor_timer = pyb.Timer(1, freq=20000)  # High freq for smooth PWM
-motor_forward = motor_timer.channel(2, pyb.Timer.PWM, pin=Pin(3))  # Forward PWM on pin 3
-motor_reverse = motor_timer.channel(3, pyb.Timer.PWM, pin=Pin(6))  # Reverse PWM on pin 6
-
-def set_speed(speed):
-    # Set motor speed (-100 to 100), using PWM percent
-    speed = max(-100, min(100, int(speed)))
-    if speed > 0:
-        motor_forward.pulse_width_percent(100)
-        motor_reverse.pulse_width_percent(100 - speed)
-    elif speed == 0:
-        motor_forward.pulse_width_percent(100)
-        motor_reverse.pulse_width_percent(100)
-    else:
-        motor_forward.pulse_width_percent(100 + speed)
-        motor_reverse.pulse_width_percent(100)
-
-set_speed(0)  # Start stopped
-
-# UART for communication with slave MCU (sensors: left/right ToF, encoder)
-uart = UART(9, baudrate=115200, bits=8, parity=None, stop=1)
+car = Car(prof, SERVO_MIN, SERVO_CENTER, SERVO_MAX)
+heading, link = car.heading, car.link
+read_distance, set_steering, set_speed = car.read_distance, car.set_steering, car.set_speed
+wait_button, set_led = car.wait_button, car.set_led
 
 tof_left = 0  # Left ToF distance
 tof_right = 0  # Right ToF distance
 encoder = 0.0  # Encoder value (distance in mm)
-uart_buffer = b''  # Buffer for UART data
+wheel_speed = 0.0  # Encoder speed in mm/s, edge-timed and filtered on the slave
 
-def fetch_data(command, timeout=50):
-    # Send command to slave and parse response
-    global tof_left, tof_right, encoder, uart_buffer
-    uart.write(command)
-    if command in (b'z', b'p'): return True  # No response needed
-    start_time = pyb.millis()
-    while pyb.elapsed_millis(start_time) < timeout:
-        if uart.any():
-            uart_buffer += uart.read(uart.any())
-            if b'\n' in uart_buffer:
-                line, uart_buffer = uart_buffer.split(b'\n', 1)
-                if command == b'r' and line.count(b',') == 2:
-                    parts = line.split(b',')
-                    tof_left = int(parts[0])
-                    tof_right = int(parts[1])
-                    encoder = float(parts[2])
-                    return True
-    return False  # Timeout
+sensor_age = -1  # Age in ms of the sample behind the sensor globals
 
-# Button for start
-button_pin = Pin('A0', Pin.IN, Pin.PULL_UP)
-def wait_button(release=True):
-    # Wait for button press (and release if specified)
-    while button_pin.value(): pyb.delay(1)
-    if release:
-        while not button_pin.value(): pyb.delay(1)
+def request_data():
+    # First phase of the split fetch: issue the request early so UART latency overlaps camera and gyro work
+    link.request()
 
-# RGB LED for status
-led_pins = [pyb.Pin(p, pyb.Pin.OUT_PP) for p in ("PE3", "PC13", "PF4")]  # R, G, B pins
-def set_led(color):
-    # Set LED color based on string code (e.g., 'R' red, 'G' green, 'M' magenta, 'off')
-    led_pins[0].value(0 if color in 'ROMWY' else 1)  # Red on/low for certain colors
-    led_pins[1].value(0 if color in 'GOCWY' and (color != 'O' or pyb.millis() % 1 < 1) else 1)  # Green, with blink for 'O'
-    led_pins[2].value(0 if color in 'BCMW' else 1)  # Blue
+def collect_data():
+    # Second phase: copy the newest completed sample into the sensor globals (never waits)
+    global tof_left, tof_right, encoder, wheel_speed, sensor_age
+    fresh = link.collect()
+    tof_left = link.tof_left
+    tof_right = link.tof_right
+    encoder = link.distance()
+    wheel_speed = link.velocity()
+    sensor_age = link.age_ms()
+    return fresh
+
+def fetch_data(command):
+    # 'r' requests and collects in one go, 'z' resets the encoder,
+    # anything else is forwarded to the slave as a one-byte command
+    global encoder
+    if command == b'r':
+        request_data()
+        return collect_data()
+    if command == b'z':
+        link.reset_encoder()
+        encoder = 0.0
+        pose.reset_encoder()  # The pose keeps its own encoder reference across resets
+    else:
+        link.command(command)
+    return True
 
 # Camera parameters
 CAM_WIDTH = 316  # Effective width after windowing if applied
@@ -139,25 +88,35 @@ th = {
     "B": [(5, 60, 5, 80, -80, -25)],  # Blue for corner detection
 }
 
-def detect_region(color_key, roi=(0, 0, CAM_WIDTH, CAM_HEIGHT)):
-    # Use find_blobs to detect regions of the specified color threshold
-    # Returns error (deviation from center) and detection flag
-    img = sensor.snapshot()  # Capture image
-    blobs = img.find_blobs(th[color_key], roi=roi, pixels_threshold=200, area_threshold=200, merge=True)  # Find blobs with params
-    if blobs:
-        # Take the largest blob for reliability
-        largest_blob = max(blobs, key=lambda b: b.pixels())
-        center_x = largest_blob.cx()  # Centroid x
-        return center_x - CAM_CENTER, True  # Error from center
-    return 0, False  # No detection
+# Colour class table from tools/build_lut.py: colours with no pixel in a frame skip their find_blobs call
+try:
+    lut = ColorLUT.load("open.lut")
+    if not lut.matches(th): lut = None  # Thresholds were tuned after the table was built
+except (OSError, ValueError):
+    lut = None
+# Single-snapshot detector: one frame per tick, every requested colour searched in that frame
+detector = ColorDetector(th, CAM_WIDTH, CAM_HEIGHT, CAM_CENTER, pixels_threshold=200, area_threshold=200, lut=lut)
+# Input trace: what every control tick reads (heading, encoder, ToF, detections), replayed by tools/replay.py
+trace = InputTrace(TELEMETRY_STATES, tuple(th), capacity=128)
+car.trace = trace  # Front ToF readings are traced too
+# Capture profiles: each vision job captures only the bounding box of its colours' search regions. During the
+# corner cooldown only the wall region of the BK search (lower 90 rows, inner half) is captured. Corner lines
+# and walls are large blobs, so both jobs capture at half resolution (QQVGA); regions, centroids and pixel
+# thresholds stay in QVGA units and the detector scales them
+CORNER_WALL_PROFILE = CaptureProfile("corner_wall", ("O", "B", "BK"), framesize=sensor.QQVGA)  # Corners can be decided
+WALL_PROFILE = CaptureProfile("wall", ("BK",), framesize=sensor.QQVGA)  # Corner cooldown
+detector.set_stride("O", 4, 2)  # Corner lines are large blobs: a coarse seed scan finds them
+detector.set_stride("B", 4, 2)
 
 # Navigation parameters
 direction = 0  # 0 unknown, 1 for CW, -1 for CCW
 corner_count = 0  # Track corners navigated
 corner_cd = 2000  # Min time ms between corner detections
-last_corner_time = pyb.millis()  # Last corner detection time
+last_corner_time = 0  # Last corner detection time (set at the start)
 min_fs, max_fs = 55, 75  # Full speeds
-current_speed = max_fs  # Current motor speed
+# Speed ramp in duty percent per s: the old step of 2 per tick over the tuned tick period (TUNED_T below)
+drive = SpeedController(set_speed, accel=43)  # Speed ramp on duty targets, open loop until a motor fit is passed
+drive.ref = max_fs  # The run starts at full speed, not ramped up from a standstill
 target_speed = max_fs  # Target speed for ramp
 turn_tol = 5  # Tolerance for turn completion in degrees
 state = 'initial_forward'  # State machine start
@@ -165,54 +124,124 @@ target_heading = 0  # Desired heading
 no_black_count = 0  # Counter for no black line detection
 min_segment_dist = 300  # Minimum distance before allowing turn
 final_forward = 475  # Final forward distance after last corner
+initial_max = 1200  # Longest initial run in mm (earliest start position to 800 mm from the wall)
+front_fail_reads = 10  # Consecutive invalid front ToF reads (10 ms ticks, four ranging periods) that count as failed
+front_fails = 0  # Invalid front ToF reads in a row
 
-# PID parameters
-kp, ki, kd = 2, 0.001, 1  # Gains
-pid_integral = 0  # Integral term
-last_error = 0  # Last error for derivative
+# PID parameters: (kp, ki, kd, T) per state, switched by pid.use. T is the tick period in ms of the blocking loop
+# the gains were tuned in (two or three QVGA snapshots per tick): the mean tick of the tuned script in the host
+# simulator with the tuned slave's text request and delay(15) loop modelled (--slave baseline), to be confirmed on the car
+TUNED_T = 47
+GAINS = {'initial_forward': (2, 0.001, 1, TUNED_T), 'follow_wall': (2, 0.001, 1, TUNED_T),
+         'turn_corner': (2.5, 0.001, 1.5, TUNED_T)}
+pid = PID(GAINS[state])  # Steering PID on the measured tick period (lib/pid.py)
 
 angle = 0.0  # Current angle from gyro integration
-odometry_x = 0.0  # Odometry X position
-odometry_y = 0.0  # Odometry Y position
-last_enc = 0.0  # Last encoder value
+odometry_x = 0.0  # Estimated X position in mm (along the start heading)
+odometry_y = 0.0  # Estimated Y position in mm (right of the start heading)
+# Pose estimator (EKF): encoder and gyro prediction, corrected by the side walls and the corner lines
+pose = PoseEstimator()
+cam_error = 0  # Wall centroid error from the camera
 
-# Wait for slave ready
-start = pyb.millis()
-while pyb.elapsed_millis(start) < 10000:
-    if uart.any() and uart.read(1) == b'\x01': break
-uart.read(uart.any())  # Clear buffer
+if not car.tof.running:
+    print("front tof: not ranging, the initial run ends on the corner line or after %d mm" % initial_max)
+boot_report("open.py")  # Setup done: time since reset and heap use
+
+car.wait_slave()  # Wait for slave ready, then switch it to push mode
 
 fetch_data(b'r')  # Initial fetch
 
 # ---------- IMU CALIBRATION ------------
-# Perform 10-second gyroscope calibration to determine zero offset
-# This collects gyro samples to calculate average drift and improve heading accuracy
-calibration_samples = 1000
-calibration_sum = 0.0
-calibration_count = 0
-calibration_start = pyb.millis()
-
-while calibration_count < calibration_samples and pyb.elapsed_millis(calibration_start) < 10000:
-    gyro_sample = read_gyro()
-    calibration_sum += gyro_sample
-    calibration_count += 1
-    pyb.delay(10)  # 10ms between samples
-
-if calibration_count > 0:
-    gyro_zero_offset = calibration_sum / calibration_count
-else:
-    gyro_zero_offset = 0.0
+# Adaptive zero-rate calibration (Car.calibrate, lib/calibration.py): stops as soon as the bias estimate of the
+# still car converges, and a warm restart reuses the cached bias of a recent run at a similar temperature
+gyro_zero_offset = car.calibrate()
 
 set_led("B")  # Blue LED for waiting
 wait_button()  # Wait for start button
 set_led("off")  # Off after start
 
 fetch_data(b'z')  # Reset slave
+heading.bias = gyro_zero_offset  # Subtract the calibrated zero offset during integration
+heading.start()  # Flush the FIFO and begin integrating from 0 degrees
+pose.start()  # Pose origin at the start position
 start = pyb.millis()
+last_corner_time = start - corner_cd  # A corner counts from the start, whatever calibration and the button took
+try:
+    rec.open("telemetry.bin")  # Lands on the SD card when one is mounted; host decoder: tools/telemetry_decode.py
+    trace.open("trace.bin", start)  # Replay aligns its clock to start
+except OSError:
+    pass  # No writable filesystem: the run goes on without a log
 last_time = pyb.millis()
 error_flag = 0
 
-try:
+# Task periods: each stage runs at its own rate and shares state through the globals above
+SENSOR_PERIOD_MS = 5  # Slave link and gyro FIFO
+CONTROL_PERIOD_MS = 10  # State machine, steering and motor commands
+dt = CONTROL_PERIOD_MS / 1000.0  # Measured period of the current control tick in s (PID)
+LED_PERIOD_MS = 50  # Status LED
+vision_profile = CORNER_WALL_PROFILE  # Capture profile of the vision task's next frame (set by control)
+led_color = "off"  # Colour shown by the LED task
+
+def sensor_step():
+    # Sensor task: take the newest slave sample, request the next one and integrate the gyro FIFO
+    global angle
+    t = prof.start()
+    collect_data()
+    request_data()
+    prof.stop(P_LINK, t)
+    t = prof.start()
+    heading.update()  # Integrate all FIFO gyro samples since the last pass (zero offset applied)
+    angle = heading.angle
+    prof.stop(P_GYRO, t)
+
+async def vision_task():
+    # Vision task: free-running single-snapshot detection, yielding between colours so control keeps its rate
+    while True:
+        t = prof.start()
+        detector.begin(vision_profile, pyb.millis())
+        prof.stop(P_CAPTURE, t)
+        while True:
+            t = prof.start()
+            searching = detector.step()
+            prof.stop(P_BLOBS, t)
+            if not searching:
+                break
+            await asyncio.sleep_ms(0)
+        await asyncio.sleep_ms(0)
+
+def odometry_step():
+    # Pose estimate and wheel speed of this tick: predict from the encoder and gyro, then correct with the side walls
+    global odometry_x, odometry_y
+    pose.predict(encoder, angle)
+    pose.sides(tof_left, tof_right)
+    drive.measure(wheel_speed)
+    odometry_x = pose.x
+    odometry_y = pose.y
+
+def trace_tick(now):
+    # Record the inputs of the control tick starting at now (host replay: tools/replay.py wakes the tick at now)
+    t = prof.start()
+    trace.tick(now, state, angle, encoder, wheel_speed, tof_left, tof_right, detector)
+    prof.stop(P_LOG, t)
+
+def log_tick():
+    # Append the state, pose, sensors and commands of this control tick to the telemetry block
+    t = prof.start()
+    rec.set_state(state)
+    rec.record(pyb.millis(), car.speed_cmd, cam_error, angle, odometry_x, odometry_y, encoder,
+               tof_left, tof_right, car.tof_front, car.steer_cmd)
+    prof.stop(P_LOG, t)
+
+def led_step():
+    # LED task: show the status colour chosen by control
+    set_led(led_color)
+
+async def control_task():
+    # Control task: the navigation state machine, run every CONTROL_PERIOD_MS on the freshest shared state
+    global state, direction, corner_count, last_corner_time, target_speed, target_heading
+    global no_black_count, front_fails, last_time, dt
+    global vision_profile, led_color, cam_error
+    ticker = Ticker(CONTROL_PERIOD_MS)
     # Section 1: Main Navigation Loop
     # This loop navigates the open course by following the inner wall using camera detection.
     # It uses front ToF sensor for initial approach, then switches to camera-based wall following.
@@ -220,56 +249,67 @@ try:
     # and performs precise 90-degree turns at each corner.
     # States: 'initial_forward' -> 'follow_wall' -> 'turn_corner' -> 'follow_wall'
     # Uses IMU for initial straight driving, then camera for wall following with PID control.
+    # Vision results are consumed once per published frame; control ticks in between reuse them.
+    vision_seq = detector.seq
+    black_det = False
+    cam_error = 0
     while True:
-        fetch_data(b'r')
+        await ticker.wait()
         now = pyb.millis()
+        trace_tick(now)
+        prof.set_state(state)
+        t_tick = prof.start()
         dt = (now - last_time) / 1000.0
         last_time = now
-        gyro = read_gyro() - gyro_zero_offset  # Apply zero offset for accurate integration
-        angle += gyro * dt
-        delta_enc = encoder - last_enc
-        last_enc = encoder
-        odometry_x += delta_enc * math.cos(math.radians(angle))
-        odometry_y += delta_enc * math.sin(math.radians(angle))
-        
-        heading_diff = ((target_heading - angle + 180) % 360) - 180
-        
-        # Corner detection with cooldown to prevent multiple detections
-        if pyb.elapsed_millis(last_corner_time) > corner_cd:
-            ob_error, ob_det = detect_region("O")
-            bb_error, bb_det = detect_region("B")
-            if ob_det or bb_det:
-                corner_count += 1
-                last_corner_time = pyb.millis()
-                pid_integral = 0  # Reset integral on corner detection
-                if corner_count < 13: 
-                    target_heading = (direction * 90 * corner_count) % 360
-                heading_diff = ((target_heading - angle + 180) % 360) - 180
+        heading_diff = wrap180(target_heading - angle)
+        odometry_step()
         
         # Wall following using black wall detection
         if direction == -1:  # CCW
             roi = (0, CAM_HEIGHT-90, CAM_CENTER, 90)  # left wall roi
         else:  # CW
             roi = (CAM_CENTER, CAM_HEIGHT-90, CAM_CENTER, 90)  # right wall roi
-        cam_error, black_det = detect_region("BK", roi=roi)
-        no_black_count = 0 if black_det else no_black_count + 1
+        detector.set_roi("BK", roi)
+        
+        # Orange/blue are only searched when a corner or the direction can be decided
+        corner_ready = pyb.elapsed_millis(last_corner_time) > corner_cd
+        vision_profile = CORNER_WALL_PROFILE if corner_ready or state == 'initial_forward' else WALL_PROFILE
+        frame = detector
+        if detector.seq != vision_seq:
+            vision_seq = detector.seq
+            
+            # Corner detection with cooldown to prevent multiple detections
+            if corner_ready:
+                ob_det = frame["O"].det
+                bb_det = frame["B"].det
+                if ob_det or bb_det:
+                    corner_count += 1
+                    last_corner_time = pyb.millis()
+                    pid.integral = 0.0  # Reset integral on corner detection
+                    pose.corner()  # Along-track fix against the same corner line on earlier laps
+                    if corner_count < 13: 
+                        target_heading = (direction * 90 * corner_count) % 360
+                    heading_diff = wrap180(target_heading - angle)
+            
+            cam_error, black_det = frame["BK"].error, frame["BK"].det
+            no_black_count = 0 if black_det else no_black_count + 1
         
         # Final completion check after 12 corners
         if corner_count >= 12:
             if encoder >= final_forward:
                 set_speed(-10)
                 set_steering(240)
+                log_tick()
                 break
         
         if state == 'initial_forward':
             # Initial approach using IMU only until front ToF reaches 800mm
             # This ensures straight approach before switching to camera guidance
-            kp, ki, kd = 2, 0.001, 1
             error = heading_diff
             
             # During initial forward, detect orange or blue to set direction
-            orange_error, orange_det = detect_region("O")
-            blue_error, blue_det = detect_region("B")
+            orange_det = frame["O"].det
+            blue_det = frame["B"].det
             if direction == 0:  # Only set if unknown
                 if orange_det and not blue_det:
                     direction = 1  # Orange first: CW
@@ -277,14 +317,18 @@ try:
                     direction = -1  # Blue first: CCW
             
             front_dist = read_distance()
-            if front_dist <= 800:  # Switch to camera following when 800mm reached
+            front_fails = front_fails + 1 if front_dist < 0 else 0
+            # Switch to camera following when 800mm reached (-1: no valid result). With the front ToF failed (not
+            # ranging, or front_fail_reads invalid reads in a row) the corner line that set the direction ends the
+            # run-up instead; initial_max of travel ends it in any case
+            tof_failed = not car.tof.running or front_fails >= front_fail_reads
+            if 0 <= front_dist <= 800 or (tof_failed and direction != 0) or encoder >= initial_max:
                 state = 'follow_wall'
                 fetch_data(b'z')  # Reset encoder for new segment
                 
         elif state == 'follow_wall':
             # Wall following state using camera guidance with IMU backup
             # Combines camera error with heading error for smooth wall tracking
-            kp, ki, kd = 2, 0.001, 1
             wall_offset = -20  # Keep wall on left for CW navigation
             if black_det:
                 error = cam_error * 0.3 + heading_diff * 0.7 - wall_offset
@@ -302,7 +346,6 @@ try:
         elif state == 'turn_corner':
             # Corner execution state using pure IMU guidance
             # Performs precise 90-degree turns based on gyro integration
-            kp, ki, kd = 2.5, 0.001, 1.5
             error = heading_diff
             
             if abs(heading_diff) < turn_tol:
@@ -311,14 +354,23 @@ try:
                 fetch_data(b'z')  # Reset encoder for new straight segment
         
         # LED indication and PID control execution
-        set_led("G" if black_det else "off")  # Green when wall detected
-        pid_integral = max(-100, min(100, pid_integral + error * ki))
-        steer = error * kp + pid_integral + (error - last_error) * kd
-        last_error = error
-        current_speed += min(2, max(-2, target_speed - current_speed))  # Smooth speed transitions
-        set_speed(current_speed)
+        led_color = "G" if black_det else "off"  # Green when wall detected
+        pid.use(GAINS[state])
+        steer = pid.step(error, dt)
+        drive.update(target_speed, dt)  # Speed ramp and wheel speed loop
         set_steering(240 + steer)
-        
+        log_tick()
+        prof.stop(P_CONTROL, t_tick)
+
+async def main():
+    # Sensing, vision and LED run as background tasks; the run ends when the control task returns
+    spawn(periodic(SENSOR_PERIOD_MS, sensor_step))
+    spawn(vision_task())
+    spawn(periodic(LED_PERIOD_MS, led_step))
+    await control_task()
+
+try:
+    asyncio.run(main())
 except:
     error_flag = 1
     set_led("M")  # Magenta LED for error state
@@ -326,5 +378,26 @@ finally:
     # Clean shutdown procedure
     set_speed(0)
     set_steering(240)
+    print("link: frames=%d lost=%d crc_errors=%d timeouts=%d stale=%d reset_failures=%d" % (
+        link.frames, link.lost, link.crc_errors, link.timeouts, link.stale, link.reset_failures))
+    print("camera: frames=%d window_switches=%d reconfigs=%d lut_skipped=%d" % (
+        detector.seq, detector.switches, detector.reconfigs, detector.skipped))
+    sx, sy, sh = pose.sd()
+    print("pose: x=%.0f y=%.0f heading=%.1f sd=%.0f/%.0f/%.1f walls=%d wall_fixes=%d corner_fixes=%d rejected=%d" % (
+        pose.x, pose.y, pose.heading(), sx, sy, sh, pose.walls, pose.wall_fixes, pose.corner_fixes, pose.rejected))
+    print("pid: saturated=%d" % pid.saturated)
+    print("front tof: results=%d invalid=%d stale=%d" % (car.tof.results, car.tof.invalid, car.tof.stale))
+    print("drive: speed=%.0f mm/s fit=%s integral=%.1f saturated=%d stalled=%d" % (drive.velocity, drive.fit,
+          drive.integral, drive.saturated, drive.stalled))
+    print("telemetry: records=%d blocks=%d write_errors=%d" % (rec.total, rec.blocks, rec.write_errors))
+    try:
+        rec.close()  # Last partial telemetry block
+        trace.close()
+    except OSError:
+        pass
+    try:
+        prof.dump("profile.bin")  # Host analysis: tools/profile_report.py
+    except OSError:
+        pass
     pyb.delay(500 if not error_flag else 2000)
     pyb.standby()
\ No newline at end of file
@@ -0,0 +1,136 @@
+# kernel_bench.py
+# On-board timing of the compiled per-tick helpers in lib/kernel.py and lib/pid.py against the interpreted code
+# they replaced.
+# MicroPython code.
+# Each case runs the old inline expression and the kernel call N times in a loop and prints the microseconds per
+# call with the empty loop subtracted, then checks that both give the same results over a sweep of inputs (the
+# fixed-point servo mapping within one pulse tick, the PID at its tuned period once the derivative filter has settled).
+
+import time
+from pid import PID
+from kernel import wrap180, clamp_int, servo_slope, servo_pulse, motor_duty
+
+N = 5000  # Calls per timing run
+SERVO_MIN, SERVO_CENTER, SERVO_MAX = 1775, 2575, 3275  # obstacle.py servo pulses
+SERVO_LEFT = servo_slope(SERVO_CENTER - SERVO_MIN)
+SERVO_RIGHT = servo_slope(SERVO_MAX - SERVO_CENTER)
+
+
+def empty(n):
+    for _ in range(n):
+        pass
+
+
+def wrap_before(n):
+    target, angle = 90, 437.25
+    for _ in range(n):
+        d = ((target - angle + 180) % 360) - 180
+    return d
+
+
+def wrap_after(n):
+    target, angle = 90, 437.25
+    for _ in range(n):
+        d = wrap180(target - angle)
+    return d
+
+
+def pid_before(n):
+    error, kp, ki, kd = 12.5, 1.2, 0.003, 0.35
+    pid_integral = last_error = 0
+    for _ in range(n):
+        pid_integral = max(-100, min(100, pid_integral + error * ki))
+        steer = error * kp + pid_integral + (error - last_error) * kd
+        last_error = error
+    return steer
+
+
+def pid_after(n):
+    error = 12.5
+    pid = PID((1.2, 0.003, 0.35, 10))
+    for _ in range(n):
+        steer = pid.step(error, pid.period)
+    return steer
+
+
+def servo_before(n):
+    pos = 240 + 57.3
+    for _ in range(n):
+        p = max(0, min(480, pos))
+        if p < 240:
+            pulse = SERVO_CENTER - (240 - p) * (SERVO_CENTER - SERVO_MIN) // 240
+        else:
+            pulse = SERVO_CENTER + (p - 240) * (SERVO_MAX - SERVO_CENTER) // 240
+        pulse = int(pulse)
+    return pulse
+
+
+def servo_after(n):
+    pos = 240 + 57.3
+    for _ in range(n):
+        pulse = servo_pulse(clamp_int(int(pos * 256), 0, 480 * 256), SERVO_CENTER, SERVO_LEFT, SERVO_RIGHT)
+    return pulse
+
+
+def speed_before(n):
+    speed = -37.0
+    for _ in range(n):
+        s = max(-100, min(100, int(speed)))
+        if s > 0:
+            fwd, rev = 100, 100 - s
+        elif s == 0:
+            fwd, rev = 100, 100
+        else:
+            fwd, rev = 100 + s, 100
+    return fwd, rev
+
+
+def speed_after(n):
+    speed = -37.0
+    for _ in range(n):
+        duty = motor_duty(clamp_int(int(speed), -100, 100))
+        fwd, rev = duty >> 8, duty & 0xFF
+    return fwd, rev
+
+
+def timed(f):
+    t = time.ticks_us()
+    f(N)
+    return time.ticks_diff(time.ticks_us(), t)
+
+
+def check():
+    # Results of the kernel against the inline code over a sweep of inputs; returns the mismatches
+    bad = 0
+    for i in range(-720, 721, 7):
+        x = i * 1.37
+        if wrap180(x) != ((x + 180) % 360) - 180:
+            bad += 1
+    for i in range(-100, 581, 3):
+        pos = i + 0.37
+        p = max(0, min(480, pos))
+        if p < 240:
+            ref = int(SERVO_CENTER - (240 - p) * (SERVO_CENTER - SERVO_MIN) // 240)
+        else:
+            ref = int(SERVO_CENTER + (p - 240) * (SERVO_MAX - SERVO_CENTER) // 240)
+        got = servo_pulse(clamp_int(int(pos * 256), 0, 480 * 256), SERVO_CENTER, SERVO_LEFT, SERVO_RIGHT)
+        if abs(got - ref) > 1:
+            bad += 1
+    for s in range(-100, 101):
+        duty = motor_duty(s)
+        ref = (100, 100 - s) if s > 0 else (100 + s, 100)
+        if (duty >> 8, duty & 0xFF) != ref:
+            bad += 1
+    if abs(pid_before(50) - pid_after(50)) > 1e-3:  # PID at the tuned period, derivative filter settled
+        bad += 1
+    return bad
+
+
+base = timed(empty)
+print("kernel benchmark: %d calls per case, empty loop %.2f us per iteration" % (N, base / N))
+for name, before, after in (("wrap180", wrap_before, wrap_after), ("pid", pid_before, pid_after),
+                            ("servo", servo_before, servo_after), ("motor", speed_before, speed_after)):
+    tb = (timed(before) - base) / N
+    ta = (timed(after) - base) / N
+    print("%-9s before %6.2f us  after %6.2f us  (%.1fx)" % (name, tb, ta, tb / ta if ta > 0 else 0))
+print("mismatches: %d" % check())
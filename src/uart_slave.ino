@@ -2,7 +2,8 @@
 // Sensor microcontroller firmware for providing ToF and encoder data over UART.
 // This code runs on the sensor microcontroller and handles distance sensing and odometry.
 // It communicates with the main vehicle controller via UART protocol.
-// Features: Dual ToF sensor reading, quadrature encoder decoding, and odometry tracking.
+// Features: Dual ToF sensors in interleaved continuous ranging with a cached latest result, table-driven quadrature decoding with edge timestamps, encoder velocity,
+// odometry tracking, and CRC-checked binary frame streaming.
 // Compiled in Arduino IDE.
 
 #include <Wire.h>
@@ -19,9 +20,79 @@ const int ENCODER_CHANNEL_B = 3;    // Encoder quadrature input B
 const int LEFT_DISTANCE_SENSOR_ADDR = 0x29;   // Left ToF sensor I2C address
 const int RIGHT_DISTANCE_SENSOR_ADDR = 0x2A;  // Right ToF sensor I2C address
 
+// --------- TOF RANGING CONFIGURATION ---------
+// Both VL53L1X range continuously on their own schedule, started half a period apart so their results (and the
+// I2C reads that fetch them) interleave. loop() fetches a result when the sensor flags it ready and keeps it in
+// distance_cache with its time; frames and text replies are answered from the cache without touching I2C.
+const uint16_t TOF_TIMING_BUDGET_MS = 20;      // Measurement time per result (long distance mode)
+const uint16_t TOF_PERIOD_MS = 25;             // Inter-measurement period, must exceed the timing budget
+const uint16_t TOF_REG_VHV_TIMEOUT = 0x0008;
+const uint16_t TOF_REG_VHV_START = 0x000B;
+const uint16_t TOF_REG_CONFIG_START = 0x002D;  // First register of the default configuration block
+const uint16_t TOF_REG_GPIO_MUX_CTRL = 0x0030;
+const uint16_t TOF_REG_GPIO_STATUS = 0x0031;
+const uint16_t TOF_REG_TIMEOUT_A = 0x005E;
+const uint16_t TOF_REG_TIMEOUT_B = 0x0061;
+const uint16_t TOF_REG_INTERMEASUREMENT = 0x006C;
+const uint16_t TOF_REG_INTERRUPT_CLEAR = 0x0086;
+const uint16_t TOF_REG_MODE_START = 0x0087;
+const uint16_t TOF_REG_RANGE_STATUS = 0x0089;
+const uint16_t TOF_REG_DISTANCE = 0x0096;
+const uint16_t TOF_REG_OSC_CALIBRATE = 0x00DE;
+const uint16_t TOF_REG_BOOT_STATUS = 0x00E5;
+const uint8_t TOF_RANGE_VALID = 9;             // Raw range status of a valid measurement
+// Default configuration of registers 0x2D..0x87 from ST's VL53L1X ultra lite driver (long distance mode)
+const uint8_t TOF_DEFAULT_CONFIG[] = {
+  0x00, 0x00, 0x00, 0x01, 0x02, 0x00, 0x02, 0x08, 0x00, 0x08, 0x10, 0x01, 0x01, 0x00, 0x00, 0x00,
+  0x00, 0xff, 0x00, 0x0F, 0x00, 0x00, 0x00, 0x00, 0x00, 0x20, 0x0b, 0x00, 0x00, 0x02, 0x0a, 0x21,
+  0x00, 0x00, 0x05, 0x00, 0x00, 0x00, 0x00, 0xc8, 0x00, 0x00, 0x38, 0xff, 0x01, 0x00, 0x08, 0x00,
+  0x00, 0x01, 0xcc, 0x0f, 0x01, 0xf1, 0x0d, 0x01, 0x68, 0x00, 0x80, 0x08, 0xb8, 0x00, 0x00, 0x00,
+  0x00, 0x0f, 0x89, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01, 0x0f, 0x0d, 0x0e, 0x0e, 0x00,
+  0x00, 0x02, 0xc7, 0xff, 0x9B, 0x00, 0x00, 0x00, 0x01, 0x00, 0x00
+};
+
+struct DistanceCache {
+  int address;                 // I2C address of the sensor
+  int distance;                // Latest distance in mm, -1 invalid or not ranging
+  uint8_t range_status;        // Raw range status of the latest result
+  unsigned long time_ms;       // millis() of the latest result
+  bool running;                // Ranging started
+};
+DistanceCache distance_cache[2] = {
+  {LEFT_DISTANCE_SENSOR_ADDR, -1, 255, 0, false},
+  {RIGHT_DISTANCE_SENSOR_ADDR, -1, 255, 0, false}
+};
+
 // --------- ENCODER CONFIGURATION ---------
 volatile long encoder_count = 0;               // Raw encoder pulse count
+volatile unsigned long encoder_edge_us = 0;    // micros() of the last counted edge
 const float PULSES_PER_MILLIMETER = 3.024f;    // Calculated pulses per mm travel
+// Quadrature transition table indexed by (previous AB << 2) | current AB: +1 forward, -1 reverse,
+// 0 for no change and for the invalid double-channel transitions
+const int8_t QUADRATURE_STEP[16] = {0, +1, -1, 0, -1, 0, 0, +1, +1, 0, 0, -1, 0, -1, +1, 0};
+
+// --------- VELOCITY ESTIMATION ---------
+// Speed over the edges counted between two samples divided by the time between their last edges, so the
+// resolution is set by the edge timestamps (1 us) and not by the sample period. A sample with no new edge
+// limits the speed to one pulse over the time since the last edge, which lets it decay to zero at a stop.
+const float VELOCITY_FILTER = 0.5f;            // Low-pass weight of each new speed sample
+long velocity_count = 0;                       // Encoder count at the last velocity update
+unsigned long velocity_edge_us = 0;            // Edge time at the last velocity update
+float encoder_velocity = 0.0f;                 // Filtered encoder speed in pulses/s
+
+// --------- STREAM CONFIGURATION ---------
+// Binary push frame (little-endian, 26 bytes):
+//   [0] 0xA5 [1] 0x5A sync | [2..3] sequence | [4..7] slave millis | [8..9] left ToF mm | [10..11] right ToF mm
+//   [12..15] raw encoder count | [16] encoder reset epoch | [17] ToF age ms | [18..19] encoder velocity pulses/s
+//   [20..23] slave micros of the last encoder edge | [24..25] CRC-16/CCITT over bytes 2..23
+const uint8_t FRAME_SYNC_0 = 0xA5;
+const uint8_t FRAME_SYNC_1 = 0x5A;
+const int FRAME_SIZE = 26;
+uint8_t frame_buffer[FRAME_SIZE];              // Reused transmit buffer
+uint8_t stream_period_ms = 0;                  // Push period in ms, 0 = request/response only
+unsigned long last_stream_time = 0;            // Time the last frame was scheduled
+uint16_t frame_sequence = 0;                   // Incremented for every pushed frame
+uint8_t encoder_epoch = 0;                     // Incremented on every encoder reset
 
 // --------- WIRELESS DISABLE ---------
 void disableWireless() {
@@ -31,59 +102,201 @@ void disableWireless() {
 
 // --------- FUNCTION PROTOTYPES ---------
 void encoderInterruptService();
-int readDistanceSensor(int sensor_address);
+void updateVelocity(long count, unsigned long edge_us, unsigned long now_us);
+bool startDistanceSensor(DistanceCache& sensor);
+void pollDistanceSensors();
+uint8_t distanceAge();
 void processUARTCommand(char command);
+uint16_t crc16(const uint8_t* data, int length);
+void sendSensorFrame();
 
 // --------- ENCODER INTERRUPT SERVICE ROUTINE ---------
 void encoderInterruptService() {
-  // Basic quadrature decoding with direction detection
-  static uint8_t old_state = 0;
-  uint8_t new_state = (digitalRead(ENCODER_CHANNEL_A) << 1) | digitalRead(ENCODER_CHANNEL_B);
-  
-  if ((old_state == 0x2 && new_state == 0x0) || 
-      (old_state == 0x0 && new_state == 0x1) ||
-      (old_state == 0x1 && new_state == 0x3) || 
-      (old_state == 0x3 && new_state == 0x2)) {
-    encoder_count++;
-  } else if ((old_state == 0x2 && new_state == 0x3) || 
-             (old_state == 0x3 && new_state == 0x1) ||
-             (old_state == 0x1 && new_state == 0x0) || 
-             (old_state == 0x0 && new_state == 0x2)) {
-    encoder_count--;
+  // Quadrature decoding through the transition table; every counted edge is timestamped
+  static uint8_t transition = 0;
+  transition = ((transition << 2) | (digitalRead(ENCODER_CHANNEL_A) << 1) | digitalRead(ENCODER_CHANNEL_B)) & 0x0F;
+  int8_t step = QUADRATURE_STEP[transition];
+  if (step) {
+    encoder_count += step;
+    encoder_edge_us = micros();
   }
-  old_state = new_state;
 }
 
-// --------- DISTANCE SENSOR READ FUNCTION ---------
-int readDistanceSensor(int sensor_address) {
-  // Read distance from ToF sensor
-  // Returns distance in millimeters
-  
-  Wire.beginTransmission(sensor_address);
-  Wire.write(0x14);  // Distance register
-  if (Wire.endTransmission() != 0) return -1;
-  
-  delayMicroseconds(100);  // Small delay for sensor processing
-  
-  Wire.requestFrom(sensor_address, 2);
-  if (Wire.available() >= 2) {
-    uint8_t msb = Wire.read();
-    uint8_t lsb = Wire.read();
-    int distance = (msb << 8) | lsb;
-    
-    // Apply bounds checking
-    if (distance > 0 && distance < 4000) {
-      return distance;
+// --------- ENCODER VELOCITY UPDATE ---------
+void updateVelocity(long count, unsigned long edge_us, unsigned long now_us) {
+  // New speed sample from the count and last edge time of this frame, filtered into encoder_velocity
+  float rate;
+  if (count != velocity_count) {
+    unsigned long span = edge_us - velocity_edge_us;
+    rate = span ? (count - velocity_count) * 1e6f / span : encoder_velocity;
+    velocity_count = count;
+    velocity_edge_us = edge_us;
+  } else {
+    float bound = 1e6f / (now_us - edge_us + 1);  // No edge since the last sample: at most one pulse since then
+    rate = constrain(encoder_velocity, -bound, bound);
+  }
+  encoder_velocity += (rate - encoder_velocity) * VELOCITY_FILTER;
+}
+
+// --------- TOF REGISTER ACCESS ---------
+// VL53L1X registers have 16-bit big-endian indices; multi-byte values are big-endian as well
+bool tofWrite(int address, uint16_t reg, const uint8_t* data, int length) {
+  Wire.beginTransmission(address);
+  Wire.write(reg >> 8);
+  Wire.write(reg & 0xFF);
+  Wire.write(data, length);
+  return Wire.endTransmission() == 0;
+}
+
+bool tofWrite8(int address, uint16_t reg, uint8_t value) {
+  return tofWrite(address, reg, &value, 1);
+}
+
+bool tofWrite16(int address, uint16_t reg, uint16_t value) {
+  uint8_t data[2] = {(uint8_t)(value >> 8), (uint8_t)value};
+  return tofWrite(address, reg, data, 2);
+}
+
+bool tofWrite32(int address, uint16_t reg, uint32_t value) {
+  uint8_t data[4] = {(uint8_t)(value >> 24), (uint8_t)(value >> 16), (uint8_t)(value >> 8), (uint8_t)value};
+  return tofWrite(address, reg, data, 4);
+}
+
+bool tofRead(int address, uint16_t reg, uint8_t* data, int length) {
+  Wire.beginTransmission(address);
+  Wire.write(reg >> 8);
+  Wire.write(reg & 0xFF);
+  if (Wire.endTransmission(false) != 0) return false;
+  if (Wire.requestFrom(address, length) != length) return false;
+  for (int i = 0; i < length; i++) data[i] = Wire.read();
+  return true;
+}
+
+int tofRead8(int address, uint16_t reg) {
+  // Register value, -1 on a bus error
+  uint8_t value;
+  return tofRead(address, reg, &value, 1) ? value : -1;
+}
+
+bool tofDataReady(int address) {
+  // New result flagged on the interrupt status bit, whose active level is set by GPIO_HV_MUX__CTRL bit 4
+  int mux = tofRead8(address, TOF_REG_GPIO_MUX_CTRL);
+  int status = tofRead8(address, TOF_REG_GPIO_STATUS);
+  if (mux < 0 || status < 0) return false;
+  return (status & 0x01) == (((mux >> 4) & 0x01) ? 0 : 1);
+}
+
+// --------- TOF CONTINUOUS RANGING ---------
+bool startDistanceSensor(DistanceCache& sensor) {
+  // Boot check, default configuration, VHV calibration pass, timing budget, then continuous ranging
+  int address = sensor.address;
+  unsigned long start = millis();
+  while (tofRead8(address, TOF_REG_BOOT_STATUS) != 1) {
+    if (millis() - start > 100) return false;
+    delay(1);
+  }
+  if (!tofWrite(address, TOF_REG_CONFIG_START, TOF_DEFAULT_CONFIG, sizeof(TOF_DEFAULT_CONFIG))) return false;
+  tofWrite8(address, TOF_REG_MODE_START, 0x40);  // One ranging pass runs the VHV calibration
+  start = millis();
+  while (!tofDataReady(address)) {
+    if (millis() - start > 200) return false;
+    delay(1);
+  }
+  tofWrite8(address, TOF_REG_INTERRUPT_CLEAR, 0x01);
+  tofWrite8(address, TOF_REG_MODE_START, 0x00);
+  tofWrite8(address, TOF_REG_VHV_TIMEOUT, 0x09);  // Later passes reuse the calibration
+  tofWrite8(address, TOF_REG_VHV_START, 0x00);
+  // 20 ms timing budget in long distance mode (macro period timeouts of the ultra lite driver)
+  tofWrite16(address, TOF_REG_TIMEOUT_A, 0x001E);
+  tofWrite16(address, TOF_REG_TIMEOUT_B, 0x0022);
+  uint8_t osc[2];
+  if (!tofRead(address, TOF_REG_OSC_CALIBRATE, osc, 2)) return false;
+  uint16_t clock_pll = ((osc[0] << 8) | osc[1]) & 0x3FF;
+  tofWrite32(address, TOF_REG_INTERMEASUREMENT, (uint32_t)(clock_pll * TOF_PERIOD_MS * 1.075f));
+  tofWrite8(address, TOF_REG_INTERRUPT_CLEAR, 0x01);
+  sensor.running = tofWrite8(address, TOF_REG_MODE_START, 0x40);
+  return sensor.running;
+}
+
+void pollDistanceSensors() {
+  // Fetch the result of each sensor that flagged one; a sensor is only asked once its next result is due
+  unsigned long now = millis();
+  for (int i = 0; i < 2; i++) {
+    DistanceCache& sensor = distance_cache[i];
+    if (!sensor.running || now - sensor.time_ms < TOF_PERIOD_MS - 2) continue;
+    if (!tofDataReady(sensor.address)) continue;
+    uint8_t result[2];
+    int status = tofRead8(sensor.address, TOF_REG_RANGE_STATUS);
+    if (status >= 0 && tofRead(sensor.address, TOF_REG_DISTANCE, result, 2)) {
+      sensor.range_status = status & 0x1F;
+      sensor.distance = sensor.range_status == TOF_RANGE_VALID ? ((result[0] << 8) | result[1]) : -1;
+      sensor.time_ms = now;
+    }
+    tofWrite8(sensor.address, TOF_REG_INTERRUPT_CLEAR, 0x01);  // Arms the next result
+  }
+}
+
+uint8_t distanceAge() {
+  // Age in ms of the older cached distance, saturated at 255
+  unsigned long now = millis();
+  unsigned long age = max(now - distance_cache[0].time_ms, now - distance_cache[1].time_ms);
+  return age > 255 ? 255 : age;
+}
+
+// --------- CRC-16/CCITT ---------
+uint16_t crc16(const uint8_t* data, int length) {
+  // Polynomial 0x1021, initial value 0xFFFF (matches lib/link.py)
+  uint16_t crc = 0xFFFF;
+  for (int i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
     }
   }
-  return -1;  // Invalid reading
+  return crc;
+}
+
+// --------- BINARY FRAME TRANSMIT ---------
+void sendSensorFrame() {
+  // Pack the latest readings into the fixed-size frame and push it to the master
+  int left_dist = distance_cache[0].distance;
+  int right_dist = distance_cache[1].distance;
+  noInterrupts();
+  long count = encoder_count;
+  unsigned long edge_us = encoder_edge_us;
+  interrupts();
+  unsigned long now = millis();
+  updateVelocity(count, edge_us, micros());
+  int velocity = constrain((long)encoder_velocity, -32767L, 32767L);
+  
+  frame_buffer[0] = FRAME_SYNC_0;
+  frame_buffer[1] = FRAME_SYNC_1;
+  frame_buffer[2] = frame_sequence & 0xFF;
+  frame_buffer[3] = frame_sequence >> 8;
+  for (int i = 0; i < 4; i++) frame_buffer[4 + i] = (now >> (8 * i)) & 0xFF;
+  frame_buffer[8] = left_dist & 0xFF;
+  frame_buffer[9] = (left_dist >> 8) & 0xFF;
+  frame_buffer[10] = right_dist & 0xFF;
+  frame_buffer[11] = (right_dist >> 8) & 0xFF;
+  for (int i = 0; i < 4; i++) frame_buffer[12 + i] = (count >> (8 * i)) & 0xFF;
+  frame_buffer[16] = encoder_epoch;
+  frame_buffer[17] = distanceAge();
+  frame_buffer[18] = velocity & 0xFF;
+  frame_buffer[19] = (velocity >> 8) & 0xFF;
+  for (int i = 0; i < 4; i++) frame_buffer[20 + i] = (edge_us >> (8 * i)) & 0xFF;
+  uint16_t crc = crc16(frame_buffer + 2, FRAME_SIZE - 4);
+  frame_buffer[FRAME_SIZE - 2] = crc & 0xFF;
+  frame_buffer[FRAME_SIZE - 1] = crc >> 8;
+  
+  SERIAL_PORT.write(frame_buffer, FRAME_SIZE);
+  frame_sequence++;
 }
 
 // --------- UART COMMAND PROCESSOR ---------
 void processUARTCommand(char command) {
-  // Process commands from main vehicle controller
-  int left_dist = readDistanceSensor(LEFT_DISTANCE_SENSOR_ADDR);
-  int right_dist = readDistanceSensor(RIGHT_DISTANCE_SENSOR_ADDR);
+  // Process commands from main vehicle controller; distances come from the ranging cache
+  int left_dist = distance_cache[0].distance;
+  int right_dist = distance_cache[1].distance;
   float travel_distance = encoder_count / PULSES_PER_MILLIMETER;
   
   switch (command) {
@@ -106,9 +319,26 @@ void processUARTCommand(char command) {
       break;
       
     case 'z':  // Reset encoder counter
+      noInterrupts();
       encoder_count = 0;
+      interrupts();
+      velocity_count = 0;  // The velocity estimate carries on across the reset
+      encoder_epoch++;  // Lets the master drop frames sampled before the reset
       break;
       
+    case 'f':  // Single binary frame (request/response use of the stream format)
+      sendSensorFrame();
+      break;
+      
+    case 's': {  // Start/stop binary streaming: next byte is the period in ms (0 stops)
+      uint8_t period = 0;
+      if (SERIAL_PORT.readBytes(&period, 1) == 1) {
+        stream_period_ms = period;
+        last_stream_time = millis();
+      }
+      break;
+    }
+      
     default:   // Unknown command - ignore
       break;
   }
@@ -121,10 +351,11 @@ void setup() {
   
   // Initialize serial communication
   SERIAL_PORT.begin(115200);
+  SERIAL_PORT.setTimeout(10);  // Bound the wait for command arguments
   
   // Initialize I2C bus
   Wire.begin();
-  // Default clock speed
+  Wire.setClock(400000);  // Fast mode: a result fetch takes about 0.2 ms
   
   // Configure encoder hardware
   pinMode(ENCODER_CHANNEL_A, INPUT_PULLUP);
@@ -135,6 +366,11 @@ void setup() {
   // Sensor initialization delay
   delay(100);
   
+  // Continuous ranging, the right sensor half a period after the left one
+  startDistanceSensor(distance_cache[0]);
+  delay(TOF_PERIOD_MS / 2);
+  startDistanceSensor(distance_cache[1]);
+  
   // Send ready indicator
   SERIAL_PORT.write(0x01);  // Standard ready byte
 }
@@ -147,6 +383,13 @@ void loop() {
     processUARTCommand(incoming_byte);
   }
   
-  // Small delay for stability
-  delay(15);
+  // Push a frame every stream period when streaming is enabled
+  if (stream_period_ms > 0 && millis() - last_stream_time >= stream_period_ms) {
+    last_stream_time += stream_period_ms;
+    if (millis() - last_stream_time >= stream_period_ms) last_stream_time = millis();  // Resync after a stall
+    sendSensorFrame();
+  }
+  
+  // Fetch ToF results that became ready (no waiting: the sensors range on their own)
+  pollDistanceSensors();
 }
\ No newline at end of file
@@ -0,0 +1,56 @@
+# build_lut.py
+# Compiles the LAB thresholds of open.py and obstacle.py into RGB565 colour-class tables for the board.
+# CPython code.
+# The `th` dictionary is read from each script's source, every one of the 65536 RGB565 values is converted to
+# LAB the way find_blobs does and tested against every colour, and the class bitmasks are written next to the
+# script as <script>.lut (src/open.lut, src/obstacle.lut) with lib/colorlut.py. Copy the .lut file to the board
+# with the script; a script whose thresholds no longer match its table ignores it, so rebuild after tuning.
+# The report lists how much of the RGB565 space each colour covers and which colours overlap.
+#
+# Usage: python tools/build_lut.py src/open.py src/obstacle.py
+
+import argparse
+import os
+import sys
+
+from hostsim.sim import BOARD_DIR, LIB_DIR, script_literal
+
+sys.path[:0] = [BOARD_DIR, LIB_DIR]  # colorlut imports micropython, answered by the host stand-in
+from colorlut import build  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile script colour thresholds into RGB565 lookup tables")
+    parser.add_argument("scripts", nargs="+", help="src/open.py and/or src/obstacle.py")
+    parser.add_argument("--out", help="output directory (default: next to each script)")
+    parser.add_argument("--byteswap", action="store_true", help="frames store RGB565 pixels high byte first")
+    args = parser.parse_args(argv)
+    for script in args.scripts:
+        with open(script) as f:
+            th = script_literal(f.read(), "th")
+        if not th:
+            print("%s: no th dictionary" % script)
+            return 1
+        lut = build(th, byteswap=args.byteswap)
+        name = os.path.splitext(os.path.basename(script))[0] + ".lut"
+        out = args.out or os.path.dirname(script) or "."
+        os.makedirs(out, exist_ok=True)
+        path = os.path.join(out, name)
+        lut.save(path)
+        print("%s -> %s" % (script, path))
+        table = lut.table
+        for key in lut.keys:
+            bit = lut.bits[key]
+            n = sum(1 for m in table if m & bit)
+            print("  %-3s %5d values (%.2f %%)" % (key, n, 100.0 * n / len(table)))
+        for i, a in enumerate(lut.keys):
+            for b in lut.keys[i + 1:]:
+                both = lut.bits[a] | lut.bits[b]
+                n = sum(1 for m in table if m & both == both)
+                if n:
+                    print("  overlap %s/%s: %d values" % (a, b, n))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
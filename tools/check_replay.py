@@ -0,0 +1,62 @@
+# check_replay.py
+# Regression check that replay reproduces a run exactly.
+# CPython code.
+# Each script is run in the host simulator on the default TrackWorld, its trace.bin is replayed through the same
+# script (hostsim/replay.py) and the replayed telemetry.bin must match the recorded one on every tick with no
+# steering tolerance. The simulated runs wait a different time for the start button than replay does, as a car
+# run does, so a timer the script takes before `start` (calibration and the button wait are not in the trace)
+# shows up as a divergence. Exits 1 when any run diverges.
+#
+# Usage: python tools/check_replay.py [src/open.py src/obstacle.py] --seconds 15 --out check_out
+
+import argparse
+import os
+import shutil
+import sys
+
+from hostsim import TrackWorld, run_script
+from hostsim.replay import compare_telemetry, replay_script
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+SCRIPTS = [os.path.join(SRC_DIR, "open.py"), os.path.join(SRC_DIR, "obstacle.py")]
+PILLARS = [("R", 1500.0, 2300.0), ("G", 2500.0, 1200.0)]  # obstacle.py needs something to follow
+PRESS_DELAYS_MS = (200, 1000, 3000)  # Button waits of the recorded runs; replay presses after 200 ms
+GYRO_NOISE = 0.05  # Calibration takes a noise-dependent time, which is not in the trace either
+
+
+def check(script, press_ms, seconds, out_dir):
+    # Record a simulated run of script and replay it; returns the first divergence or None, and the tick count
+    shutil.rmtree(out_dir, ignore_errors=True)
+    world = TrackWorld(start=(1500, 2500, 0), pillars=PILLARS, gyro_noise=GYRO_NOISE)
+    run_script(script, world, seconds=seconds, out_dir=out_dir, press_delay_ms=press_ms)
+    replay_dir = os.path.join(out_dir, "replay")
+    replay, sim = replay_script(script, os.path.join(out_dir, "trace.bin"), replay_dir)
+    if sim.error:
+        print(sim.error)
+    return compare_telemetry(os.path.join(out_dir, "telemetry.bin"), os.path.join(replay_dir, "telemetry.bin"), 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that replaying a simulated run reproduces it exactly")
+    parser.add_argument("scripts", nargs="*", default=SCRIPTS, help="navigation scripts (default: both)")
+    parser.add_argument("--seconds", type=float, default=15.0, help="length of each simulated run")
+    parser.add_argument("--out", default="check_out", help="directory for the simulated and replayed logs")
+    args = parser.parse_args(argv)
+    diverged = 0
+    for script in args.scripts:
+        name = os.path.splitext(os.path.basename(script))[0]
+        for press_ms in PRESS_DELAYS_MS:
+            out_dir = os.path.abspath(os.path.join(args.out, "%s_%d" % (name, press_ms)))
+            divergence, n = check(script, press_ms, args.seconds, out_dir)
+            if divergence is None:
+                print("%s, button after %d ms: identical over %d ticks" % (name, press_ms, n))
+                continue
+            diverged += 1
+            i, t_ms, field, a, b = divergence
+            print("%s, button after %d ms: first divergence at tick %d (t=%d ms): %s recorded %s, replayed %s" % (
+                name, press_ms, i, t_ms, field, a, b))
+    return 1 if diverged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+# hostsim
+# Host-side hardware simulation for the camera microcontroller scripts.
+# CPython code.
+# hostsim/board holds CPython versions of the firmware modules (pyb, machine, sensor, uasyncio) that
+# open.py and obstacle.py import; they delegate to a Simulator (virtual clock and devices) fed by a World.
+
+from hostsim.sim import Simulator, run_script, script_state, DEFAULT_COSTS
+from hostsim.world import World, TrackWorld
+from hostsim.replay import replay_script, compare_telemetry
@@ -0,0 +1,66 @@
+# machine.py
+# Host stand-in for the MicroPython machine module.
+# CPython code.
+# UART 9 talks to the simulated slave, SPI 5 to the simulated LSM6DSOX and I2C 2 to the front ToF.
+
+from hostsim.sim import current
+from pyb import Pin
+
+
+class UART:
+    def __init__(self, id, baudrate=115200, bits=8, parity=None, stop=1, rxbuf=64, **kwargs):
+        self.id = id
+        current().slave.set_rxbuf(rxbuf)
+
+    def any(self):
+        return current().slave.any()
+
+    def read(self, n=None):
+        sim = current()
+        sim.charge("uart")
+        return sim.slave.read(n)
+
+    def readinto(self, buf):
+        sim = current()
+        sim.charge("uart")
+        return sim.slave.readinto(buf)
+
+    def write(self, data):
+        sim = current()
+        sim.charge("uart")
+        return sim.slave.write(data)
+
+
+class SPI:
+    def __init__(self, id, baudrate=1000000, polarity=0, phase=0, **kwargs):
+        self.id = id
+
+    def write(self, data):
+        sim = current()
+        sim.charge("spi")
+        sim.imu.write(data)
+
+    def readinto(self, buf):
+        sim = current()
+        sim.charge("spi")
+        sim.imu.readinto(buf)
+
+
+class I2C:
+    def __init__(self, id, **kwargs):
+        self.id = id
+
+    def readfrom_mem(self, addr, reg, n, addrsize=8):
+        buf = bytearray(n)
+        self.readfrom_mem_into(addr, reg, buf, addrsize)
+        return bytes(buf)
+
+    def readfrom_mem_into(self, addr, reg, buf, addrsize=8):
+        sim = current()
+        sim.charge("i2c")
+        sim.front_tof.readfrom_mem_into(addr, reg, buf)
+
+    def writeto_mem(self, addr, reg, buf, addrsize=8):
+        sim = current()
+        sim.charge("i2c")
+        sim.front_tof.writeto_mem(addr, reg, bytes(buf))
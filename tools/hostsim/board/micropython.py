@@ -0,0 +1,31 @@
+# micropython.py
+# Host stand-in for the MicroPython micropython module.
+# CPython code.
+# The code emitters are plain decorators on the host, so @micropython.native and @micropython.viper functions run
+# as ordinary Python. The viper pointer casts ptr8/ptr16/ptr32 are installed as builtins, viewing a buffer as
+# unsigned bytes, native-order unsigned 16-bit words or signed 32-bit words.
+
+import builtins
+
+
+def native(f):
+    return f
+
+
+def viper(f):
+    return f
+
+
+def const(value):
+    return value
+
+
+def _view(buf, fmt):
+    if hasattr(buf, "typecode") and buf.itemsize == {"B": 1, "H": 2, "i": 4}[fmt]:
+        return buf  # An array of the right width already indexes like the pointer
+    return memoryview(buf).cast("B").cast(fmt)
+
+
+builtins.ptr8 = lambda buf: _view(buf, "B")
+builtins.ptr16 = lambda buf: _view(buf, "H")
+builtins.ptr32 = lambda buf: _view(buf, "i")
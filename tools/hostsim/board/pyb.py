@@ -0,0 +1,97 @@
+# pyb.py
+# Host stand-in for the OpenMV pyb module.
+# CPython code.
+# Clock, delays, pins and timer PWM channels used by the scripts, bound to the current hostsim Simulator.
+
+from hostsim.sim import current, Standby, US_MASK
+
+
+def millis():
+    sim = current()
+    sim.charge("clock")
+    return (sim.now_us // 1000) & US_MASK
+
+
+def micros():
+    sim = current()
+    sim.charge("clock")
+    return sim.now_us & US_MASK
+
+
+def elapsed_millis(start):
+    return (millis() - start) & US_MASK
+
+
+def elapsed_micros(start):
+    return (micros() - start) & US_MASK
+
+
+def delay(ms):
+    current().advance(ms * 1000)
+
+
+def udelay(us):
+    current().advance(us)
+
+
+def standby():
+    raise Standby()
+
+
+class Pin:
+    # GPIO by name; outputs are recorded on the Simulator, inputs read from it
+    IN = 0
+    OUT = 1
+    OUT_PP = 1
+    OUT_OD = 2
+    AF_PP = 3
+    PULL_NONE = 0
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=IN, pull=PULL_NONE):
+        self.id = id
+        self.mode = mode
+
+    def value(self, v=None):
+        sim = current()
+        if v is None:
+            return sim.pin_value(self.id)
+        sim.pins[self.id] = 1 if v else 0
+
+    def high(self):
+        self.value(1)
+
+    def low(self):
+        self.value(0)
+
+    on = high
+    off = low
+
+
+class TimerChannel:
+    # PWM output of one timer channel
+    def __init__(self, pwm):
+        self._pwm = pwm
+
+    def pulse_width(self, value=None):
+        if value is None:
+            return self._pwm.pulse
+        self._pwm.pulse = value
+
+    def pulse_width_percent(self, value=None):
+        if value is None:
+            return self._pwm.percent
+        self._pwm.percent = value
+
+
+class Timer:
+    PWM = 0
+    PWM_INVERTED = 1
+
+    def __init__(self, id, freq=None, **kwargs):
+        self.id = id
+        self.freq = freq
+
+    def channel(self, channel, mode=None, pin=None, **kwargs):
+        return TimerChannel(current().channel(self.id, channel))
@@ -0,0 +1,80 @@
+# sensor.py
+# Host stand-in for the OpenMV sensor module.
+# CPython code.
+# snapshot() returns an Image whose find_blobs() is answered by the Simulator's World.
+
+from hostsim.sim import current
+
+GRAYSCALE = 1
+RGB565 = 2
+QQQVGA = 3
+QQVGA = 4
+HQVGA = 5
+QVGA = 6
+VGA = 8
+FRAME_SIZES = {QQQVGA: (80, 60), QQVGA: (160, 120), HQVGA: (240, 160), QVGA: (320, 240), VGA: (640, 480)}
+
+
+def reset():
+    current().window = None
+
+
+def set_pixformat(pixformat):
+    current().charge("sensor_mode")
+
+
+def set_framesize(framesize):
+    sim = current()
+    sim.charge("sensor_mode")
+    sim.framesize = FRAME_SIZES[framesize]
+    sim.window = None  # A new frame size drops the window, as on the board
+
+
+def set_windowing(roi):
+    sim = current()
+    sim.charge("window")
+    w, h = sim.framesize
+    if len(roi) == 2:
+        roi = ((w - roi[0]) // 2, (h - roi[1]) // 2, roi[0], roi[1])
+    sim.window = tuple(roi)
+
+
+def set_vflip(enable):
+    pass
+
+
+def set_hmirror(enable):
+    pass
+
+
+def set_auto_gain(enable, **kwargs):
+    pass
+
+
+def set_auto_whitebal(enable, **kwargs):
+    pass
+
+
+def set_auto_exposure(enable, **kwargs):
+    pass
+
+
+def skip_frames(n=None, time=None):
+    sim = current()
+    if time is not None:
+        sim.advance(time * 1000)
+    else:
+        for _ in range(n or 10):
+            sim.snapshot()
+
+
+def width():
+    return current().frame_size()[0]
+
+
+def height():
+    return current().frame_size()[1]
+
+
+def snapshot():
+    return current().snapshot()
@@ -0,0 +1,104 @@
+# uasyncio.py
+# Host stand-in for MicroPython uasyncio on the hostsim virtual clock.
+# CPython code.
+# A single-threaded scheduler: tasks wait in a queue ordered by wake time (then by scheduling order), and the
+# virtual clock jumps straight to the next wake time, so sleeps cost no host time and runs are repeatable.
+
+import heapq
+
+from hostsim.sim import current
+
+
+class CancelledError(BaseException):
+    pass
+
+
+class _Sleep:
+    # Awaitable handed to the scheduler: resume the task after ms milliseconds
+    def __init__(self, ms):
+        self.ms = ms
+
+    def __await__(self):
+        yield self
+
+
+def sleep_ms(ms):
+    return _Sleep(ms)
+
+
+def sleep(s):
+    return _Sleep(s * 1000)
+
+
+class Task:
+    def __init__(self, coro):
+        self.coro = coro
+        self.done = False
+        self.result = None
+        self.error = None
+        self._cancel = False
+
+    def cancel(self):
+        self._cancel = True
+
+
+class _Loop:
+    def __init__(self):
+        self.queue = []
+        self.order = 0  # Tie-break so tasks due at the same time run in scheduling order
+
+    def schedule(self, task, wake_us):
+        self.order += 1
+        heapq.heappush(self.queue, (wake_us, self.order, task))
+
+
+_loop = None
+
+
+def create_task(coro):
+    task = Task(coro)
+    _loop.schedule(task, current().now_us)
+    return task
+
+
+def run(coro):
+    # Run coro and every task it creates until coro returns
+    global _loop
+    sim = current()
+    if sim.on_run is not None:
+        sim.on_run(sim)  # Host hook, e.g. the replay engine taking over the sensing tasks
+    _loop = _Loop()
+    main = Task(coro)
+    _loop.schedule(main, sim.now_us)
+    try:
+        while not main.done:
+            wake_us, _, task = heapq.heappop(_loop.queue)
+            sim.advance_to(wake_us)
+            try:
+                if task._cancel:
+                    task._cancel = False
+                    request = task.coro.throw(CancelledError())
+                else:
+                    request = task.coro.send(None)
+            except StopIteration as e:
+                task.done = True
+                task.result = e.value
+                continue
+            except CancelledError:
+                task.done = True
+                if task is main:
+                    raise
+                continue
+            except Exception as e:
+                task.done = True
+                task.error = e
+                if task is main:
+                    raise
+                print("Task exception wasn't retrieved:", repr(e))
+                continue
+            _loop.schedule(task, sim.now_us + int(request.ms * 1000))
+        return main.result
+    finally:
+        for _, _, task in _loop.queue:
+            task.coro.close()
+        _loop = None
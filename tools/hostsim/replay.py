@@ -0,0 +1,150 @@
+# replay.py
+# Deterministic replay of recorded runs through the navigation state machines.
+# CPython code.
+# trace.bin (lib/telemetry.py InputTrace) holds, for every control tick of a run, the tick time and every value
+# the state machines read: heading, encoder distance and speed, side ToF, front ToF reads and the detection slot of each
+# colour. replay_script() runs the script unchanged in the host simulator with its sensor and vision tasks idle;
+# before each control tick the virtual clock is moved to the recorded tick time (relative to the script's
+# `start`) and the recorded inputs are written into the script globals and detector slots. The control code
+# therefore sees exactly what it saw on the car and issues the same state transitions and commands, which the
+# script's own telemetry recorder writes to telemetry.bin for compare_telemetry().
+
+import json
+import struct
+import sys
+import time
+
+from hostsim.sim import run_script
+from hostsim.world import World
+
+
+class ReplayEnd(Exception):
+    # Raised into the control task when the trace is exhausted
+    pass
+
+
+def load_records(path):
+    # Returns (header, records) with records as a list of dicts keyed by field name
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+        data = f.read()
+    size = header["record_size"]
+    data = data[:len(data) - len(data) % size]  # Drop a record cut short by a power loss
+    fields = header["fields"]
+    records = [dict(zip(fields, values)) for values in struct.iter_unpack(header["format"], data)]
+    return header, records
+
+
+def detection_keys(header):
+    # Colour keys stored in a trace, in record order
+    return [f[:-3] for f in header["fields"] if f.endswith("_cx")]
+
+
+class ReplayWorld(World):
+    # Motionless world; the front ToF answers the distance recorded for the current tick at every read
+    def __init__(self):
+        World.__init__(self)
+        self.front = 0
+        self.front_on_demand = True
+
+    def front_tof(self):
+        return self.front
+
+
+class ReplayTicker:
+    # Stands in for the control task's Ticker: wakes at the recorded tick times and loads the recorded inputs
+    def __init__(self, replay):
+        self.replay = replay
+        self.overruns = 0
+
+    async def wait(self):
+        replay = self.replay
+        if replay.index >= len(replay.records):
+            replay.finished = True
+            raise ReplayEnd("trace exhausted after %d ticks" % replay.index)
+        rec = replay.records[replay.index]
+        replay.index += 1
+        wake_us = (rec["t_ms"] + replay.offset_ms) * 1000
+        sim = replay.sim
+        await sys.modules["uasyncio"].sleep_ms(max(0, wake_us - sim.now_us) / 1000.0)
+        replay.load(rec)
+
+
+class Replay:
+    # Feeds one recorded trace into a script run
+    def __init__(self, trace_path, overrides=None):
+        self.header, self.records = load_records(trace_path)
+        self.keys = detection_keys(self.header)
+        self.overrides = dict(overrides or {})  # Script globals replaced before the control task starts
+        self.world = ReplayWorld()
+        self.sim = None
+        self.index = 0  # Next trace record
+        self.offset_ms = 0  # Replay clock minus car clock
+        self.finished = False  # True when every recorded tick was replayed
+
+    def install(self, sim):
+        # uasyncio.run() hook: idle the sensing tasks and take over the control ticker
+        self.sim = sim
+        g = sim.globals
+        g.update(self.overrides)
+        g["sensor_step"] = _idle_step
+        g["vision_task"] = _idle_task
+        g["Ticker"] = lambda period_ms: ReplayTicker(self)
+        self.offset_ms = g["start"] - self.header["start_ms"]
+
+    def load(self, rec):
+        # Write one tick's recorded inputs into the script
+        g = self.sim.globals
+        g["angle"] = rec["angle"]
+        g["encoder"] = rec["encoder"]
+        g["wheel_speed"] = rec.get("wheel_speed", 0.0)  # Traces recorded before the slave sent speed: none
+        g["tof_left"] = rec["tof_left"]
+        g["tof_right"] = rec["tof_right"]
+        self.world.front = rec["tof_front"]
+        detector = g["detector"]
+        for key in self.keys:
+            slot = detector.slots[key]
+            pixels = rec[key + "_pixels"]
+            slot.det = pixels > 0
+            slot.cx = rec[key + "_cx"]
+            slot.cy = rec[key + "_cy"]
+            slot.pixels = pixels
+            slot.error = slot.cx - detector.center if slot.det else 0
+        detector.seq = rec["seq"]
+
+
+def _idle_step():
+    pass
+
+
+async def _idle_task():
+    while True:
+        await sys.modules["uasyncio"].sleep_ms(1000)
+
+
+def replay_script(script, trace_path, out_dir, overrides=None):
+    # Replay trace_path through script; returns (replay, sim) with the replayed telemetry.bin in out_dir
+    replay = Replay(trace_path, overrides)
+    start = time.perf_counter()
+    sim = run_script(script, replay.world, seconds=None, out_dir=out_dir, on_run=replay.install)
+    sim.wall_s = time.perf_counter() - start
+    if replay.finished:
+        sim.reason = "trace end"
+    return replay, sim
+
+
+def compare_telemetry(recorded_path, replayed_path, steer_tol=1):
+    # First tick where state, speed, camera error or steering (beyond steer_tol) differ, or None;
+    # returns (index, t_ms, field, recorded value, replayed value) and the number of ticks compared
+    _, recorded = load_records(recorded_path)
+    _, replayed = load_records(replayed_path)
+    n = min(len(recorded), len(replayed))
+    for i in range(n):
+        a, b = recorded[i], replayed[i]
+        for field in ("state", "speed", "cam_error", "steer"):
+            tol = steer_tol if field == "steer" else 0
+            if abs(a[field] - b[field]) > tol:
+                return (i, a["t_ms"], field, a[field], b[field]), n
+    if len(recorded) != len(replayed):
+        return (n, recorded[n - 1]["t_ms"] if n else 0, "ticks", len(recorded), len(replayed)), n
+    return None, n
@@ -0,0 +1,651 @@
+# sim.py
+# Virtual board for running open.py and obstacle.py under CPython.
+# CPython code.
+# The Simulator owns a virtual microsecond clock and the simulated devices behind the MicroPython modules in
+# hostsim/board (pyb, machine, sensor, uasyncio, micropython): the UART slave speaking the uart_slave.ino
+# protocol, the LSM6DSOX gyro with its FIFO, the front VL53L1X on I2C, the camera, servo/motor PWM channels, button
+# and LED.
+# Time only moves when the script sleeps or calls something with a modelled cost (snapshot, find_blobs,
+# bus transfers), so a run is deterministic and limited only by host CPU speed. The World is stepped in
+# 1 ms physics steps as the clock passes them.
+#
+# run_script() executes a navigation script unchanged with these modules in place of the firmware ones.
+
+import ast
+import gc
+import math
+import os
+import struct
+import sys
+import time
+import traceback
+from collections import deque
+
+US_MASK = 0x3FFFFFFF  # pyb.millis()/micros() wrap at 2**30
+SUBSTEP_US = 1000  # World physics step
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOARD_DIR = os.path.join(TOOLS_DIR, "hostsim", "board")
+LIB_DIR = os.path.join(os.path.dirname(TOOLS_DIR), "src", "lib")
+BOARD_MODULES = ("pyb", "machine", "sensor", "uasyncio", "micropython")
+HOST_HEAP = 262144  # Heap size gc.mem_free() reports: the host has no MicroPython heap to measure
+
+# gc is built into CPython and cannot be shadowed from hostsim/board, so the MicroPython heap queries are added
+if not hasattr(gc, "mem_free"):
+    gc.mem_free = lambda: HOST_HEAP
+    gc.mem_alloc = lambda: 0
+
+# Modelled execution time in microseconds of calls that take real time on the board
+DEFAULT_COSTS = {
+    "clock": 1,  # pyb.millis() / pyb.micros()
+    "snapshot": 2000,  # sensor.snapshot() fixed part
+    "snapshot_px": 0.13,  # sensor.snapshot() per captured pixel (full QVGA: 12 ms)
+    "find_blobs": 300,  # One Image.find_blobs() pass, fixed part
+    "blobs_px": 0.066,  # Image.find_blobs() per seed pixel scanned (ROI pixels / (x_stride * y_stride))
+    "window": 100,  # sensor.set_windowing()
+    "pixel_pass_px": 0.005,  # Image.bytearray() per window pixel: a viper pass over a 4 x 2 grid of the frame
+    "sensor_mode": 100000,  # sensor.set_framesize() / set_pixformat(): sensor reprogramming and a dropped frame
+    "i2c": 300,  # One I2C register transfer
+    "spi": 20,  # One SPI transfer
+    "uart": 10,  # One UART read or write call
+}
+
+# Board wiring used by both scripts: (timer, channel) of each PWM output and servo pulse range
+SERVO_PWM = (4, 3)
+MOTOR_FORWARD_PWM = (1, 2)
+MOTOR_REVERSE_PWM = (1, 3)
+SERVO_PULSES = (1775, 2575, 3275)  # Full left, centre, full right pulse widths unless the script defines its own
+LED_PINS = ("PE3", "PC13", "PF4")  # R, G, B, active low
+BUTTON_PIN = "A0"  # Start button, active low
+
+# Slave protocol constants, must match uart_slave.ino
+FRAME_SYNC = b"\xa5\x5a"
+PULSES_PER_MILLIMETER = 3.024
+VELOCITY_FILTER = 0.5  # uart_slave.ino low-pass weight of each encoder speed sample
+# Text command timing of the slave firmware: (loop delay, blocking work per command) in us. The current firmware
+# answers from its ranging cache and has no loop delay; the baseline firmware (2a5196f) read both ToF sensors over
+# I2C inside every command (about 0.6 ms each) and ran delay(15) at the end of every loop
+SLAVE_TIMING = {"current": (0, 0), "baseline": (15000, 1200)}
+UART_CHAR_US = 87  # One 10-bit character at 115200 baud
+TOF_PERIOD_MS = 25  # uart_slave.ino continuous ranging period of each side ToF
+TOF_OFFSET_MS = (0, 12)  # Left and right ranging phase: the right sensor starts half a period later
+FRONT_TOF_OSC = 0x0190  # Front VL53L1X RESULT__OSC_CALIBRATE_VAL
+FRONT_TOF_FIRST_MS = 20  # Front VL53L1X ranging time before an inter-measurement period is programmed
+
+# LSM6DSOX registers used by lib/imu.py and lib/heading.py
+ODR_HZ = {1: 12.5, 2: 26, 3: 52, 4: 104, 5: 208, 6: 416, 7: 833, 8: 1666, 9: 3332, 10: 6667}
+GYRO_SENS = {0: 0.00875, 1: 0.0175, 2: 0.035, 3: 0.070}
+ACCEL_SENS = {0: 0.000061, 2: 0.000122, 3: 0.000244, 1: 0.000488}
+FIFO_DEPTH = 512
+
+_current = None
+
+
+def current():
+    # Simulator the board modules are bound to
+    return _current
+
+
+class Standby(BaseException):
+    # Raised by pyb.standby(): the script finished
+    pass
+
+
+class TimeLimit(Exception):
+    # Raised once when the virtual clock passes the run time limit
+    pass
+
+
+def crc16(data):
+    # CRC-16/CCITT (poly 0x1021, init 0xFFFF), same as the slave and lib/link.py
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        crc &= 0xFFFF
+    return crc
+
+
+class Pwm:
+    # One timer channel output
+    def __init__(self):
+        self.pulse = 0  # Pulse width in timer ticks
+        self.percent = 0.0  # Duty cycle in percent
+
+
+class Slave:
+    # uart_slave.ino behind UART 9: ready byte, 'f'/'s'/'z' commands and streamed binary frames. The encoder edge
+    # times are interpolated from the odometer between frames and fed to the firmware's velocity estimate. The side
+    # ToF distances come from the firmware's ranging cache: each side is sampled every TOF_PERIOD_MS at its phase.
+    # The text requests 'r'/'t'/'u'/'e' are answered as the firmware's loop gets to them: one command per loop
+    # pass, each pass ending in the loop delay of the timing profile (SLAVE_TIMING), the reply sent after the
+    # command's blocking work and its characters on the wire
+    def __init__(self, sim, rxbuf=512, timing="current"):
+        self.sim = sim
+        self.loop_delay_us, self.command_us = SLAVE_TIMING[timing]
+        self._loop_us = 0  # Virtual time the firmware loop next checks for a command
+        self._replies = deque()  # (due us, text) of answered text requests
+        self.rx = bytearray(b"\x01")  # Bytes waiting in the board's UART buffer, starts with the ready byte
+        self.rxbuf = rxbuf
+        self.period_ms = 0
+        self.next_ms = 0
+        self.seq = 0
+        self.epoch = 0
+        self.base = 0.0  # World odometer at the last encoder reset
+        self._await_period = False  # 's' received, period byte pending
+        self.dropped = 0  # Bytes lost to a full receive buffer
+        self.velocity = 0.0  # Filtered encoder speed in pulses/s
+        self.edge_us = 0  # Virtual time of the last encoder edge
+        self._pulses = 0.0  # Odometer in pulses at the last frame
+        self._sample_us = 0  # Virtual time of the last frame
+        self._edges = 0  # Edge index (odometer pulses since the start) at the last velocity update
+        self._edges_us = 0  # Edge time at the last velocity update
+        self.tof = [0, 0]  # Cached left and right distances in mm
+        self.tof_ms = [0, 0]  # Virtual ms of the cached results
+
+    def set_rxbuf(self, rxbuf):
+        self.rxbuf = rxbuf
+
+    def write(self, data):
+        for c in bytes(data):
+            if self._await_period:
+                self._await_period = False
+                self.period_ms = c
+                self.next_ms = self.sim.now_us // 1000
+                continue
+            c = chr(c)
+            if c == "s":
+                self._await_period = True
+            elif c == "f":
+                self._send()
+            elif c == "z":
+                self.base = self.sim.world.odometer()
+                self.epoch = (self.epoch + 1) & 0xFF
+            elif c in "rtue":
+                self._text(c)
+        return len(data)
+
+    def _text(self, c):
+        # Queue the reply to a text request for the loop pass that reads it
+        now = self.sim.now_us
+        start = self._loop_us
+        if start < now:
+            passes = -(-(now - start) // self.loop_delay_us) if self.loop_delay_us else 0
+            start = max(now, start + passes * self.loop_delay_us)
+        travel = (self.sim.world.odometer() - self.base) * PULSES_PER_MILLIMETER
+        travel = int(travel) / PULSES_PER_MILLIMETER  # Whole pulses, as the firmware counts them
+        left, right = self.tof
+        text = {"r": b"%d,%d,%.2f\r\n" % (left, right, travel), "t": b"%d\r\n" % left, "u": b"%d\r\n" % right,
+                "e": b"%.2f\r\n" % travel}[c]
+        due = start + self.command_us + len(text) * UART_CHAR_US
+        self._replies.append((due, text))
+        self._loop_us = due + self.loop_delay_us
+
+    def tick(self, now_ms):
+        while self._replies and self._replies[0][0] <= now_ms * 1000:
+            self.rx += self._replies.popleft()[1]
+        for side in (0, 1):
+            if now_ms >= TOF_OFFSET_MS[side] and (now_ms - TOF_OFFSET_MS[side]) % TOF_PERIOD_MS == 0:
+                self.tof[side] = self.sim.world.side_tof()[side]
+                self.tof_ms[side] = now_ms
+        if self.period_ms and now_ms - self.next_ms >= self.period_ms:
+            self.next_ms += self.period_ms
+            if now_ms - self.next_ms >= self.period_ms:
+                self.next_ms = now_ms  # Resync after a stall
+            self._send()
+
+    def _encoder(self, now_us):
+        # Edge time of the last pulse boundary the odometer crossed since the previous frame, then the
+        # firmware's updateVelocity()
+        pulses = self.sim.world.odometer() * PULSES_PER_MILLIMETER
+        moved = pulses - self._pulses
+        edge = math.floor(pulses) if moved >= 0 else math.ceil(pulses)
+        if edge != self._edges:
+            past = abs(pulses - edge) / abs(moved)  # Share of the travel since the last frame after the edge
+            self.edge_us = now_us - int(past * (now_us - self._sample_us))
+            span = self.edge_us - self._edges_us
+            rate = (edge - self._edges) * 1e6 / span if span else self.velocity
+            self._edges = edge
+            self._edges_us = self.edge_us
+        else:
+            bound = 1e6 / (now_us - self.edge_us + 1)
+            rate = max(-bound, min(bound, self.velocity))
+        self.velocity += (rate - self.velocity) * VELOCITY_FILTER
+        self._pulses = pulses
+        self._sample_us = now_us
+
+    def _send(self):
+        left, right = self.tof
+        count = int((self.sim.world.odometer() - self.base) * PULSES_PER_MILLIMETER)
+        now_us = self.sim.now_us
+        self._encoder(now_us)
+        velocity = max(-32767, min(32767, int(self.velocity)))
+        age = min(255, now_us // 1000 - min(self.tof_ms))
+        body = struct.pack("<HIhhiBBhI", self.seq & 0xFFFF, (now_us // 1000) & 0xFFFFFFFF, left, right,
+                           count, self.epoch, age, velocity, self.edge_us & 0xFFFFFFFF)
+        self.seq += 1
+        frame = FRAME_SYNC + body + struct.pack("<H", crc16(body))
+        room = self.rxbuf - len(self.rx)
+        if room < len(frame):
+            self.dropped += len(frame) - max(room, 0)
+            frame = frame[:max(room, 0)]
+        self.rx += frame
+
+    def any(self):
+        return len(self.rx)
+
+    def read(self, n=None):
+        n = len(self.rx) if n is None else min(n, len(self.rx))
+        if n == 0:
+            return None
+        data = bytes(self.rx[:n])
+        del self.rx[:n]
+        return data
+
+    def readinto(self, buf):
+        n = min(len(buf), len(self.rx))
+        buf[:n] = self.rx[:n]
+        del self.rx[:n]
+        return n
+
+
+class Lsm6dsox:
+    # Register-level LSM6DSOX on SPI 5: output and temperature registers, WHO_AM_I and the gyro FIFO
+    def __init__(self, sim):
+        self.sim = sim
+        self.regs = bytearray(128)
+        self.regs[0x0F] = 0x6C
+        self.fifo = deque()
+        self.overrun = False  # FIFO_OVR_IA: a sample was overwritten since the last status read
+        self.next_us = 0  # Time of the next FIFO gyro sample
+        self._addr = None  # Register address of a pending read
+        self._rate = 0.0  # Yaw rate of the latest sample
+
+    def gyro_sens(self):
+        return GYRO_SENS[(self.regs[0x11] >> 2) & 0x3]
+
+    def accel_sens(self):
+        return ACCEL_SENS[(self.regs[0x10] >> 2) & 0x3]
+
+    def fifo_rate(self):
+        # Gyro batch rate in Hz, 0 when the FIFO is not collecting gyro samples
+        if self.regs[0x0A] & 0x7 == 0:
+            return 0
+        return ODR_HZ.get(self.regs[0x09] >> 4, 0)
+
+    def write(self, data):
+        data = bytes(data)
+        if data[0] & 0x80:
+            self._addr = data[0] & 0x7F
+            return
+        reg = data[0]
+        for v in data[1:]:
+            self.regs[reg] = v
+            if reg == 0x0A and v & 0x7 == 0:
+                self.fifo.clear()  # Bypass mode empties the FIFO
+                self.overrun = False
+            if reg == 0x0A and v & 0x7:
+                self.next_us = self.sim.now_us
+            reg += 1
+
+    def tick(self, now_us):
+        rate = self.fifo_rate()
+        if not rate:
+            return
+        period = 1e6 / rate
+        while self.next_us <= now_us:
+            self._rate = self.sim.world.yaw_rate()
+            if len(self.fifo) >= FIFO_DEPTH:
+                self.fifo.popleft()
+                self.overrun = True
+            self.fifo.append(self._word(0x01, (self._raw(self._rate, self.gyro_sens()), 0, 0)))
+            self.next_us += period
+
+    def _raw(self, value, sens):
+        return max(-32768, min(32767, int(round(value / sens))))
+
+    def _word(self, tag, xyz):
+        return struct.pack("<Bhhh", tag << 3, *xyz)
+
+    def readinto(self, buf):
+        addr = self._addr
+        n = len(buf)
+        if addr == 0x22:
+            g = self._raw(self.sim.world.yaw_rate(), self.gyro_sens())
+            data = struct.pack("<6h", g, 0, 0, 0, 0, self._raw(1.0, self.accel_sens()))
+        elif addr == 0x20:
+            data = struct.pack("<h", max(-32768, min(32767, int(round((self.sim.world.temperature() - 25.0) * 256)))))
+        elif addr == 0x3A:
+            count = len(self.fifo)
+            # FIFO_OVR_IA after an overwritten sample, FIFO_FULL_IA when the next sample fills the FIFO
+            status = (0x40 if self.overrun else 0) | (0x20 if count >= FIFO_DEPTH - 1 else 0)
+            data = bytes((count & 0xFF, ((count >> 8) & 0x3) | status))
+            self.overrun = False
+        elif addr == 0x78:
+            words = []
+            for _ in range(n // 7):
+                words.append(self.fifo.popleft() if self.fifo else bytes(7))
+            data = b"".join(words)
+        else:
+            data = bytes(self.regs[addr:addr + n])
+        buf[:n] = data[:n].ljust(n, b"\x00")
+
+
+class FrontTof:
+    # VL53L1X at 0x29 on I2C 2 at register level (lib/vl53l1x.py): booted, continuous ranging at the programmed
+    # inter-measurement period, data-ready flag, result block and interrupt clear. A new result samples
+    # world.front_tof(), a negative distance gives a signal-fail status. In a world with front_on_demand every
+    # data-ready check finds a new result, so replay answers each read with the recorded distance
+    def __init__(self, sim):
+        self.sim = sim
+        self.regs = bytearray(0x100)  # Register file 0x0000..0x00FF
+        self.regs[0xE5] = 1  # FIRMWARE__SYSTEM_STATUS: booted
+        self.regs[0xDE:0xE0] = struct.pack(">H", FRONT_TOF_OSC)
+        self.ranging = False
+        self.ready = False  # Result waiting for an interrupt clear
+        self.next_us = 0  # Virtual time of the next result
+        self.result_us = 0  # Virtual time of the last result
+
+    def _period_us(self):
+        # Programmed inter-measurement period, FRONT_TOF_FIRST_MS before one is set (calibration pass)
+        raw = struct.unpack_from(">I", self.regs, 0x6C)[0]
+        if raw == 0:
+            return FRONT_TOF_FIRST_MS * 1000
+        return int(raw / (FRONT_TOF_OSC * 1.075) * 1000)
+
+    def _update(self):
+        now = self.sim.now_us
+        if self.ranging and not self.ready and (self.sim.world.front_on_demand or now >= self.next_us):
+            d = self.sim.world.front_tof()
+            self.regs[0x89] = 9 if d >= 0 else 4  # Raw range status: valid / signal fail
+            self.regs[0x96:0x98] = struct.pack(">H", max(0, min(0xFFFF, d)))
+            self.ready = True
+            self.result_us = now
+
+    def writeto_mem(self, addr, reg, data):
+        if addr != 0x29:
+            raise OSError(19)  # ENODEV: no device acknowledged
+        self._update()
+        self.regs[reg:reg + len(data)] = data
+        if reg <= 0x87 < reg + len(data):
+            self.ranging = self.regs[0x87] == 0x40
+            self.ready = False
+            self.next_us = self.sim.now_us + self._period_us()
+        elif reg == 0x86 and data[0] & 0x01:
+            self.ready = False
+            self.next_us = max(self.result_us + self._period_us(), self.sim.now_us)
+
+    def readfrom_mem_into(self, addr, reg, buf):
+        if addr != 0x29:
+            raise OSError(19)
+        self._update()
+        self.regs[0x31] = 1 if self.ready else 0  # GPIO__TIO_HV_STATUS, interrupt active high
+        buf[:] = self.regs[reg:reg + len(buf)]
+
+
+class Blob:
+    # find_blobs() result with the accessors the scripts use
+    def __init__(self, x, y, w, h, pixels, cx, cy):
+        self._rect = (x, y, w, h)
+        self._pixels = pixels
+        self._cx = cx
+        self._cy = cy
+
+    def x(self): return self._rect[0]
+    def y(self): return self._rect[1]
+    def w(self): return self._rect[2]
+    def h(self): return self._rect[3]
+    def rect(self): return self._rect
+    def area(self): return self._rect[2] * self._rect[3]
+    def pixels(self): return self._pixels
+    def cx(self): return self._cx
+    def cy(self): return self._cy
+
+
+class Image:
+    # Camera frame answering find_blobs() from the World; window is (x, y, w, h) of the frame size
+    def __init__(self, sim, frame, window):
+        self.sim = sim
+        self._frame = frame  # Full frame size the window is cut from
+        self._x, self._y, self._w, self._h = window
+
+    def width(self): return self._w
+    def height(self): return self._h
+
+    def bytearray(self):
+        # RGB565 frame drawn from the World: each blob is a filled box of a colour inside its key's thresholds
+        sim = self.sim
+        sim.charge("pixel_pass_px", self._w * self._h)
+        colors = sim.pixel_colors()
+        row = colors[None].to_bytes(2, "little")
+        buf = bytearray(row * (self._w * self._h))
+        for thresholds, key in sim.threshold_keys.items():
+            fill = colors.get(key)
+            if fill is None:
+                continue
+            fill = fill.to_bytes(2, "little")
+            for x, y, w, h, p, cx, cy in sim.world.blobs(key, (self._x, self._y, self._w, self._h), *self._frame):
+                k = min(1.0, (p / float(w * h)) ** 0.5) if w * h else 0.0  # Shrink the box to the blob's pixels
+                hw, hh = w * k / 2, h * k / 2
+                x0, x1 = max(0, int(cx - hw) - self._x), min(self._w, int(cx + hw) + 1 - self._x)
+                for v in range(max(0, int(cy - hh) - self._y), min(self._h, int(cy + hh) + 1 - self._y)):
+                    if x1 > x0:
+                        i = 2 * (v * self._w + x0)
+                        buf[i:i + 2 * (x1 - x0)] = fill * (x1 - x0)
+        return buf
+
+    def find_blobs(self, thresholds, roi=None, pixels_threshold=10, area_threshold=10, merge=False,
+                   x_stride=2, y_stride=1, **kwargs):
+        sim = self.sim
+        rx, ry, rw, rh = roi or (0, 0, self._w, self._h)
+        sim.charge("find_blobs")
+        sim.charge("blobs_px", rw * rh / (x_stride * y_stride))
+        key = sim.threshold_keys.get(threshold_key(thresholds))
+        if key is None:
+            return []
+        # The world projects into the full frame; blobs come back relative to the window
+        found = sim.world.blobs(key, (rx + self._x, ry + self._y, rw, rh), *self._frame)
+        return [Blob(x - self._x, y - self._y, w, h, p, cx - self._x, cy - self._y) for x, y, w, h, p, cx, cy in found
+                if p >= pixels_threshold and w * h >= area_threshold]
+
+
+def threshold_key(thresholds):
+    # Hashable form of a find_blobs threshold list
+    return tuple(tuple(t) for t in thresholds)
+
+
+def script_literal(source, name, default=None):
+    # Value of a top-level `name = <literal>` assignment in the script source
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == name for t in node.targets):
+            try:
+                return ast.literal_eval(node.value)
+            except ValueError:
+                pass
+    return default
+
+
+_pixel_colors = {}  # Threshold keys -> pixel_colors() result, shared by runs of the same script
+
+
+def pixel_colors(keys):
+    # Colour key -> an RGB565 value inside that key's thresholds and no other key's (nearest to the middle of
+    # its first threshold tuple); None -> a background value outside every key
+    cached = _pixel_colors.get(tuple(keys))
+    if cached is not None:
+        return cached
+    from colorlut import inside, rgb565_to_lab
+    th = {key: thresholds for thresholds, key in keys.items()}
+    colors = {}
+    best = {}
+    for pixel in range(65536):
+        lab = rgb565_to_lab(pixel)
+        hits = [key for key in th if inside(lab, th[key])]
+        if not hits:
+            d = lab[1] * lab[1] + lab[2] * lab[2] + (lab[0] - 50) ** 2  # Neutral mid grey
+            if d < best.get(None, (1 << 30,))[0]:
+                best[None] = (d, pixel)
+        elif len(hits) == 1:
+            t = th[hits[0]][0]
+            mid = ((t[0] + t[1]) / 2, (t[2] + t[3]) / 2, (t[4] + t[5]) / 2)
+            d = sum((v - m) ** 2 for v, m in zip(lab, mid))
+            if d < best.get(hits[0], (1 << 30,))[0]:
+                best[hits[0]] = (d, pixel)
+    for key, (d, pixel) in best.items():
+        colors[key] = pixel
+    _pixel_colors[tuple(keys)] = colors
+    return colors
+
+
+def threshold_keys(source):
+    # Map each threshold list of the script's `th` dictionary back to its colour key
+    th = script_literal(source, "th", {})
+    return {threshold_key(v): k for k, v in th.items()}
+
+
+class Simulator:
+    # Virtual clock, devices and world shared by the board modules
+    def __init__(self, world, max_ms=None, costs=None, press_delay_ms=200, slave="current"):
+        self.world = world
+        self.now_us = 0  # Virtual time
+        self.world_us = 0  # Time the world and devices have been stepped to
+        self.max_us = None if max_ms is None else int(max_ms * 1000)
+        self.limit_hit = False
+        self.costs = dict(DEFAULT_COSTS)
+        if costs:
+            self.costs.update(costs)
+        self.pwm = {}  # (timer, channel) -> Pwm
+        self.pins = {}  # Pin name -> output value
+        self.press_delay_ms = press_delay_ms  # Button press this long after the script starts waiting
+        self.press_us = None
+        self.slave = Slave(self, timing=slave)
+        self.imu = Lsm6dsox(self)
+        self.front_tof = FrontTof(self)
+        self.framesize = (320, 240)
+        self.window = None  # (x, y, w, h) from sensor.set_windowing
+        self.threshold_keys = {}  # find_blobs threshold list -> colour key
+        self.servo_pulses = SERVO_PULSES
+        self.frames = 0  # Snapshots taken
+        self.globals = None  # Script globals after run_script
+        self.reason = None  # Why the run ended
+        self.error = None  # Traceback text when the script raised
+        self.wall_s = 0.0  # Host time spent in the run
+        self.on_run = None  # Called with the Simulator by uasyncio.run() before the first task starts
+
+    def charge(self, name, n=1):
+        # Advance the clock by the modelled cost of n calls
+        self.advance(self.costs[name] * n)
+
+    def advance(self, us):
+        self.advance_to(self.now_us + int(us))
+
+    def advance_to(self, t_us):
+        # Move the clock to t_us, stepping the world and devices in physics steps
+        if t_us > self.now_us:
+            self.now_us = t_us
+        while self.world_us + SUBSTEP_US <= self.now_us:
+            self.world_us += SUBSTEP_US
+            self.world.steer = self._steer()
+            self.world.drive = self._drive()
+            self.world.step(SUBSTEP_US / 1e6)
+            self.imu.tick(self.world_us)
+            self.slave.tick(self.world_us // 1000)
+        if self.max_us is not None and self.now_us >= self.max_us and not self.limit_hit:
+            self.limit_hit = True
+            raise TimeLimit("virtual time limit of %.1f s reached" % (self.max_us / 1e6))
+
+    def _steer(self):
+        p = self.pwm.get(SERVO_PWM)
+        if p is None or not p.pulse:
+            return 0.0
+        lo, c, hi = self.servo_pulses
+        return (p.pulse - c) / (hi - c) if p.pulse >= c else (p.pulse - c) / (c - lo)
+
+    def _drive(self):
+        fwd = self.pwm.get(MOTOR_FORWARD_PWM)
+        rev = self.pwm.get(MOTOR_REVERSE_PWM)
+        if fwd is None or rev is None:
+            return 0.0
+        return (fwd.percent - rev.percent) / 100.0
+
+    def channel(self, timer, channel):
+        return self.pwm.setdefault((timer, channel), Pwm())
+
+    def pin_value(self, name):
+        if name == BUTTON_PIN:
+            if self.press_us is None:
+                self.press_us = self.now_us + self.press_delay_ms * 1000
+            pressed = self.press_us <= self.now_us < self.press_us + 100000
+            return 0 if pressed else 1
+        return self.pins.get(name, 0)
+
+    def led(self):
+        # Colour letters of the lit LED channels, e.g. "RB" for magenta
+        return "".join(c for c, p in zip("RGB", LED_PINS) if self.pins.get(p, 1) == 0)
+
+    def frame_size(self):
+        if self.window is not None:
+            return self.window[2], self.window[3]
+        return self.framesize
+
+    def pixel_colors(self):
+        # Fill colours of Image.bytearray() for the running script's thresholds
+        return pixel_colors(self.threshold_keys)
+
+    def snapshot(self):
+        w, h = self.frame_size()
+        self.charge("snapshot")
+        self.charge("snapshot_px", w * h)
+        self.frames += 1
+        return Image(self, self.framesize, self.window or (0, 0) + self.framesize)
+
+
+def script_state(g):
+    # Current state name of a finished script: its state machine's when it has one, else its `state` global
+    sm = g.get("sm")
+    return sm.name if sm is not None else g.get("state")
+
+
+def run_script(path, world, seconds=180.0, out_dir=None, costs=None, press_delay_ms=200, on_run=None,
+               slave="current"):
+    # Execute a navigation script against world with the host board modules; returns the Simulator.
+    # seconds=None runs without a time limit; on_run is installed as Simulator.on_run; slave picks the text command
+    # timing of the slave firmware (SLAVE_TIMING)
+    global _current
+    with open(path) as f:
+        source = f.read()
+    sim = Simulator(world, max_ms=None if seconds is None else seconds * 1000, costs=costs,
+                    press_delay_ms=press_delay_ms, slave=slave)
+    sim.on_run = on_run
+    sim.threshold_keys = threshold_keys(source)
+    sim.servo_pulses = tuple(script_literal(source, name, default)
+                             for name, default in zip(("SERVO_MIN", "SERVO_CENTER", "SERVO_MAX"), SERVO_PULSES))
+    lib_modules = [n[:-3] for n in os.listdir(LIB_DIR) if n.endswith(".py")]
+    for name in lib_modules + list(BOARD_MODULES):
+        sys.modules.pop(name, None)  # Fresh module state (task failures, CRC tables) for every run
+    saved_path = list(sys.path)
+    saved_cwd = os.getcwd()
+    sys.path[:0] = [BOARD_DIR, LIB_DIR, TOOLS_DIR]
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        os.chdir(out_dir)  # profile.bin / telemetry.bin land here
+    _current = sim
+    sim.globals = {"__name__": "__main__", "__file__": os.path.abspath(path)}
+    start = time.perf_counter()
+    try:
+        exec(compile(source, path, "exec"), sim.globals)
+        sim.reason = "finished"
+    except Standby:
+        sim.reason = "standby"
+    except TimeLimit:
+        sim.reason = "time limit"
+    except Exception:
+        sim.reason = "error"
+        sim.error = traceback.format_exc()
+    finally:
+        sim.wall_s = time.perf_counter() - start
+        if sim.limit_hit:
+            sim.reason = "time limit"  # The script's own handler caught it and shut down
+        os.chdir(saved_cwd)
+        sys.path[:] = saved_path
+    return sim
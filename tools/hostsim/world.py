@@ -0,0 +1,241 @@
+# world.py
+# Worlds that feed the host simulator with sensor data.
+# CPython code.
+# A World owns everything the car can sense: it is stepped with the normalised steering and drive commands
+# taken from the servo and motor PWM, and answers the simulated devices with the yaw rate, encoder travel,
+# ToF distances and camera blobs at the current virtual time. TrackWorld is a synthetic WRO Future Engineers
+# field: 3 x 3 m outer walls, 1 x 1 m inner island, orange/blue corner lines, optional red/green pillars and
+# magenta parking walls, driven by a kinematic bicycle model.
+#
+# Coordinates: millimetres, x to the right and y down the field plan, yaw in degrees clockwise from +x, so the
+# yaw follows the same sign as the heading integrated by the scripts (positive = turning right).
+
+import math
+import random
+
+FIELD = 3000.0  # Outer wall square side in mm
+ISLAND = 1000.0  # Inner wall square side in mm
+
+
+class Feature:
+    # One object the camera can see: colour key and sample points (x, y, z, area in mm^2)
+    def __init__(self, key, points, wall=None):
+        self.key = key
+        self.points = points
+        self.wall = wall  # Index of the wall segment the feature lies on (not occluded by itself)
+
+
+class World:
+    # Interface between the simulated board and the environment
+    def __init__(self):
+        self.steer = 0.0  # Normalised steering command, -1 full left .. 1 full right
+        self.drive = 0.0  # Normalised drive command, -1 full reverse .. 1 full forward
+        self.front_on_demand = False  # True: the front ToF has a new result at every data-ready check
+
+    def step(self, dt):
+        # Advance the environment by dt seconds
+        pass
+
+    def yaw_rate(self):
+        # Yaw rate seen by the gyro in dps, clockwise positive
+        return 0.0
+
+    def odometer(self):
+        # Signed wheel travel in mm since the start
+        return 0.0
+
+    def side_tof(self):
+        # (left, right) ToF distances in mm
+        return 0, 0
+
+    def front_tof(self):
+        # Front ToF distance in mm
+        return 0
+
+    def temperature(self):
+        # IMU die temperature in degrees C
+        return 25.0
+
+    def blobs(self, key, roi, width, height):
+        # Blobs of colour key inside roi (x, y, w, h) of a width x height frame: list of (x, y, w, h, pixels, cx, cy)
+        return []
+
+
+def _segment_hit(px, py, dx, dy, ax, ay, bx, by):
+    # Ray parameter t of p + t*d hitting segment a-b, or None
+    ex, ey = bx - ax, by - ay
+    den = dx * ey - dy * ex
+    if den == 0:
+        return None
+    t = ((ax - px) * ey - (ay - py) * ex) / den
+    u = ((ax - px) * dy - (ay - py) * dx) / den
+    if t >= 0 and 0 <= u <= 1:
+        return t
+    return None
+
+
+def _rotate(x, y, k):
+    # Rotate a field point about the centre by k quarter turns clockwise
+    c = FIELD / 2
+    dx, dy = x - c, y - c
+    for _ in range(k % 4):
+        dx, dy = -dy, dx
+    return c + dx, c + dy
+
+
+class TrackWorld(World):
+    # Synthetic WRO field with a kinematic bicycle model of the car
+    def __init__(self, start=(1500.0, 2500.0, 0.0), pillars=(), parking=None, wheelbase=140.0, max_steer=30.0,
+                 max_speed=1800.0, speed_tau=0.15, hfov=70.0, cam_height=110.0, cam_pitch=25.0, cam_range=800.0, tof_range=2000.0,
+                 gyro_bias=0.0, gyro_noise=0.0, tof_noise=0.0, battery_sag=0.0, seed=0):
+        # start: (x, y, yaw) of the car; pillars: (key, x, y) of red "R" / green "G" pillars;
+        # parking: (x, y, dx, dy) centre and unit direction of each 200 mm magenta wall
+        World.__init__(self)
+        self.x, self.y, self.yaw = start  # Car centre in mm and heading in degrees
+        self.speed = 0.0  # Forward speed in mm/s
+        self.rate = 0.0  # True yaw rate in dps
+        self.travel = 0.0  # Signed wheel travel in mm
+        self.wheelbase = wheelbase
+        self.max_steer = max_steer  # Wheel angle at full steering command, degrees
+        self.max_speed = max_speed  # Speed at full drive command, mm/s
+        self.speed_tau = speed_tau  # Drive response time constant, s
+        self.battery_sag = battery_sag  # Fraction of the full-command speed lost per minute as the battery drains
+        self.elapsed = 0.0  # Simulated time in s
+        self.hfov = hfov  # Camera horizontal field of view, degrees
+        self.cam_height = cam_height  # Camera height above the mat, mm
+        self.cam_pitch = cam_pitch  # Camera tilt below horizontal, degrees (horizon near the top rows)
+        self.cam_range = cam_range  # Objects further away are not detected
+        self.tof_range = tof_range  # Reported distance when nothing is in range
+        self.gyro_bias = gyro_bias  # Constant gyro offset in dps
+        self.gyro_noise = gyro_noise  # Gyro white noise standard deviation in dps
+        self.tof_noise = tof_noise  # ToF noise standard deviation in mm
+        self.rng = random.Random(seed)
+        self.wall_contacts = 0  # Physics steps the car was stopped by a wall
+        o, i0, i1 = FIELD, (FIELD - ISLAND) / 2, (FIELD + ISLAND) / 2
+        self.walls = [(0, 0, o, 0), (o, 0, o, o), (o, o, 0, o), (0, o, 0, 0),
+                      (i0, i0, i1, i0), (i1, i0, i1, i1), (i1, i1, i0, i1), (i0, i1, i0, i0)]
+        self.features = []
+        for w, (ax, ay, bx, by) in enumerate(self.walls):
+            # Each wall is one black blob sampled every 50 mm at two heights
+            n = int(math.hypot(bx - ax, by - ay) // 50)
+            self.features.append(Feature("BK", [(ax + (bx - ax) * (j + 0.5) / n, ay + (by - ay) * (j + 0.5) / n, z, 2500.0)
+                                                for j in range(n) for z in (25.0, 75.0)], wall=w))
+        for k in range(4):
+            # Driving counter-clockwise the blue line is crossed first, clockwise the orange one
+            for key, (ex, ey) in (("B", (i1 + 500.0, o)), ("O", (o, i1 + 500.0))):
+                pts = []
+                for j in range(12):
+                    t = (j + 0.5) / 12
+                    pts.append(_rotate(i1 + (ex - i1) * t, i1 + (ey - i1) * t, k) + (0.0, 1000.0))
+                self.features.append(Feature(key, pts))
+        for key, px, py in pillars:
+            self.features.append(Feature(key, [(px, py, 25.0, 2500.0), (px, py, 75.0, 2500.0)]))
+        if parking is not None:
+            # Two magenta walls 200 mm long against a wall, parking bay between them
+            for mx, my, dx, dy in parking:
+                self.features.append(Feature("M", [(mx + dx * t, my + dy * t, z, 2500.0)
+                                                   for t in (-75.0, -25.0, 25.0, 75.0) for z in (25.0, 75.0)]))
+
+    def step(self, dt):
+        self.elapsed += dt
+        target = self.drive * self.max_speed * max(0.0, 1.0 - self.battery_sag * self.elapsed / 60.0)
+        self.speed += (target - self.speed) * min(1.0, dt / self.speed_tau)
+        delta = math.radians(self.steer * self.max_steer)
+        self.rate = math.degrees(self.speed / self.wheelbase * math.tan(delta))
+        self.yaw = (self.yaw + self.rate * dt) % 360
+        a = math.radians(self.yaw)
+        ds = self.speed * dt
+        x = self.x + ds * math.cos(a)
+        y = self.y + ds * math.sin(a)
+        if self._wall_distance(x, y) < 90 and self._wall_distance(x, y) < self._wall_distance(self.x, self.y):
+            self.wall_contacts += 1  # The body touches a wall: the car stalls against it
+            self.speed = 0.0
+            return
+        self.x, self.y = x, y
+        self.travel += ds
+
+    def _wall_distance(self, x, y):
+        best = 1e9
+        for ax, ay, bx, by in self.walls:
+            ex, ey = bx - ax, by - ay
+            t = max(0.0, min(1.0, ((x - ax) * ex + (y - ay) * ey) / (ex * ex + ey * ey)))
+            best = min(best, math.hypot(x - ax - ex * t, y - ay - ey * t))
+        return best
+
+    def yaw_rate(self):
+        noise = self.rng.gauss(0.0, self.gyro_noise) if self.gyro_noise else 0.0
+        return self.rate + self.gyro_bias + noise
+
+    def odometer(self):
+        return self.travel
+
+    def _ray(self, offset_deg, forward=0.0):
+        # Distance from the car along yaw + offset_deg to the nearest wall
+        a = math.radians(self.yaw)
+        px = self.x + forward * math.cos(a)
+        py = self.y + forward * math.sin(a)
+        b = math.radians(self.yaw + offset_deg)
+        dx, dy = math.cos(b), math.sin(b)
+        best = self.tof_range
+        for seg in self.walls:
+            t = _segment_hit(px, py, dx, dy, *seg)
+            if t is not None and t < best:
+                best = t
+        if self.tof_noise:
+            best += self.rng.gauss(0.0, self.tof_noise)
+        return int(max(0, min(self.tof_range, best)))
+
+    def side_tof(self):
+        return self._ray(-90.0), self._ray(90.0)
+
+    def front_tof(self):
+        return self._ray(0.0, forward=80.0)
+
+    def blobs(self, key, roi, width, height):
+        a = math.radians(self.yaw)
+        ca, sa = math.cos(a), math.sin(a)
+        cx0, cy0 = self.x + 60.0 * ca, self.y + 60.0 * sa  # Camera 60 mm ahead of the car centre
+        f = (width / 2) / math.tan(math.radians(self.hfov / 2))
+        cp, sp = math.cos(math.radians(self.cam_pitch)), math.sin(math.radians(self.cam_pitch))
+        rx, ry, rw, rh = roi
+        found = []
+        for feat in self.features:
+            if feat.key != key:
+                continue
+            pixels = 0.0
+            su = sv = 0.0
+            x0 = y0 = 1e9
+            x1 = y1 = -1e9
+            for px, py, pz, area in feat.points:
+                vx, vy = px - cx0, py - cy0
+                fwd = vx * ca + vy * sa  # Ground distance ahead of the camera
+                if fwd < 50 or fwd > self.cam_range:
+                    continue
+                lat = -vx * sa + vy * ca  # Lateral offset, right positive
+                down = self.cam_height - pz
+                d = fwd * cp + down * sp  # Depth along the tilted optical axis
+                u = width / 2 + f * lat / d
+                v = height / 2 + f * (down * cp - fwd * sp) / d
+                if not (rx <= u < rx + rw and ry <= v < ry + rh):
+                    continue
+                if self._occluded(cx0, cy0, vx, vy, feat.wall):
+                    continue
+                p = area * (f / d) ** 2
+                pixels += p
+                su += u * p
+                sv += v * p
+                x0, y0, x1, y1 = min(x0, u), min(y0, v), max(x1, u), max(y1, v)
+            if pixels >= 1:
+                found.append((int(x0), int(y0), int(x1 - x0) + 1, int(y1 - y0) + 1, int(pixels),
+                              int(su / pixels), int(sv / pixels)))
+        return found
+
+    def _occluded(self, px, py, dx, dy, own_wall):
+        # True when a wall other than own_wall cuts the sight line p -> p + d
+        for w, seg in enumerate(self.walls):
+            if w == own_wall:
+                continue
+            t = _segment_hit(px, py, dx, dy, *seg)
+            if t is not None and t < 0.999:
+                return True
+        return False
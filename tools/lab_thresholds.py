@@ -0,0 +1,251 @@
+# lab_thresholds.py
+# Headless LAB threshold solver, the batch counterpart of matlab/ANTi_LabThresholdFinder.m.
+# CPython code, requires NumPy (and Pillow for JPEG/PNG frames; PPM and BMP are read directly).
+# A frame directory holds camera captures (for example from src/tests/button_photo.py, taken under every lighting
+# condition of the venue) and a labels.json with a box list per colour key and frame:
+#     {"image_1.jpg": {"R": [[x, y, w, h]], "G": [[x, y, w, h], [x, y, w, h]], "ignore": [[x, y, w, h]]}}
+# Every frame is quantised to RGB565 like the camera and converted to LAB through a 64K table with the conversion
+# find_blobs uses (lib/colorlut.py), all frames at once. Per colour, the pixels inside its boxes are positives and
+# all other pixels negatives; pixels in other colours' boxes count hard_weight times, and "ignore" boxes not at
+# all. Pixels are weighted so every frame counts the same whatever its size or how large the colour appears in
+# it, so one bright frame cannot outvote the dim ones. The weighted positives and negatives are binned into 3D
+# LAB histograms with summed-area tables, which gives the pixel counts inside any threshold box in constant
+# time. Starting from the 5th-95th percentile box of the positives (what the MATLAB tool's auto threshold does),
+# coordinate ascent moves each of the six bounds to the value with the best F1 score until none moves.
+# The result is printed as the `th` dictionary the scripts use, with recall and false-positive rate overall and
+# for the worst frame.
+#
+# Usage: python tools/lab_thresholds.py frames/ --group OB=O,B --out th.txt
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+L_BINS, A_BINS = 101, 256  # L 0..100, A and B -128..127
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".ppm", ".pnm")
+
+
+def lab_table():
+    # (65536, 3) int16 LAB of every native-order RGB565 value, as colorlut.rgb565_to_lab computes it
+    v = np.arange(65536)
+    rgb = np.stack([((v >> 11) & 0x1F) * 255 + 15, ((v >> 5) & 0x3F) * 255 + 31, (v & 0x1F) * 255 + 15], 1)
+    rgb = rgb // np.array([31, 63, 31])  # 5/6-bit channels expanded to 8 bits with rounding
+    c = rgb / 255.0
+    c = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92) * 100.0
+    xyz = c @ np.array([[0.4124, 0.2126, 0.0193], [0.3576, 0.7152, 0.1192], [0.1805, 0.0722, 0.9505]])
+    t = xyz / np.array([95.047, 100.0, 108.883])
+    f = np.where(t > 0.008856, np.cbrt(t), 7.787 * t + 16.0 / 116.0)
+    lab = np.stack([116.0 * f[:, 1] - 16.0, 500.0 * (f[:, 0] - f[:, 1]), 200.0 * (f[:, 1] - f[:, 2])], 1)
+    return np.rint(lab).astype(np.int16)
+
+
+def load_frame(path):
+    # H x W x 3 uint8 RGB
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        data = f.read()
+    if ext in (".ppm", ".pnm") and data[:2] == b"P6":
+        fields = data.split(maxsplit=4)
+        w, h = int(fields[1]), int(fields[2])
+        return np.frombuffer(fields[4][:w * h * 3], np.uint8).reshape(h, w, 3)
+    if ext == ".bmp" and data[:2] == b"BM" and int.from_bytes(data[30:34], "little") == 0:
+        offset = int.from_bytes(data[10:14], "little")
+        w = int.from_bytes(data[18:22], "little", signed=True)
+        h = int.from_bytes(data[22:26], "little", signed=True)
+        bpp = int.from_bytes(data[28:30], "little") // 8
+        if bpp in (3, 4):
+            stride = (w * bpp + 3) & ~3
+            rows = np.frombuffer(data[offset:offset + stride * abs(h)], np.uint8).reshape(abs(h), stride)
+            img = rows[:, :w * bpp].reshape(abs(h), w, bpp)[:, :, 2::-1]  # BGR(A) -> RGB
+            return np.ascontiguousarray(img[::-1] if h > 0 else img)  # Positive height is stored bottom-up
+    try:
+        from PIL import Image
+    except ImportError:
+        raise SystemExit("%s: reading this format needs Pillow (pip install pillow)" % path)
+    return np.asarray(Image.open(path).convert("RGB"))
+
+
+def frame_lab(rgb, table):
+    # Camera-quantised LAB planes of an RGB frame: (L, A, B) int16 arrays
+    r, g, b = (rgb[:, :, i].astype(np.int32) for i in range(3))
+    lab = table[((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)]
+    return lab[:, :, 0], lab[:, :, 1], lab[:, :, 2]
+
+
+def box_mask(shape, boxes):
+    mask = np.zeros(shape, bool)
+    for x, y, w, h in boxes:
+        mask[max(0, y):max(0, y + h), max(0, x):max(0, x + w)] = True
+    return mask
+
+
+def load_set(directory, table):
+    # [(name, L, A, B, {key: mask}, ignore mask)] for every labelled frame
+    with open(os.path.join(directory, "labels.json")) as f:
+        labels = json.load(f)
+    frames = []
+    for name in sorted(labels):
+        if not name.lower().endswith(IMAGE_EXTS):
+            continue
+        L, A, B = frame_lab(load_frame(os.path.join(directory, name)), table)
+        boxes = labels[name]
+        masks = {key: box_mask(L.shape, v) for key, v in boxes.items() if key != "ignore"}
+        frames.append((name, L, A, B, masks, box_mask(L.shape, boxes.get("ignore", []))))
+    return frames
+
+
+def summed_area(hist):
+    # Zero-padded 3D cumulative sum: box sums in constant time
+    s = np.zeros((L_BINS + 1, A_BINS + 1, A_BINS + 1))
+    s[1:, 1:, 1:] = hist.reshape(L_BINS, A_BINS, A_BINS).cumsum(0).cumsum(1).cumsum(2)
+    return s
+
+
+def box_sum(s, box):
+    # Weighted count inside the inclusive LAB box (l0, l1, a0, a1, b0, b1); bounds may be arrays
+    l0, l1, a0, a1, b0, b1 = box
+    l0, l1 = np.clip(l0, 0, L_BINS - 1), np.clip(l1, 0, L_BINS - 1) + 1
+    a0, a1, b0, b1 = a0 + 128, a1 + 129, b0 + 128, b1 + 129
+    return (s[l1, a1, b1] - s[l0, a1, b1] - s[l1, a0, b1] - s[l1, a1, b0]
+            + s[l0, a0, b1] + s[l0, a1, b0] + s[l1, a0, b0] - s[l0, a0, b0])
+
+
+def histograms(frames, key, hard_weight):
+    # Frame-balanced LAB histograms of the positives and negatives of colour key, in pixels of an average frame
+    n = L_BINS * A_BINS * A_BINS
+    pos, neg = np.zeros(n), np.zeros(n)
+    sizes = [fr[1].size for fr in frames]
+    counts = [(fr[4][key] & ~fr[5]).sum() for fr in frames if key in fr[4]]
+    mean_size = float(sum(sizes)) / len(sizes)
+    mean_pos = float(sum(counts)) / max(1, sum(1 for c in counts if c))
+    for name, L, A, B, masks, ignore in frames:
+        index = (np.clip(L, 0, L_BINS - 1).astype(np.int64) * A_BINS + (A + 128)) * A_BINS + (B + 128)
+        p = masks.get(key, np.zeros(L.shape, bool)) & ~ignore
+        hard = np.zeros(L.shape, bool)
+        for other, m in masks.items():
+            if other != key:
+                hard |= m
+        q = ~p & ~ignore
+        w = np.where(hard, float(hard_weight), 1.0)[q] * (mean_size / L.size)
+        neg += np.bincount(index[q], w, n)
+        if p.any():
+            pos += np.bincount(index[p], minlength=n) * (mean_pos / p.sum())
+    return pos, neg
+
+
+def percentile_box(pos):
+    # 5th-95th percentile of the positives on each axis
+    h = pos.reshape(L_BINS, A_BINS, A_BINS)
+    box = []
+    for axis, offset in ((0, 0), (1, -128), (2, -128)):
+        marginal = h.sum(axis=tuple(i for i in range(3) if i != axis))
+        c = marginal.cumsum() / marginal.sum()
+        box += [int(np.searchsorted(c, 0.05)) + offset, int(np.searchsorted(c, 0.95)) + offset]
+    return box
+
+
+def f1(tp, fp, total):
+    return 2 * tp / np.maximum(2 * tp + fp + (total - tp), 1e-12)
+
+
+def solve(pos, neg, rounds=30):
+    # Coordinate ascent on the six bounds of the F1 score; returns the box
+    sp, sn = summed_area(pos), summed_area(neg)
+    total = pos.sum()
+    box = percentile_box(pos)
+    limits = ((0, 100), (0, 100), (-128, 127), (-128, 127), (-128, 127), (-128, 127))
+    best = f1(box_sum(sp, box), box_sum(sn, box), total)
+    for _ in range(rounds):
+        moved = False
+        for i in range(6):
+            lo, hi = limits[i]
+            # Lower bounds stay at or below their upper bound and vice versa
+            values = np.arange(lo, box[i + 1] + 1) if i % 2 == 0 else np.arange(box[i - 1], hi + 1)
+            trial = [np.full(len(values), v) for v in box]
+            trial[i] = values
+            score = f1(box_sum(sp, trial), box_sum(sn, trial), total)
+            j = int(np.argmax(score))
+            if score[j] > best + 1e-12:
+                best, box[i], moved = score[j], int(values[j]), True
+        if not moved:
+            break
+    return tuple(box)
+
+
+def frame_rates(frames, key, boxes):
+    # Unweighted (recall, false-positive rate) of thresholds boxes over all frames and for the worst frame
+    tp = fp = p_total = q_total = 0
+    worst_tp, worst_fp = 1.0, 0.0
+    for name, L, A, B, masks, ignore in frames:
+        hit = np.zeros(L.shape, bool)
+        for l0, l1, a0, a1, b0, b1 in boxes:
+            hit |= (L >= l0) & (L <= l1) & (A >= a0) & (A <= a1) & (B >= b0) & (B <= b1)
+        p = masks.get(key, np.zeros(L.shape, bool)) & ~ignore
+        q = ~p & ~ignore
+        hp, hq = (hit & p).sum(), (hit & q).sum()
+        tp, fp, p_total, q_total = tp + hp, fp + hq, p_total + p.sum(), q_total + q.sum()
+        if p.any():
+            worst_tp = min(worst_tp, hp / p.sum())
+        worst_fp = max(worst_fp, hq / max(1, q.sum()))
+    return tp / max(1, p_total), worst_tp, fp / max(1, q_total), worst_fp
+
+
+def parse_group(text):
+    # NAME=KEY,KEY: one script colour made of several labelled colours
+    name, keys = text.split("=", 1)
+    return name.strip(), [k.strip() for k in keys.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit find_blobs LAB thresholds to labelled frames")
+    parser.add_argument("directory", help="frames plus labels.json")
+    parser.add_argument("--keys", help="comma-separated colour keys to fit (default: every labelled key)")
+    parser.add_argument("--group", action="append", default=[], type=parse_group, metavar="NAME=KEY,KEY",
+                        help="emit one script colour with a threshold tuple per labelled colour, e.g. OB=O,B")
+    parser.add_argument("--hard-weight", type=float, default=10.0,
+                        help="weight of negatives inside other colours' boxes (default 10)")
+    parser.add_argument("--out", help="also write the th dictionary to this file")
+    args = parser.parse_args(argv)
+    table = lab_table()
+    frames = load_set(args.directory, table)
+    if not frames:
+        print("%s: no labelled frames" % args.directory)
+        return 1
+    labelled = []
+    for fr in frames:
+        labelled += [k for k in fr[4] if k not in labelled]
+    keys = args.keys.split(",") if args.keys else labelled
+    print("%d frames, colours %s" % (len(frames), " ".join(keys)))
+    fitted = {}
+    for key in keys:
+        pos, neg = histograms(frames, key, args.hard_weight)
+        if not pos.any():
+            print("  %s: no labelled pixels" % key)
+            continue
+        box = solve(pos, neg)
+        fitted[key] = box
+        tp, worst_tp, fp, worst_fp = frame_rates(frames, key, [box])
+        print("  %-3s %-28s recall %5.1f %% (worst frame %5.1f %%)  false positives %.3f %% (worst %.3f %%)" % (
+            key, box, 100 * tp, 100 * worst_tp, 100 * fp, 100 * worst_fp))
+    th = {}
+    groups = dict((members[0], (name, members)) for name, members in args.group)
+    grouped = set(k for name, members in args.group for k in members)
+    for key in keys:
+        if key in groups:
+            name, members = groups[key]
+            th[name] = [fitted[k] for k in members if k in fitted]
+        elif key in fitted and key not in grouped:
+            th[key] = [fitted[key]]
+    text = "th = {\n" + ",\n".join('    "%s": [%s]' % (k, ", ".join(str(t) for t in v)) for k, v in th.items()) + "\n}\n"
+    print(text, end="")
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
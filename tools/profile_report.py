@@ -0,0 +1,95 @@
+# profile_report.py
+# Host-side report for the loop timing profiles written by src/lib/profiler.py.
+# CPython code.
+# Reads profile.bin copied from the camera board and prints per-stage duration percentiles, and per-state
+# control loop rate and jitter computed from the start times of consecutive control ticks.
+#
+# Usage: python tools/profile_report.py profile.bin
+
+import argparse
+import json
+import math
+import struct
+import sys
+
+US_WRAP = 1 << 30  # pyb.micros() start times are stored modulo 2**30
+
+
+def load_profile(path):
+    # Returns (header, samples) with samples as a list of (stage, state, start_us, duration_us)
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+        n = header["count"]
+        stage = f.read(n)
+        state = f.read(n)
+        start_us = struct.unpack("<%dI" % n, f.read(4 * n))
+        duration_us = struct.unpack("<%dI" % n, f.read(4 * n))
+    return header, list(zip(stage, state, start_us, duration_us))
+
+
+def percentile(values, p):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return float("nan")
+    rank = max(0, min(len(values) - 1, int(math.ceil(p / 100.0 * len(values))) - 1))
+    return values[rank]
+
+
+def stdev(values):
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / len(values)
+    return math.sqrt(sum((v - mean) ** 2 for v in values) / (len(values) - 1))
+
+
+def stage_table(header, samples):
+    rows = []
+    for stage_id, name in enumerate(header["stages"]):
+        d = sorted(s[3] for s in samples if s[0] == stage_id)
+        if d:
+            rows.append((name, len(d), sum(d) / len(d), percentile(d, 50), percentile(d, 90), percentile(d, 99), d[-1]))
+    return rows
+
+
+def state_table(header, samples, control_stage="control"):
+    # Control tick period statistics per state, from consecutive control samples in the same state
+    control_id = header["stages"].index(control_stage)
+    ticks = [s for s in samples if s[0] == control_id]
+    rows = []
+    for state_id, name in enumerate(header["states"]):
+        periods = []
+        durations = []
+        for prev, cur in zip(ticks, ticks[1:]):
+            if prev[1] == state_id and cur[1] == state_id:
+                periods.append(((cur[2] - prev[2]) % US_WRAP) / 1000.0)
+        durations = sorted(s[3] for s in ticks if s[1] == state_id)
+        if not durations:
+            continue
+        periods.sort()
+        mean_period = sum(periods) / len(periods) if periods else float("nan")
+        rows.append((name, len(durations), 1000.0 / mean_period if periods else float("nan"),
+                     percentile(periods, 50), percentile(periods, 99), stdev(periods),
+                     percentile(durations, 50), percentile(durations, 99)))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage timing report for profile.bin")
+    parser.add_argument("path", help="profile.bin dumped by the camera board")
+    args = parser.parse_args(argv)
+    header, samples = load_profile(args.path)
+    print("%d samples (%d recorded, ring keeps the newest)" % (header["count"], header["total"]))
+    print()
+    print("%-10s %7s %9s %9s %9s %9s %9s   (us)" % ("stage", "count", "mean", "p50", "p90", "p99", "max"))
+    for row in stage_table(header, samples):
+        print("%-10s %7d %9.0f %9d %9d %9d %9d" % row)
+    print()
+    print("%-20s %6s %8s %9s %9s %10s %10s %10s" % ("state", "ticks", "loop Hz", "period50", "period99",
+                                                    "jitter ms", "tick50 us", "tick99 us"))
+    for row in state_table(header, samples):
+        print("%-20s %6d %8.1f %9.2f %9.2f %10.2f %10d %10d" % row)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
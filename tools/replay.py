@@ -0,0 +1,66 @@
+# replay.py
+# Replays recorded runs through open.py or obstacle.py on the host and compares the result with the run.
+# CPython code.
+# Each run directory holds the trace.bin and telemetry.bin copied from the board. The script is replayed with
+# the recorded inputs (hostsim/replay.py), and its replayed telemetry is compared tick by tick with the recorded
+# one: the first tick whose state, speed, camera error or steering differs is reported. Without --set an
+# unchanged script reproduces the run; with --set (or an edited copy of the script) the report shows where and
+# how a gain or threshold change would have changed the run.
+#
+# Usage: python tools/replay.py src/obstacle.py runs/heat1 runs/heat2 --set corner_cd=1500 --out replay_out
+
+import argparse
+import ast
+import os
+import sys
+
+from hostsim.replay import compare_telemetry, replay_script
+from hostsim.sim import script_state
+
+
+def parse_override(text):
+    # NAME=VALUE with VALUE a Python literal
+    name, value = text.split("=", 1)
+    return name.strip(), ast.literal_eval(value.strip())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded runs through a navigation script")
+    parser.add_argument("script", help="src/open.py or src/obstacle.py (or an edited copy)")
+    parser.add_argument("runs", nargs="+", help="directories holding trace.bin and telemetry.bin")
+    parser.add_argument("--set", action="append", default=[], type=parse_override, dest="overrides",
+                        metavar="NAME=VALUE", help="replace a script global before the run starts")
+    parser.add_argument("--out", default="replay_out", help="directory for the replayed logs")
+    parser.add_argument("--steer-tol", type=int, default=1, help="steering difference ignored, in us")
+    args = parser.parse_args(argv)
+    overrides = dict(args.overrides)
+    diverged = 0
+    for run in args.runs:
+        name = os.path.basename(os.path.normpath(run))
+        out_dir = os.path.abspath(os.path.join(args.out, name))
+        replay, sim = replay_script(args.script, os.path.join(run, "trace.bin"), out_dir, overrides)
+        rate = replay.index / sim.wall_s if sim.wall_s else 0.0
+        print("%s: %d/%d ticks in %.2f s (%.0f ticks/s), ended: %s, final state %s" % (
+            name, replay.index, len(replay.records), sim.wall_s, rate, sim.reason, script_state(sim.globals)))
+        if sim.error:
+            print(sim.error)
+        recorded = os.path.join(run, "telemetry.bin")
+        replayed = os.path.join(out_dir, "telemetry.bin")
+        if not os.path.exists(recorded) or not os.path.exists(replayed):
+            print("  no telemetry.bin to compare")
+            continue
+        divergence, n = compare_telemetry(recorded, replayed, args.steer_tol)
+        if divergence is None:
+            print("  identical over %d ticks" % n)
+            continue
+        diverged += 1
+        i, t_ms, field, a, b = divergence
+        states = replay.header["states"]
+        if field == "state":
+            a, b = [states[v] if v < len(states) else "?" for v in (a, b)]
+        print("  first divergence at tick %d (t=%d ms): %s recorded %s, replayed %s" % (i, t_ms, field, a, b))
+    return 1 if diverged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
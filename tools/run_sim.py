@@ -0,0 +1,55 @@
+# run_sim.py
+# Runs open.py or obstacle.py unchanged on the host against the synthetic WRO field.
+# CPython code.
+# The script's pyb/machine/sensor/uasyncio imports resolve to tools/hostsim/board, time is virtual, and the
+# profile.bin / telemetry.bin the script writes land in --out for profile_report.py and telemetry_decode.py.
+# The field is not fitted to the car: use the runs for timing, replay and fault handling, not as lap results.
+#
+# Usage: python tools/run_sim.py src/obstacle.py --pillar R,1500,2300 --pillar G,2500,1200 --out sim_out
+
+import argparse
+import sys
+
+from hostsim import TrackWorld, run_script, script_state
+
+
+def parse_pillar(text):
+    key, x, y = text.split(",")
+    return key, float(x), float(y)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a navigation script in the host simulator")
+    parser.add_argument("script", help="src/open.py or src/obstacle.py")
+    parser.add_argument("--seconds", type=float, default=180.0, help="virtual time limit (default 180)")
+    parser.add_argument("--out", default="sim_out", help="directory for files the script writes")
+    parser.add_argument("--start", default="1500,2500,0", help="car start x,y,yaw in mm/degrees")
+    parser.add_argument("--pillar", action="append", default=[], type=parse_pillar, help="KEY,x,y (R or G)")
+    parser.add_argument("--gyro-bias", type=float, default=0.0, help="gyro offset in dps")
+    parser.add_argument("--gyro-noise", type=float, default=0.0, help="gyro noise sigma in dps")
+    parser.add_argument("--tof-noise", type=float, default=0.0, help="ToF noise sigma in mm")
+    parser.add_argument("--battery-sag", type=float, default=0.0,
+                        help="fraction of the full-command speed lost per minute (default 0)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--slave", default="current", choices=("current", "baseline"),
+                        help="text request timing of the slave firmware (baseline: delay(15) loop of 2a5196f)")
+    args = parser.parse_args(argv)
+    world = TrackWorld(start=tuple(float(v) for v in args.start.split(",")), pillars=args.pillar,
+                       gyro_bias=args.gyro_bias, gyro_noise=args.gyro_noise, tof_noise=args.tof_noise,
+                       battery_sag=args.battery_sag, seed=args.seed)
+    sim = run_script(args.script, world, seconds=args.seconds, out_dir=args.out, slave=args.slave)
+    g = sim.globals
+    t = sim.now_us / 1e6
+    print("ended: %s after %.2f s virtual in %.2f s host (%.1fx real time)" % (sim.reason, t, sim.wall_s,
+                                                                          t / sim.wall_s if sim.wall_s else 0.0))
+    if sim.error:
+        print(sim.error)
+    print("state=%s corners=%s angle=%.1f frames=%d" % (script_state(g), g.get("corner_count"),
+                                                       g.get("angle", 0.0), sim.frames))
+    print("car: x=%.0f y=%.0f yaw=%.1f travel=%.0f mm wall_contacts=%d" % (world.x, world.y, world.yaw,
+                                                                         world.travel, world.wall_contacts))
+    return 0 if sim.reason in ("standby", "finished") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
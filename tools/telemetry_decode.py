@@ -0,0 +1,91 @@
+# telemetry_decode.py
+# Host-side decoder for the run logs written by src/lib/telemetry.py.
+# CPython code, requires NumPy.
+# Loads telemetry.bin copied from the SD card into a NumPy structured array (one row per control tick, one
+# field per recorded quantity) built from the record layout stored in the file header, so the decoder keeps
+# working when fields are added on the robot. A truncated last record (power cut mid-write) is dropped.
+#
+# Usage: python tools/telemetry_decode.py telemetry.bin [--csv run.csv]
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+# struct format character -> NumPy type
+STRUCT_TO_NUMPY = {"b": "i1", "B": "u1", "h": "i2", "H": "u2", "i": "i4", "I": "u4", "l": "i4", "L": "u4",
+                   "q": "i8", "Q": "u8", "f": "f4", "d": "f8"}
+
+
+def record_dtype(header):
+    # NumPy dtype matching the packed little-endian record described by the header
+    fmt = header["format"].lstrip("<")
+    types = []
+    count = ""
+    for c in fmt:
+        if c.isdigit():
+            count += c
+            continue
+        types.extend([STRUCT_TO_NUMPY[c]] * int(count or 1))
+        count = ""
+    dtype = np.dtype([(name, "<" + t) for name, t in zip(header["fields"], types)])
+    if dtype.itemsize != header["record_size"]:
+        raise ValueError("record layout %r does not match record_size %d" % (header["format"], header["record_size"]))
+    return dtype
+
+
+def load_telemetry(path):
+    # Returns (header, records) with records as a structured array, one row per control tick
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+        data = f.read()
+    dtype = record_dtype(header)
+    n = len(data) // dtype.itemsize
+    records = np.frombuffer(data, dtype=dtype, count=n)
+    return header, records
+
+
+def state_names(header, records):
+    # Array of state names aligned with records
+    names = np.array(list(header["states"]) + ["?"] * (256 - len(header["states"])), dtype=object)
+    return names[records["state"]]
+
+
+def segments(records):
+    # (start, stop) row ranges of consecutive records in the same state
+    if len(records) == 0:
+        return []
+    change = np.flatnonzero(np.diff(records["state"].astype(np.int16))) + 1
+    bounds = np.concatenate(([0], change, [len(records)]))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode a telemetry.bin run log")
+    parser.add_argument("path", help="telemetry.bin written by the camera board")
+    parser.add_argument("--csv", help="also write every record to this CSV file")
+    args = parser.parse_args(argv)
+    header, records = load_telemetry(args.path)
+    if len(records) == 0:
+        print("no records")
+        return 1
+    names = state_names(header, records)
+    t = records["t_ms"].astype(np.int64)
+    print("%d records over %.2f s" % (len(records), (t[-1] - t[0]) / 1000.0))
+    print()
+    print("%-20s %8s %8s %7s %9s %9s %8s" % ("state", "t0 s", "dur s", "ticks", "angle0", "angle1", "enc1"))
+    for a, b in segments(records):
+        print("%-20s %8.2f %8.2f %7d %9.1f %9.1f %8.0f" % (names[a], (t[a] - t[0]) / 1000.0, (t[b - 1] - t[a]) / 1000.0,
+                                                         b - a, records["angle"][a], records["angle"][b - 1],
+                                                         records["encoder"][b - 1]))
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write(",".join(("state_name",) + records.dtype.names) + "\n")
+            for name, row in zip(names, records.tolist()):
+                f.write(",".join([name] + [repr(v) for v in row]) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+# vision_bench.py
+# Offline accuracy and cost benchmark of the colour detector over labelled frames.
+# CPython code, requires NumPy (and Pillow for JPEG/PNG frames, see lab_thresholds.py).
+# The frames and labels.json are those of lab_thresholds.py: boxes per colour key mark the ground truth. For each
+# capture setting (frame size plus search region in reference QVGA coordinates) every frame is scaled to the
+# reference 320 x 240, binned down to the setting's frame size as the sensor does, and searched the way
+# ColorDetector._search calls find_blobs: LAB thresholds of the script's th (any tuple matches), 8-connected
+# blobs seeded on the x/y stride grid, blobs under pixels_threshold or area_threshold dropped, overlapping
+# bounding boxes merged, and the largest blob kept. Label boxes are in the pixels of each frame file and are
+# scaled with it. A detection whose centroid lies in a ground-truth box of its colour is a hit; otherwise it is
+# a false positive, and a labelled colour with no hit is a miss. Only boxes whose centre lies in the search
+# region count, and --group OB=O,B lets the O and B labels stand for the script's OB colour. Per setting and
+# colour the report gives precision, recall and the mean centroid error against the box centre in reference
+# pixels, plus the board time per frame from the host simulator's cost model (hostsim DEFAULT_COSTS) and the
+# resulting frame rate.
+#
+# Usage: python tools/vision_bench.py src/obstacle.py frames/ --setting band=QVGA,0,0,316,115 --setting small=QQVGA
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from hostsim.sim import DEFAULT_COSTS, script_literal
+from lab_thresholds import IMAGE_EXTS, lab_table, load_frame, parse_group
+
+REFERENCE = (320, 240)
+FRAME_SCALES = {"QVGA": 1, "QQVGA": 2, "QQQVGA": 4}  # Reference pixels per captured pixel
+DEFAULT_SETTINGS = ("full=QVGA", "band=QVGA,0,0,316,115", "band_qqvga=QQVGA,0,0,316,115")
+
+
+def parse_setting(text):
+    # NAME=FRAMESIZE[,x,y,w,h] with the region in reference coordinates
+    name, spec = text.split("=", 1)
+    parts = spec.split(",")
+    framesize = parts[0].strip().upper()
+    if framesize not in FRAME_SCALES:
+        raise argparse.ArgumentTypeError("frame size must be one of %s" % ", ".join(FRAME_SCALES))
+    roi = tuple(int(v) for v in parts[1:]) if len(parts) > 1 else (0, 0) + REFERENCE
+    if len(roi) != 4:
+        raise argparse.ArgumentTypeError("region is x,y,w,h")
+    return name.strip(), framesize, roi
+
+
+def to_reference(rgb):
+    # Nearest-neighbour resample to the reference frame size
+    h, w = rgb.shape[:2]
+    ys = np.arange(REFERENCE[1]) * h // REFERENCE[1]
+    xs = np.arange(REFERENCE[0]) * w // REFERENCE[0]
+    return rgb[ys][:, xs]
+
+
+def capture(rgb, scale, roi):
+    # Sensor binning to the frame size, then the window of the search region; returns (frame, origin)
+    if scale > 1:
+        h, w = rgb.shape[0] // scale, rgb.shape[1] // scale
+        rgb = rgb[:h * scale, :w * scale].reshape(h, scale, w, scale, 3).mean(axis=(1, 3)).astype(np.uint8)
+    x, y, w, h = roi
+    x0, y0 = x // scale, y // scale
+    return rgb[y0:y0 + (h + scale - 1) // scale, x0:x0 + (w + scale - 1) // scale], (x0 * scale, y0 * scale)
+
+
+def threshold_mask(lab, thresholds):
+    L, A, B = lab
+    mask = np.zeros(L.shape, bool)
+    for t in thresholds:
+        mask |= ((L >= min(t[0], t[1])) & (L <= max(t[0], t[1])) & (A >= min(t[2], t[3])) & (A <= max(t[2], t[3]))
+                 & (B >= min(t[4], t[5])) & (B <= max(t[4], t[5])))
+    return mask
+
+
+def label(mask):
+    # 8-connected component labels (pixel index of a component member, -1 outside) by min-label propagation
+    h, w = mask.shape
+    big = h * w
+    lab = np.where(mask, np.arange(big).reshape(h, w), big)
+    while True:
+        m = lab.copy()
+        p = np.pad(lab, 1, constant_values=big)
+        for dy in (0, 1, 2):
+            for dx in (0, 1, 2):
+                np.minimum(m, p[dy:dy + h, dx:dx + w], out=m)
+        m = np.where(mask, m, big)
+        flat = m.ravel()
+        inside = flat < big
+        flat[inside] = flat[flat[inside]]  # Pointer jumping: follow each label to its own label
+        if np.array_equal(m, lab):
+            return np.where(mask, lab, -1)
+        lab = m
+
+
+def find_blobs(mask, pixels_threshold, area_threshold, x_stride, y_stride):
+    # Largest merged blob as (pixels, cx, cy) in frame pixels, or None
+    labels = label(mask)
+    seeds = labels[::y_stride, ::x_stride]
+    ids = np.unique(seeds[seeds >= 0])  # Components a seed scan on the stride grid reaches
+    blobs = []
+    ys, xs = np.nonzero(labels >= 0)
+    owner = labels[ys, xs]
+    for i in ids:
+        sel = owner == i
+        bx, by = xs[sel], ys[sel]
+        n = len(bx)
+        box = [bx.min(), by.min(), bx.max(), by.max()]
+        if n >= pixels_threshold and (box[2] - box[0] + 1) * (box[3] - box[1] + 1) >= area_threshold:
+            blobs.append([n, bx.sum(), by.sum()] + box)
+    merged = True
+    while merged:  # merge=True: blobs with overlapping bounding boxes become one
+        merged = False
+        for i in range(len(blobs)):
+            for j in range(i + 1, len(blobs)):
+                a, b = blobs[i], blobs[j]
+                if a[3] <= b[5] and b[3] <= a[5] and a[4] <= b[6] and b[4] <= a[6]:
+                    blobs[i] = [a[0] + b[0], a[1] + b[1], a[2] + b[2], min(a[3], b[3]), min(a[4], b[4]),
+                                max(a[5], b[5]), max(a[6], b[6])]
+                    del blobs[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    if not blobs:
+        return None
+    n, sx, sy = max(blobs, key=lambda blob: blob[0])[:3]
+    return n, sx / n, sy / n
+
+
+def board_us(costs, scale, roi, keys, strides):
+    # Modelled camera time of one frame: snapshot of the window plus one find_blobs per colour
+    w, h = (roi[2] + scale - 1) // scale, (roi[3] + scale - 1) // scale
+    us = costs["snapshot"] + costs["snapshot_px"] * w * h
+    for key in keys:
+        xs, ys = strides.get(key, (2, 1))
+        us += costs["find_blobs"] + costs["blobs_px"] * w * h / (xs * ys)
+    return us
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark colour detection accuracy and cost on labelled frames")
+    parser.add_argument("script", help="src/open.py or src/obstacle.py (th dictionary source)")
+    parser.add_argument("directory", help="frames plus labels.json, as for lab_thresholds.py")
+    parser.add_argument("--setting", action="append", type=parse_setting, metavar="NAME=FRAMESIZE[,x,y,w,h]",
+                        help="capture setting (default: %s)" % " ".join(DEFAULT_SETTINGS))
+    parser.add_argument("--stride", action="append", default=[], metavar="KEY=X,Y",
+                        help="find_blobs seed stride of a colour (default 2,1)")
+    parser.add_argument("--group", action="append", default=[], type=parse_group, metavar="NAME=KEY,KEY",
+                        help="labelled colours that are ground truth of one script colour, e.g. OB=O,B")
+    parser.add_argument("--pixels-threshold", type=int, default=200, help="in reference pixels (default 200)")
+    parser.add_argument("--area-threshold", type=int, default=200, help="in reference pixels (default 200)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+    with open(args.script) as f:
+        th = script_literal(f.read(), "th")
+    with open(os.path.join(args.directory, "labels.json")) as f:
+        labels = json.load(f)
+    groups = dict(args.group)
+    settings = args.setting or [parse_setting(s) for s in DEFAULT_SETTINGS]
+    strides = {}
+    for text in args.stride:
+        key, value = text.split("=", 1)
+        strides[key] = tuple(int(v) for v in value.split(","))
+    table = lab_table()
+    names = [n for n in sorted(labels) if n.lower().endswith(IMAGE_EXTS)]
+    frames, factors = [], []
+    for n in names:
+        rgb = load_frame(os.path.join(args.directory, n))
+        frames.append(to_reference(rgb))
+        factors.append((REFERENCE[0] / float(rgb.shape[1]), REFERENCE[1] / float(rgb.shape[0])))  # Labels to reference
+    results = []
+    print("%d frames, colours %s" % (len(frames), " ".join(th)))
+    for name, framesize, roi in settings:
+        scale = FRAME_SCALES[framesize]
+        pixels = max(1, args.pixels_threshold // (scale * scale))
+        area = max(1, args.area_threshold // (scale * scale))
+        stats = dict((key, [0, 0, 0, 0.0]) for key in th)  # hits, false positives, misses, centroid error sum
+        start = time.perf_counter()
+        for fname, rgb, (fx, fy) in zip(names, frames, factors):
+            img, (ox, oy) = capture(rgb, scale, roi)
+            r, g, b = (img[:, :, i].astype(np.int32) for i in range(3))
+            lab = table[((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)]
+            lab = (lab[:, :, 0], lab[:, :, 1], lab[:, :, 2])
+            for key, thresholds in th.items():
+                xs, ys = strides.get(key, (2, 1))
+                found = find_blobs(threshold_mask(lab, thresholds), pixels, area, xs, ys)
+                truth = []
+                boxes = []
+                for member in groups.get(key, [key]):
+                    boxes += labels[fname].get(member, [])
+                for x, y, w, h in boxes:
+                    x, y, w, h = x * fx, y * fy, w * fx, h * fy
+                    cx, cy = x + w / 2.0, y + h / 2.0
+                    if roi[0] <= cx < roi[0] + roi[2] and roi[1] <= cy < roi[1] + roi[3]:
+                        truth.append((x, y, w, h, cx, cy))
+                s = stats[key]
+                hit = None
+                if found is not None:
+                    cx, cy = found[1] * scale + ox, found[2] * scale + oy  # Back to reference coordinates
+                    for x, y, w, h, tx, ty in truth:
+                        if x <= cx < x + w and y <= cy < y + h:
+                            hit = (cx - tx, cy - ty)
+                            break
+                    if hit is None:
+                        s[1] += 1
+                if hit is not None:
+                    s[0] += 1
+                    s[3] += (hit[0] ** 2 + hit[1] ** 2) ** 0.5
+                elif truth:
+                    s[2] += 1
+        host_s = time.perf_counter() - start
+        us = board_us(DEFAULT_COSTS, scale, roi, list(th), strides)
+        print("%s: %s region %s  board %.1f ms/frame (%.0f fps)  host %.0f frames/s" % (
+            name, framesize, roi, us / 1000.0, 1e6 / us, len(frames) / host_s if host_s else 0.0))
+        for key, (hits, fp, misses, err) in stats.items():
+            precision = hits / float(hits + fp) if hits + fp else float("nan")
+            recall = hits / float(hits + misses) if hits + misses else float("nan")
+            print("  %-3s precision %5.1f %%  recall %5.1f %%  centroid error %5.1f px  (%d hits, %d false, %d missed)"
+                  % (key, 100 * precision, 100 * recall, err / hits if hits else float("nan"), hits, fp, misses))
+            results.append({"setting": name, "framesize": framesize, "roi": roi, "key": key, "hits": hits,
+                            "false_positives": fp, "misses": misses, "centroid_error": err / hits if hits else None,
+                            "board_ms": us / 1000.0})
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())